@@ -0,0 +1,372 @@
+"""
+ASGI 服務模式 (Starlette)，提供與 Flask 版相同的 /task、/ticker、/ 路由。
+
+Flask + gunicorn 每個執行緒在整個分析期間 (數據抓取 + Gemini 生成，數秒至數十秒) 都被占用，
+每個 instance 同時能處理的請求數等於執行緒數。此模式下:
+- Gemini 以 google-genai 的 async client (client.aio) 呼叫，等待生成時不占用任何執行緒
+- yfinance / FinMind 等只有同步 API 的函式庫交給有上限的執行緒池 (ASGI_THREAD_LIMIT)
+因此單一 instance 可同時保有數百個進行中的分析。
+
+啟動: uvicorn asgi:app --host 0.0.0.0 --port 8080
+數據抓取、Prompt 構建、分析結果快取等流程與 main.py 共用；
+/task/batch 與 /screen/gold-silver 為長時間的批次作業，仍由 Flask 版提供。
+"""
+import os
+import time
+import asyncio
+import logging
+
+import anyio
+import anyio.to_thread
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import main
+from main import (
+    SOURCE_TIMEOUTS, EMPTY_ANSWER, READY, task_jobs,
+    merge_stock_context, detect_ticker, answer_cache_key, lookup_answer, store_answer, sse_event,
+)
+from utils import gemini_client
+from utils import timing
+from utils import prompt_cache
+from utils import answer_cache
+from utils.job_queue import QueueFullError
+
+# 同步函式庫 (yfinance / FinMind / 檔案讀取) 同時可占用的執行緒數
+THREAD_LIMIT = int(os.environ.get("ASGI_THREAD_LIMIT", "64"))
+_limiter = anyio.CapacityLimiter(THREAD_LIMIT)
+_stats = {"in_flight": 0, "max_in_flight": 0}
+
+# 綁定 Uvicorn Logger (main.py 的共用流程也寫入同一組 handler)
+logger = logging.getLogger("uvicorn.error")
+if logger.handlers:
+    main.app.logger.handlers = logger.handlers
+    main.app.logger.setLevel(logger.level)
+
+
+async def run_blocking(fn, *args, abandon_on_cancel: bool = False):
+    """
+    在執行緒中執行同步函式 (Trace 等 contextvars 會一併帶入)。
+    abandon_on_cancel: 逾時取消時不等待執行緒結束 (執行緒完成後結果直接捨棄)
+    """
+    return await anyio.to_thread.run_sync(fn, *args, limiter=_limiter, abandon_on_cancel=abandon_on_cancel)
+
+
+async def read_json(request):
+    """與 Flask 的 get_json(silent=True) 相同: 無法解析或不是 JSON 物件時回傳 None"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class ServerTimingMiddleware:
+    """
+    每個請求建立一個 Trace (等同 main.py 的 before_request / after_request):
+    回應標頭附上 Server-Timing、總耗時計入直方圖、有分段計時時輸出 JSON 日誌。
+    串流回應的標頭先送出，耗時改於串流結束時記錄 (見 stream_task)。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = timing.start_trace()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if not headers.get("content-type", "").startswith("text/event-stream"):
+                    total_ms = trace.elapsed_ms()
+                    endpoint = getattr(scope.get("endpoint"), "__name__", "not_found")
+                    timing.observe(f"http_{endpoint}", total_ms)
+                    headers.append("Server-Timing", trace.server_timing(total_ms))
+                    if trace.spans:
+                        timing.log_trace(
+                            trace, f"{scope['method']} {scope['path']}", total_ms,
+                            path=scope["path"], status=message["status"], server="asgi",
+                        )
+            await send(message)
+
+        _stats["in_flight"] += 1
+        _stats["max_in_flight"] = max(_stats["max_in_flight"], _stats["in_flight"])
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _stats["in_flight"] -= 1
+
+
+async def fetch_stock_context(ticker: str, bar_dates: dict = None) -> dict:
+    """
+    main.fetch_stock_context 的 async 版本: 三個來源同時在執行緒中抓取，各自逾時 (SOURCE_TIMEOUTS)。
+    逾時的來源列在 "timed_out_sources"，其餘照常合併。
+    """
+    timed_out = []
+    sources = {
+        "daily": main.get_precise_data,
+        "60m": main.get_60m_data,
+        "cb": lambda _: timing.span("cb_mapping")(main.load_cb_mapping)(),
+    }
+
+    async def collect(source):
+        try:
+            return await asyncio.wait_for(
+                run_blocking(sources[source], ticker, abandon_on_cancel=True), SOURCE_TIMEOUTS[source]
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Source '{source}' timed out after {SOURCE_TIMEOUTS[source]}s")
+            timed_out.append(source)
+        except Exception as e:
+            logger.error(f"Source '{source}' failed: {e}")
+        return None
+
+    daily_data, m60_data, cb_mapping = await asyncio.gather(collect("daily"), collect("60m"), collect("cb"))
+
+    if bar_dates is not None:
+        for interval, data in (("1d", daily_data), ("60m", m60_data)):
+            if data and "error" not in data and data.get("date"):
+                bar_dates[interval] = data["date"]
+
+    stock_data_context = merge_stock_context(ticker, daily_data, m60_data, cb_mapping)
+    stock_data_context["timed_out_sources"] = [s for s in sources if s in timed_out]
+    return stock_data_context
+
+
+async def load_question_context(user_question: str, bar_dates: dict = None) -> dict:
+    """由問題中偵測股票代號並抓取數據，抓取失敗時回傳空 context (同 main.load_question_context)"""
+    ticker = detect_ticker(user_question)
+    if not ticker:
+        return {}
+    logger.info(f"Detected Ticker: {ticker}, fetching data...")
+    try:
+        with timing.span("context"):
+            return await fetch_stock_context(ticker, bar_dates)
+    except Exception as e:
+        logger.error(f"Failed to fetch stock data: {e}")
+        return {}
+
+
+async def call_gemini(user_question: str, system_prompt: str, stock_data_context: dict, call):
+    """
+    main.call_gemini 的 async 版本: await call(contents, config)。
+    Prompt 構建可能建立 / 續期 Vertex cached content (同步 API)，因此在執行緒中進行。
+    """
+    contents, config = await run_blocking(
+        main.build_generation_request, user_question, system_prompt, stock_data_context
+    )
+    try:
+        return await call(contents, config)
+    except Exception as e:
+        if not config.cached_content or not prompt_cache.is_cache_error(e):
+            raise
+        logger.warning(f"Cached prompt {config.cached_content} rejected ({e}), retrying inline")
+        prompt_cache.invalidate(config.cached_content)
+        contents, config = await run_blocking(
+            main.build_generation_request, user_question, system_prompt, stock_data_context, False
+        )
+        return await call(contents, config)
+
+
+async def generate_answer(user_question: str, system_prompt: str, stock_data_context: dict, usage: dict = None) -> str:
+    """以 async client 呼叫 Gemini 產生分析 (等待期間不占用執行緒)"""
+    logger.info("Calling Gemini API (async)...")
+    with timing.span("gemini"):
+        response = await call_gemini(
+            user_question, system_prompt, stock_data_context,
+            lambda contents, config: gemini_client.acall_with_client(lambda client: client.aio.models.generate_content(
+                model=main.MODEL_NAME,
+                contents=contents,
+                config=config,
+            )),
+        )
+    prompt_cache.record_usage(response.usage_metadata)
+    if usage is not None:
+        usage.update(answer_cache.usage_from_metadata(response.usage_metadata))
+    return response.text if response.text else EMPTY_ANSWER
+
+
+async def stream_answer(user_question: str, system_prompt: str, stock_data_context: dict, usage: dict = None):
+    """以 async 串流 API 呼叫 Gemini，逐段 yield 生成的文字"""
+    async def open_stream(contents, config):
+        # 取得第一段後才算呼叫成功 (快取失效等錯誤在此拋出，可改用 inline 重試)
+        chunks = await gemini_client.acall_with_client(lambda client: client.aio.models.generate_content_stream(
+            model=main.MODEL_NAME,
+            contents=contents,
+            config=config,
+        ))
+        return await anext(chunks, None), chunks
+
+    logger.info("Calling Gemini streaming API (async)...")
+    with timing.span("gemini"):
+        with timing.span("gemini_first_chunk"):
+            first, chunks = await call_gemini(user_question, system_prompt, stock_data_context, open_stream)
+        usage_metadata = None
+        if first is not None:
+            usage_metadata = getattr(first, "usage_metadata", None)
+            if first.text:
+                yield first.text
+            async for chunk in chunks:
+                usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                if chunk.text:
+                    yield chunk.text
+        prompt_cache.record_usage(usage_metadata)
+        if usage is not None:
+            usage.update(answer_cache.usage_from_metadata(usage_metadata))
+    logger.info("Gemini stream completed.")
+
+
+async def run_task(user_question: str, system_prompt: str, use_cache: bool = True) -> dict:
+    """完整分析流程 (同 main.run_task)，命中分析結果快取時回傳 "cached": true"""
+    bar_dates = {}
+    stock_data_context = await load_question_context(user_question, bar_dates)
+    cache_key = answer_cache_key(user_question, system_prompt, stock_data_context, bar_dates)
+    cached = lookup_answer(cache_key, use_cache)
+    if cached is not None:
+        return {"answer": cached, "cached": True}
+
+    usage = {}
+    started = time.perf_counter()
+    answer = await generate_answer(user_question, system_prompt, stock_data_context, usage=usage)
+    store_answer(cache_key, answer, usage, time.perf_counter() - started)
+    return {"answer": answer}
+
+
+async def stream_task(user_question: str, system_prompt: str, trace: timing.Trace = None, use_cache: bool = True):
+    """SSE 串流 (事件與 main.stream_task 相同: context -> token (多次) -> done，錯誤時 error)"""
+    trace = trace or timing.Trace()
+    with timing.use_trace(trace):
+        yield ": accepted\n\n"
+        try:
+            bar_dates = {}
+            stock_data_context = await load_question_context(user_question, bar_dates)
+            yield sse_event("context", stock_data_context)
+            cache_key = answer_cache_key(user_question, system_prompt, stock_data_context, bar_dates)
+            cached = lookup_answer(cache_key, use_cache)
+            if cached is not None:
+                yield sse_event("token", {"text": cached})
+                yield sse_event("done", {"timings_ms": trace.totals(), "cached": True})
+                return
+
+            parts, usage = [], {}
+            started = time.perf_counter()
+            async for text in stream_answer(user_question, system_prompt, stock_data_context, usage=usage):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            store_answer(cache_key, "".join(parts), usage, time.perf_counter() - started)
+            yield sse_event("done", {"timings_ms": trace.totals()})
+        except Exception as e:
+            logger.error(f"Streaming Task Error: {e}")
+            yield sse_event("error", {"error": str(e)})
+        finally:
+            total_ms = trace.elapsed_ms()
+            timing.observe("http_stream_task", total_ms)
+            timing.log_trace(trace, "POST /task (stream)", total_ms, stream=True, server="asgi")
+
+
+async def ticker_endpoint(request):
+    """透過股票名稱查詢代碼 (Payload 與 Flask 版相同: name / names / prefix)"""
+    try:
+        data = await read_json(request)
+        if data and isinstance(data.get("names"), list):
+            return JSONResponse({"results": await run_blocking(main.get_tickers_by_names, data["names"])})
+
+        if data and "prefix" in data:
+            prefix = data.get("prefix", "")
+            limit = int(data.get("limit", 10))
+            matches = await run_blocking(main.search_tickers_by_prefix, prefix, limit)
+            return JSONResponse({"prefix": prefix, "matches": matches})
+
+        if not data or "name" not in data:
+            return JSONResponse({"error": "Missing 'name' in payload"}, status_code=400)
+
+        name = data.get("name", "")
+        # 清單尚未載入時會下載 (同步)，因此在執行緒中查詢
+        ticker = await run_blocking(main.get_ticker_by_name, name)
+        return JSONResponse({"name": name, "ticker": ticker})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def execute_task(request):
+    """
+    核心分析任務端點 (Payload 與 Flask 版相同)
+    預設回傳 {"answer": ...}；"stream": true 或 Accept: text/event-stream 時以 SSE 串流；
+    "async": true 時回傳 202 與 job_id (背景工作與 Flask 版共用同一個佇列)。
+    """
+    try:
+        data = await read_json(request)
+        if not data:
+            return JSONResponse({"error": "Empty payload"}, status_code=400)
+
+        user_question = data.get("question", "")
+        system_prompt = data.get("system_prompt", "")
+        use_cache = not (data.get("no_cache") or "no-cache" in request.headers.get("cache-control", ""))
+
+        if not user_question:
+            return JSONResponse({"error": "Question is empty"}, status_code=400)
+
+        accept = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+        if data.get("stream") or accept.best == "text/event-stream":
+            return StreamingResponse(
+                stream_task(user_question, system_prompt, timing.current_trace(), use_cache),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        if data.get("async"):
+            try:
+                job_id = task_jobs.submit(
+                    timing.traced(main.run_task, "job_task"), user_question, system_prompt, use_cache
+                )
+            except QueueFullError as e:
+                logger.warning(f"Task rejected: {e}")
+                return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "30"})
+            logger.info(f"Task queued as job {job_id}")
+            return JSONResponse(
+                {"job_id": job_id, "status": "queued", "status_url": f"/task/{job_id}"}, status_code=202
+            )
+
+        return JSONResponse(await run_task(user_question, system_prompt, use_cache))
+
+    except Exception as e:
+        logger.error(f"Task Execution Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def get_task_status(request):
+    body, status = main.job_status(request.path_params["job_id"])
+    return JSONResponse(body, status_code=status)
+
+
+async def metrics_endpoint(request):
+    """與 Flask 版相同的統計，另附 ASGI 的同時請求數與執行緒池使用量"""
+    metrics = main.collect_metrics()
+    metrics["asgi"] = dict(_stats, thread_limit=THREAD_LIMIT, threads_busy=_limiter.borrowed_tokens)
+    return JSONResponse(metrics)
+
+
+async def readiness_endpoint(request):
+    if READY.is_set():
+        return JSONResponse({"ready": True})
+    return JSONResponse({"ready": False}, status_code=503)
+
+
+app = Starlette(middleware=[Middleware(ServerTimingMiddleware)], routes=[
+    Route("/task", execute_task, methods=["POST"]),
+    Route("/task/{job_id}", get_task_status, methods=["GET"]),
+    Route("/ticker", ticker_endpoint, methods=["POST"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
+    Route("/ready", readiness_endpoint, methods=["GET"]),
+    # 回溯相容的舊路徑
+    Route("/", execute_task, methods=["POST"]),
+])
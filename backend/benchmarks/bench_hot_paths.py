@@ -0,0 +1,324 @@
+import os
+import sys
+import io
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import contextlib
+from unittest import mock
+
+# 讓腳本可直接以 python benchmarks/bench_hot_paths.py 執行
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# build_cases 匯入 main 時不啟動背景預熱 (預熱執行緒會在 isolated_environment 結束後繼續連網)
+os.environ.setdefault("WARMUP_ENABLED", "0")
+
+import numpy as np
+import pandas as pd
+from utils import stock_analysis, bar_cache, bar_store, ticker_utils, context_serializer
+from data_modules import cb
+
+# 分析熱路徑的微基準測試 (合成資料，不連網)
+# 用法:
+#   python benchmarks/bench_hot_paths.py --save              # 產生基準線 (baseline.json)
+#   python benchmarks/bench_hot_paths.py --compare           # 與基準線比較，任一項變慢超過門檻時 exit 1
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD = 0.25     # 允許的變慢比例 (25%)
+ROW_SIZES = (250, 1000, 5000)
+STOCK_LIST_SIZE = 3000       # 與全台股清單 (上市櫃 + 興櫃 + ETF) 同量級
+CB_STOCKS = 3000
+
+
+def synthetic_ohlcv(rows: int, seed: int = 0, freq: str = "D") -> pd.DataFrame:
+    """隨機漫步 OHLCV (固定 seed，結果可重現)"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, rows)))
+    open_ = close * (1 + rng.normal(0, 0.005, rows))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.005, rows)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.005, rows)))
+    volume = rng.integers(1_000, 100_000, rows).astype(float)
+    index = pd.date_range("2015-01-05", periods=rows, freq=freq, tz="Asia/Taipei")
+    return pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume}, index=index)
+
+
+def synthetic_stock_info(rows: int = STOCK_LIST_SIZE) -> pd.DataFrame:
+    """合成股票清單 (stock_id / stock_name / type)，名稱為 2~4 個中文字"""
+    rng = np.random.default_rng(1)
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 2000)]
+    names = list(dict.fromkeys(
+        "".join(rng.choice(chars, size=int(rng.integers(2, 5)))) for _ in range(rows * 2)
+    ))[:rows]
+    return pd.DataFrame({
+        "stock_id": [str(1000 + i) for i in range(rows)],
+        "stock_name": names,
+        "type": np.where(np.arange(rows) % 3 == 0, "tpex", "twse"),
+    })
+
+
+def synthetic_cb_frame(stocks: int = CB_STOCKS) -> pd.DataFrame:
+    """發行資料 Excel 的必要欄位 (每檔標的 1~5 檔可轉債)"""
+    rng = np.random.default_rng(2)
+    counts = rng.integers(1, 6, stocks)
+    stock_ids = np.repeat([str(1000 + i) for i in range(stocks)], counts)
+    return pd.DataFrame({
+        "債券代號": [f"{sid}{n}" for n, sid in enumerate(stock_ids)],
+        "標的債券": [f"可轉債{n}" for n in range(len(stock_ids))],
+        "轉換價格": rng.uniform(10, 500, len(stock_ids)).round(2),
+        "轉換標的代碼": stock_ids,
+    })
+
+
+def synthetic_cb_mapping(stocks: int = CB_STOCKS) -> cb.CBMapping:
+    return cb.CBMapping.from_frame(synthetic_cb_frame(stocks))
+
+
+def build_cb_mapping_rowwise(df: pd.DataFrame) -> dict:
+    """舊版逐列建構可轉債對照表 (iterrows + 字串切割)，作為 CBMapping.from_frame 的比較基準"""
+    mapping = {}
+    for _, row in df.iterrows():
+        stock_id = str(row['轉換標的代碼']).strip().split('.')[0]
+        try:
+            price = float(row['轉換價格'])
+        except ValueError:
+            price = 0.0
+        mapping.setdefault(stock_id, []).append({
+            "cb_id": str(row['債券代號']).strip(),
+            "cb_name": str(row['標的債券']).strip(),
+            "conversion_price": price,
+        })
+    return mapping
+
+
+def time_call(fn, repeat: int, number: int) -> dict:
+    """執行 repeat 輪、每輪 number 次，回傳單次呼叫的 min / median 秒數"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+    return {"min": min(samples), "median": statistics.median(samples), "repeat": repeat, "number": number}
+
+
+def build_cases(sizes=ROW_SIZES, scratch_dir: str = None) -> dict:
+    """建立 { 名稱: 無參數函式 }；資料準備不計入時間。scratch_dir 為寫檔項目的暫存目錄"""
+    scratch_dir = scratch_dir or tempfile.gettempdir()
+    cases = {}
+
+    # 1. analyze_stock (patch yfinance，每次清空 K 棒快取以走完整下載 + 分析路徑)
+    for rows in sizes:
+        df = synthetic_ohlcv(rows)
+
+        def run_analyze(df=df):
+            bar_cache.clear()
+            with mock.patch.object(stock_analysis.yf, "Ticker") as ticker:
+                ticker.return_value.history.return_value = df.copy()
+                stock_analysis.analyze_stock("2330", interval="1d")
+        cases[f"analyze_stock[1d,{rows}]"] = run_analyze
+
+    # 1b. 本地 K 棒倉庫: 記憶體映射讀取，以及倉庫已是最新時的 analyze_stock (不連網)
+    for rows in sizes:
+        df = synthetic_ohlcv(rows)
+        df.index = pd.date_range(end=pd.Timestamp.now(bar_store.TZ).normalize(), periods=rows, freq="D")
+        bar_store.write(f"{rows}.TW", "1d", df)
+        cases[f"bar_store.read[1d,{rows}]"] = lambda rows=rows: bar_store.read(f"{rows}.TW", "1d")
+        cases[f"analyze_stock[store,1d,{rows}]"] = (
+            lambda rows=rows: stock_analysis.analyze_stock(str(rows), interval="1d")
+        )
+
+    # 2. 金包銀判讀 (60 分 K，已含均線欄位)
+    for rows in sizes:
+        df = synthetic_ohlcv(rows, freq="h")
+        for w in (5, 10, 20, 60, 120, 240):
+            df[f"MA{w}"] = df["Close"].rolling(w).mean()
+        df["VolMA5"] = df["Volume"].rolling(5).mean()
+        cases[f"check_gold_wrapped_silver[{rows}]"] = lambda df=df: stock_analysis.check_gold_wrapped_silver(df)
+
+    # 3. 可轉債查詢 (大型對照表)
+    mapping = synthetic_cb_mapping()
+    cases["get_cb_info[hit]"] = lambda: cb.get_cb_info("2330", current_price=600.0, mapping=mapping)
+    cases["get_cb_info[miss]"] = lambda: cb.get_cb_info("0000", current_price=600.0, mapping=mapping)
+
+    # 3b. 可轉債對照表建構 + 寫入 + 載入: 舊版逐列建構 + JSON 與欄式建構 + npz
+    cb_frame = synthetic_cb_frame()
+    json_path = os.path.join(scratch_dir, "cb_mapping.json")
+    npz_path = os.path.join(scratch_dir, "cb_mapping.npz")
+
+    def build_rowwise_json():
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(build_cb_mapping_rowwise(cb_frame), f, ensure_ascii=False, indent=2)
+        with open(json_path, encoding="utf-8") as f:
+            json.load(f)
+
+    def build_vectorized_npz():
+        cb.CBMapping.from_frame(cb_frame).save(npz_path)
+        cb.CBMapping.load(npz_path)
+
+    cases["cb_mapping_build[rowwise,json]"] = build_rowwise_json
+    cases["cb_mapping_build[vectorized,npz]"] = build_vectorized_npz
+
+    # 4. 名稱查代號 (全量清單)
+    stock_info = synthetic_stock_info()
+    target = stock_info["stock_name"].iloc[len(stock_info) // 2]
+
+    def lookup(name):
+        ticker_utils.CACHED_STOCK_INFO = stock_info
+        return ticker_utils.get_ticker_by_name(name)
+
+    def build_index():
+        ticker_utils._NAME_INDEX = None
+        lookup(target)
+
+    cases["name_index_build"] = build_index
+    cases["get_ticker_by_name[exact]"] = lambda: lookup(target)
+    cases["get_ticker_by_name[normalized]"] = lambda: lookup(f" {target}-KY ")
+    cases["get_ticker_by_name[miss]"] = lambda: lookup("不存在的股票")
+
+    # 5. execute_task 的 context 序列化 (日線 + 60 分 K + 可轉債)
+    import main
+    with contextlib.redirect_stdout(io.StringIO()):
+        daily = stock_analysis.analyze_dataframe(synthetic_ohlcv(300), "2330.TW", "1d")
+        m60 = stock_analysis.analyze_dataframe(synthetic_ohlcv(300, freq="h"), "2330.TW", "60m")
+    context = main.merge_stock_context("1000", daily, m60, mapping)
+    cases["build_user_input"] = lambda: main.build_user_input("請分析 2330 台積電", context)
+    for encoding in context_serializer.ENCODINGS:
+        cases[f"serialize[{encoding}]"] = lambda encoding=encoding: context_serializer.serialize(context, encoding)
+    cases["serialize[tabular,budget]"] = lambda: context_serializer.serialize(context, "tabular", budget=200)
+
+    return cases
+
+
+@contextlib.contextmanager
+def isolated_environment():
+    """
+    避免 main 匯入時的背景預熱連網下載 (股票清單 / 可轉債對照表)，並隔離全域快取與本地 K 棒倉庫。
+    yield 暫存目錄 (結束時刪除)
+    """
+    saved = (ticker_utils.CACHED_STOCK_INFO, ticker_utils._NAME_INDEX)
+    scratch_dir = tempfile.TemporaryDirectory()
+    patches = [
+        mock.patch.object(bar_store, "STORE_DIR", os.path.join(scratch_dir.name, "bar_store")),
+        mock.patch.object(bar_store, "ENABLED", True),
+        mock.patch.object(ticker_utils, "load_stock_info_snapshot", return_value=False),
+        mock.patch.object(ticker_utils, "is_snapshot_stale", return_value=False),
+        mock.patch.object(cb, "load_cb_mapping", return_value={}),
+        mock.patch.object(stock_analysis, "record_market_suffix"),  # 不寫入後綴索引檔
+    ]
+    for p in patches:
+        p.start()
+    try:
+        yield scratch_dir.name
+    finally:
+        for p in patches:
+            p.stop()
+        ticker_utils.CACHED_STOCK_INFO, ticker_utils._NAME_INDEX = saved
+        bar_cache.clear()
+        bar_store.clear()
+        scratch_dir.cleanup()
+
+
+def run(sizes=ROW_SIZES, repeat: int = 5, number: int = None, only: str = None) -> dict:
+    """執行全部 (或名稱包含 only 的) 基準測試，回傳可寫入 JSON 的結果"""
+    results = {}
+    with isolated_environment() as scratch_dir:
+        cases = build_cases(sizes, scratch_dir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, fn in cases.items():
+                if only and only not in name:
+                    continue
+                fn()  # 暖身 (建立索引、載入模組)
+                if number is None:
+                    # 自動決定每輪次數: 每輪約 50ms
+                    started = time.perf_counter()
+                    fn()
+                    n = max(1, int(0.05 / max(time.perf_counter() - started, 1e-7)))
+                else:
+                    n = number
+                results[name] = time_call(fn, repeat, n)
+    return {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD, metric: str = "min") -> list:
+    """
+    比較兩次結果。
+    Returns:
+        [ { name, baseline, current, change, regressed } ]，change 為 (current / baseline - 1)
+    """
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            rows.append({"name": name, "baseline": None, "current": cur[metric], "change": None, "regressed": False})
+            continue
+        change = cur[metric] / base[metric] - 1 if base[metric] > 0 else 0.0
+        rows.append({
+            "name": name,
+            "baseline": base[metric],
+            "current": cur[metric],
+            "change": change,
+            "regressed": change > threshold,
+        })
+    return rows
+
+
+def format_rows(rows: list) -> str:
+    lines = [f"{'benchmark':<36} {'baseline':>12} {'current':>12} {'change':>9}"]
+    for row in rows:
+        base = f"{row['baseline'] * 1e6:,.1f}us" if row["baseline"] is not None else "-"
+        change = f"{row['change'] * 100:+.1f}%" if row["change"] is not None else "new"
+        flag = "  << REGRESSION" if row["regressed"] else ""
+        lines.append(f"{row['name']:<36} {base:>12} {row['current'] * 1e6:>10,.1f}us {change:>9}{flag}")
+    return "\n".join(lines)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="分析熱路徑微基準測試")
+    parser.add_argument("--save", action="store_true", help="將結果寫入基準線檔案")
+    parser.add_argument("--compare", action="store_true", help="與基準線比較，變慢超過門檻時 exit 1")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允許的變慢比例 (預設 0.25)")
+    parser.add_argument("--metric", choices=["min", "median"], default="min")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="只執行名稱包含此字串的項目")
+    parser.add_argument("--output", help="另存本次結果 JSON")
+    args = parser.parse_args()
+
+    current = run(repeat=args.repeat, only=args.only)
+    for path in filter(None, [args.output, args.baseline if args.save else None]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"結果已儲存至: {path}")
+
+    if not args.compare:
+        print(format_rows(compare({"results": {}}, current, args.threshold, args.metric)))
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("machine") != current["machine"]:
+        print("注意: 基準線來自不同的機器或套件版本，比較結果僅供參考。")
+    rows = compare(baseline, current, args.threshold, args.metric)
+    print(format_rows(rows))
+    regressed = [row["name"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"效能退步超過 {args.threshold:.0%}: {', '.join(regressed)}")
+        return 1
+    print("未發現效能退步。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+# 讓腳本可直接以 python benchmarks/load_compare.py 執行
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+
+# Flask (gunicorn，設定與 Procfile 相同) 與 ASGI (uvicorn) 兩種部署的負載比較。
+# 上游 (yfinance / FinMind / Vertex) 以固定延遲模擬，不連網，比較的是同一台機器上伺服器本身能同時處理的請求數。
+# 用法:
+#   python benchmarks/load_compare.py                              # 預設: 同時 8 / 32 / 128 / 256 個請求
+#   python benchmarks/load_compare.py --concurrency 64 --gemini-ms 5000 --output load.json
+FETCH_MS = 300       # 日線 / 60分K / 可轉債 各自的模擬延遲 (毫秒，三者並行)
+GEMINI_MS = 3000     # Gemini 生成的模擬延遲 (毫秒)
+CONCURRENCY = (8, 32, 128, 256)
+SERVERS = ("flask", "asgi")
+REQUEST_TIMEOUT = 300.0
+# 與 Procfile 相同的 gunicorn 設定
+GUNICORN_OPTIONS = {"workers": 1, "threads": 8, "timeout": 300, "preload_app": True}
+
+
+def simulate_upstream(fetch_ms: float, gemini_ms: float):
+    """
+    以固定延遲取代上游呼叫 (同步來源以 time.sleep，async Gemini 以 asyncio.sleep)，並關閉分析結果快取。
+    須在 import main 之前呼叫 (main 載入時即綁定數據函式並開始預熱)。
+    """
+    from unittest import mock
+    from utils import gemini_client, answer_cache, stock_analysis, ticker_utils
+    from data_modules import cb
+
+    def fetch(ticker):
+        time.sleep(fetch_ms / 1000)
+        return {"stock_id": f"{ticker}.TW", "close": 100.0}
+
+    def load_cb_mapping():
+        time.sleep(fetch_ms / 1000)
+        return {}
+
+    response = mock.Mock(text="模擬分析結果", usage_metadata=None)
+
+    def call_with_client(fn):
+        time.sleep(gemini_ms / 1000)
+        return response
+
+    async def acall_with_client(fn):
+        await asyncio.sleep(gemini_ms / 1000)
+        return response
+
+    stock_analysis.get_precise_data = fetch
+    stock_analysis.get_60m_data = fetch
+    cb.load_cb_mapping = load_cb_mapping
+    # 預熱不下載股票清單
+    ticker_utils.load_stock_info_snapshot = lambda: False
+    ticker_utils.is_snapshot_stale = lambda: False
+    gemini_client.call_with_client = call_with_client
+    gemini_client.acall_with_client = acall_with_client
+    answer_cache.ENABLED = False
+
+
+def serve(server: str, port: int, fetch_ms: float, gemini_ms: float):
+    """啟動模擬上游的伺服器 (由 run 以子行程呼叫)"""
+    os.environ.setdefault("LOG_TIMINGS", "0")
+    simulate_upstream(fetch_ms, gemini_ms)
+    import main
+    main.read_prompt_file = lambda: ("你是專業的投資分析師。", None)
+    if server == "asgi":
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host="127.0.0.1", port=port, log_level="warning")
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class Gunicorn(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"127.0.0.1:{port}")
+            self.cfg.set("loglevel", "warning")
+            for key, value in GUNICORN_OPTIONS.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return main.app
+
+    Gunicorn().run()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url: str, process, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/metrics", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+async def fire(url: str, concurrency: int, requests: int) -> dict:
+    """以固定同時數送出 requests 個 /task 請求，回傳吞吐量與延遲分位數"""
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=REQUEST_TIMEOUT) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/task", json={"question": f"分析 {2330 + i % 50}"})
+                    ok = response.status_code == 200 and "answer" in response.json()
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def quantile(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3) if latencies else None
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_s": quantile(0.50),
+        "p95_s": quantile(0.95),
+        "max_s": round(latencies[-1], 3) if latencies else None,
+        "mean_s": round(statistics.fmean(latencies), 3) if latencies else None,
+    }
+
+
+def run(servers=SERVERS, concurrency=CONCURRENCY, fetch_ms: float = FETCH_MS, gemini_ms: float = GEMINI_MS,
+        rounds: int = 2) -> dict:
+    """
+    依序啟動各伺服器並以各同時數送出 concurrency * rounds 個請求。
+    理想延遲 (不排隊) 約為 fetch_ms + gemini_ms。
+    """
+    report = {"fetch_ms": fetch_ms, "gemini_ms": gemini_ms, "gunicorn": GUNICORN_OPTIONS, "results": {}}
+    for server in servers:
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "serve", server, "--port", str(port),
+             "--fetch-ms", str(fetch_ms), "--gemini-ms", str(gemini_ms)],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_until_up(url, process)
+            report["results"][server] = [
+                asyncio.run(fire(url, c, c * rounds)) for c in concurrency
+            ]
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return report
+
+
+def format_rows(report: dict) -> str:
+    lines = [f"{'server':<7}{'conc':>6}{'req':>6}{'err':>5}{'req/s':>9}{'p50 s':>9}{'p95 s':>9}{'max s':>9}"]
+    for server, rows in report["results"].items():
+        for r in rows:
+            lines.append(
+                f"{server:<7}{r['concurrency']:>6}{r['requests']:>6}{r['errors']:>5}{r['throughput_rps']:>9.2f}"
+                f"{r['p50_s'] or 0:>9.2f}{r['p95_s'] or 0:>9.2f}{r['max_s'] or 0:>9.2f}"
+            )
+    return "\n".join(lines)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Flask (gunicorn) 與 ASGI (uvicorn) 部署的負載比較")
+    sub = parser.add_subparsers(dest="command")
+    serve_parser = sub.add_parser("serve", help="(內部) 啟動模擬上游的伺服器")
+    serve_parser.add_argument("server", choices=SERVERS)
+    serve_parser.add_argument("--port", type=int, required=True)
+    for p in (parser, serve_parser):
+        p.add_argument("--fetch-ms", type=float, default=FETCH_MS, help="每個數據來源的模擬延遲 (毫秒)")
+        p.add_argument("--gemini-ms", type=float, default=GEMINI_MS, help="Gemini 生成的模擬延遲 (毫秒)")
+    parser.add_argument("--concurrency", default=",".join(map(str, CONCURRENCY)), help="以逗號分隔的同時請求數")
+    parser.add_argument("--rounds", type=int, default=2, help="每個同時數送出 concurrency * rounds 個請求")
+    parser.add_argument("--servers", default=",".join(SERVERS))
+    parser.add_argument("--output", help="另存結果 JSON")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.server, args.port, args.fetch_ms, args.gemini_ms)
+        return 0
+
+    report = run(
+        servers=[s for s in args.servers.split(",") if s],
+        concurrency=[int(c) for c in args.concurrency.split(",")],
+        fetch_ms=args.fetch_ms, gemini_ms=args.gemini_ms, rounds=args.rounds,
+    )
+    print(format_rows(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"結果已儲存至: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
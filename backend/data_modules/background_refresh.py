@@ -0,0 +1,98 @@
+import sys
+import time
+import subprocess
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 本機開發時僅使用行程內鎖
+    fcntl = None
+
+
+class ScriptRefresher:
+    """
+    在背景執行資料更新腳本 (Single-Flight)。
+    - 同一 process 內同時只會有一個更新在執行，重複觸發直接略過
+    - 跨 gunicorn worker 以檔案鎖 (flock) 保證只有一個 worker 真正下載
+    - 請求路徑只負責觸發，不等待下載完成
+    - on_finish(name, ok, seconds) 於每次實際執行腳本後呼叫 (例如累計延遲直方圖)
+    """
+
+    def __init__(self, name: str, script_path: str, lock_file: str, on_success=None, timeout: float = 300,
+                 on_finish=None):
+        self.name = name
+        self.script_path = script_path
+        self.lock_file = lock_file
+        self.on_success = on_success
+        self.on_finish = on_finish
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._done.set()
+        self.stats = {
+            "runs": 0,
+            "skipped": 0,
+            "failures": 0,
+            "last_ok": None,
+            "last_duration": None,
+            "last_finished_at": None,
+        }
+
+    @property
+    def running(self) -> bool:
+        return not self._done.is_set()
+
+    def trigger(self) -> bool:
+        """觸發背景更新，已有更新在執行時回傳 False"""
+        with self._lock:
+            if self.running:
+                self.stats["skipped"] += 1
+                return False
+            self._done.clear()
+        threading.Thread(target=self._run, name=f"refresh-{self.name}", daemon=True).start()
+        return True
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待執行中的更新結束 (僅在沒有任何舊資料可用時使用)"""
+        return self._done.wait(timeout)
+
+    def _run_script(self):
+        subprocess.run([sys.executable, self.script_path], check=True, timeout=self.timeout)
+
+    def _run(self):
+        started = time.monotonic()
+        lock_fd = None
+        try:
+            if fcntl is not None:
+                lock_fd = open(self.lock_file, "w")
+                try:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    print(f"[{self.name}] refresh already running in another worker, skipped.")
+                    self.stats["skipped"] += 1
+                    return
+
+            ok = False
+            try:
+                print(f"[{self.name}] background refresh started...")
+                self._run_script()
+                ok = True
+                if self.on_success:
+                    self.on_success()
+                print(f"[{self.name}] background refresh completed in {time.monotonic() - started:.2f}s.")
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"[{self.name}] background refresh failed: {e}")
+            self.stats["runs"] += 1
+            self.stats["last_ok"] = ok
+            self.stats["last_duration"] = round(time.monotonic() - started, 3)
+            self.stats["last_finished_at"] = time.time()
+            if self.on_finish:
+                try:
+                    self.on_finish(self.name, ok, self.stats["last_duration"])
+                except Exception as e:
+                    print(f"[{self.name}] on_finish callback failed: {e}")
+        finally:
+            if lock_fd is not None:
+                lock_fd.close()
+            self._done.set()
@@ -1,58 +1,192 @@
 import json
 import os
-import subprocess
-import sys
+import time
+import threading
 import datetime
 from datetime import date
 
-# 對照表路徑
+import numpy as np
+import pandas as pd
+try:
+    from .background_refresh import ScriptRefresher
+except ImportError:
+    from background_refresh import ScriptRefresher
+from utils.atomic_file import atomic_write
+
+# 對照表路徑 (欄式 npz；cb_mapping_dynamic.json 僅供除錯時匯出)
 BASE_DIR = os.path.dirname(__file__)
-MAPPING_FILE = os.path.join(BASE_DIR, "cb_mapping_dynamic.json")
+MAPPING_FILE = os.path.join(BASE_DIR, "cb_mapping.npz")
+JSON_EXPORT_FILE = os.path.join(BASE_DIR, "cb_mapping_dynamic.json")
 UPDATE_SCRIPT = os.path.abspath(os.path.join(BASE_DIR, "..", "scripts", "update_cb_mapping.py"))
 
-def load_cb_mapping():
+# 發行資料 Excel 的必要欄位: 債券代號、標的債券、轉換價格、轉換標的代碼
+REQUIRED_COLUMNS = ['債券代號', '標的債券', '轉換價格', '轉換標的代碼']
+
+# 檔案變更檢查間隔 (秒)，以及完全沒有對照表時等待首次下載的上限 (秒)
+CHECK_INTERVAL = float(os.environ.get("CB_MAPPING_CHECK_INTERVAL", "60"))
+INITIAL_LOAD_WAIT = float(os.environ.get("CB_MAPPING_INITIAL_WAIT", "30"))
+# 等待其他執行緒載入對照表的上限 (秒)，逾時則沿用記憶體中的舊版
+RELOAD_WAIT = float(os.environ.get("CB_MAPPING_RELOAD_WAIT", "10"))
+
+# 記憶體中的對照表 (整份替換，讀取端不需加鎖)
+_state = {"mapping": None, "mtime": None, "checked_at": float("-inf")}
+_state_lock = threading.Lock()
+_reload_lock = threading.Lock()
+
+class CBMapping:
     """
-    讀取可轉債對照表。
-    若檔案不存在或非今日更新，則執行自動更新腳本。
+    緊湊的 stock_id -> 可轉債清單 對照表。
+    各欄位為依 stock_id 排序的平行陣列，offsets[i]:offsets[i+1] 為 stock_ids[i] 的可轉債範圍。
+    get() 時才組出 dict，介面與原本的 JSON dict 相同。
     """
-    should_update = False
-    
-    if not os.path.exists(MAPPING_FILE):
-        should_update = True
-        print("CB Mapping file not found. Triggering update...")
-    else:
-        # 檢查檔案修改日期
+
+    FIELDS = ("stock_ids", "offsets", "cb_id", "cb_name", "conversion_price")
+
+    def __init__(self, stock_ids, offsets, cb_id, cb_name, conversion_price):
+        self.stock_ids = stock_ids
+        self.offsets = offsets
+        self.cb_id = cb_id
+        self.cb_name = cb_name
+        self.conversion_price = conversion_price
+        self._index = {stock_id: i for i, stock_id in enumerate(stock_ids.tolist())}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "CBMapping":
+        """由發行資料 (REQUIRED_COLUMNS) 向量化建立對照表"""
+        # 轉換標的代碼可能被讀成 float (例如 2330.0)，取小數點前的部分
+        stock_id = df['轉換標的代碼'].astype(str).str.strip().str.split('.').str[0]
+        valid = df['轉換標的代碼'].notna() & (stock_id != '')
+        table = pd.DataFrame({
+            "stock_id": stock_id[valid],
+            "cb_id": df.loc[valid, '債券代號'].astype(str).str.strip(),
+            "cb_name": df.loc[valid, '標的債券'].astype(str).str.strip(),
+            "conversion_price": pd.to_numeric(df.loc[valid, '轉換價格'], errors='coerce').fillna(0.0),
+        })
+        # 穩定排序: 同一檔股票的可轉債維持 Excel 中的順序
+        table = table.sort_values("stock_id", kind="mergesort")
+        stock_ids, starts = np.unique(table["stock_id"].to_numpy(dtype="U"), return_index=True)
+        offsets = np.append(starts, len(table)).astype(np.int64)
+        return cls(
+            stock_ids,
+            offsets,
+            table["cb_id"].to_numpy(dtype="U"),
+            table["cb_name"].to_numpy(dtype="U"),
+            table["conversion_price"].to_numpy(dtype=np.float64),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CBMapping":
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(*(npz[name] for name in cls.FIELDS))
+
+    def save(self, path: str):
+        """寫入 npz (原子寫入，讀取端不會看到寫到一半的檔案)"""
+        with atomic_write(path) as f:
+            np.savez(f, **{name: getattr(self, name) for name in self.FIELDS})
+
+    def get(self, stock_id: str, default=None):
+        i = self._index.get(str(stock_id))
+        if i is None:
+            return default
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return tuple(
+            {"cb_id": cb_id, "cb_name": cb_name, "conversion_price": price}
+            for cb_id, cb_name, price in zip(
+                self.cb_id[start:end].tolist(),
+                self.cb_name[start:end].tolist(),
+                self.conversion_price[start:end].tolist(),
+            )
+        )
+
+    def __contains__(self, stock_id) -> bool:
+        return str(stock_id) in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def total_bonds(self) -> int:
+        return len(self.cb_id)
+
+    def to_dict(self) -> dict:
+        """轉為原本的 JSON 結構: { "stock_id": [ { "cb_id", "cb_name", "conversion_price" } ] }"""
+        return {stock_id: list(self.get(stock_id)) for stock_id in self.stock_ids.tolist()}
+
+    def export_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+def _load_if_changed():
+    try:
         mtime = os.path.getmtime(MAPPING_FILE)
-        file_date = datetime.datetime.fromtimestamp(mtime).date()
-        today = date.today()
-        
-        if file_date < today:
-            should_update = True
-            print(f"CB Mapping file is outdated ({file_date}). Triggering update...")
-
-    if should_update:
-        try:
-            # 呼叫 script 進行更新
-            subprocess.run([sys.executable, UPDATE_SCRIPT], check=True)
-            print("CB Mapping update completed.")
-        except Exception as e:
-            print(f"Failed to update CB mapping: {e}")
-            # 若更新失敗但舊檔案存在，仍嘗試讀取舊檔案 (降級運作)
-            if not os.path.exists(MAPPING_FILE):
-                return {}
-
-    # 讀取 JSON
+    except OSError:
+        return
+    if mtime == _state["mtime"]:
+        return
     try:
-        with open(MAPPING_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        mapping = CBMapping.load(MAPPING_FILE)
     except Exception as e:
-        print(f"Error loading CB mapping JSON: {e}")
-        return {}
+        print(f"Error loading CB mapping: {e}")
+        return
+    # 索引於替換前已建好，不會讓讀取端看到半成品
+    with _state_lock:
+        _state["mapping"] = mapping
+        _state["mtime"] = mtime
+    print(f"CB mapping loaded ({len(mapping)} stocks).")
+
+def _reload_if_changed():
+    """
+    檔案 mtime 改變時重新載入並替換記憶體中的對照表。
+    請求合併: 同時只有一個執行緒讀檔，其他執行緒等待同一次載入完成後 mtime 相同即直接返回
+    """
+    if not _reload_lock.acquire(timeout=RELOAD_WAIT):
+        return
+    try:
+        _load_if_changed()
+    finally:
+        _reload_lock.release()
+
+# 背景更新 (Single-Flight，跨 worker 以檔案鎖保證只下載一次)
+cb_refresher = ScriptRefresher(
+    "cb_mapping", UPDATE_SCRIPT, lock_file=f"{MAPPING_FILE}.lock", on_success=_reload_if_changed
+)
+
+def _is_outdated() -> bool:
+    """檔案不存在或非今日更新"""
+    if not os.path.exists(MAPPING_FILE):
+        return True
+    mtime = os.path.getmtime(MAPPING_FILE)
+    return datetime.datetime.fromtimestamp(mtime).date() < date.today()
+
+def load_cb_mapping():
+    """
+    讀取可轉債對照表 (Stale-While-Revalidate)。
+    - 對照表常駐記憶體，最多每 CHECK_INTERVAL 秒檢查一次檔案是否變更
+    - 檔案不存在或非今日更新時，於背景觸發更新腳本，本次請求仍使用舊版對照表
+    - 只有在完全沒有舊版可用時 (首次部署) 才等待下載，且最多 INITIAL_LOAD_WAIT 秒
+    """
+    now = time.monotonic()
+    if now - _state["checked_at"] >= CHECK_INTERVAL:
+        _state["checked_at"] = now
+        _reload_if_changed()
+        if _is_outdated():
+            if cb_refresher.trigger():
+                print("CB Mapping file is missing or outdated. Background update triggered.")
+    elif _state["mapping"] is None and _reload_lock.locked():
+        # 首次載入進行中: 等待同一次載入，而不是回傳空的對照表
+        _reload_if_changed()
+
+    if _state["mapping"] is None and cb_refresher.running:
+        cb_refresher.wait(INITIAL_LOAD_WAIT)
+        _reload_if_changed()
+
+    return _state["mapping"] or {}
 
-def get_cb_info(stock_id: str, current_price: float = None):
+def get_cb_info(stock_id: str, current_price: float = None, mapping: dict = None):
     """
     獲取可轉債資訊。
-    優先使用本地對照表 (cb_mapping_dynamic.json)。
+    優先使用本地對照表 (cb_mapping.npz)。
+    若呼叫端已預先載入對照表 (例如並行抓取時)，可透過 mapping 傳入以略過讀檔。
     """
     results = {
         "stock_id": stock_id,
@@ -61,10 +195,11 @@ def get_cb_info(stock_id: str, current_price: float = None):
     }
 
     # 1. 載入對照表 (含自動更新判斷)
-    mapping = load_cb_mapping()
+    if mapping is None:
+        mapping = load_cb_mapping()
     
     # 2. 查找該股票的可轉債
-    # JSON 結構: { "stock_id": [ { "cb_id":..., "cb_name":..., "conversion_price":... } ] }
+    # 每筆結構: { "cb_id":..., "cb_name":..., "conversion_price":... }
     cb_data_list = mapping.get(str(stock_id))
     
     if cb_data_list:
@@ -90,6 +225,7 @@ def get_cb_info(stock_id: str, current_price: float = None):
     return results
 
 if __name__ == "__main__":
+    # 於 backend 目錄以 python -m data_modules.cb 執行
     # 測試 (假設目前 4763 股價 110)
     print("Testing CB Info for 1101:")
     print(get_cb_info("1101", 30))
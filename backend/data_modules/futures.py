@@ -1,17 +1,188 @@
 from FinMind.data import DataLoader
+import numpy as np
 import pandas as pd
+import os
+import time
+import threading
 from datetime import datetime, timedelta
 try:
     from . import futures_mapping
+    from .background_refresh import ScriptRefresher
 except ImportError:
     import futures_mapping
+    from background_refresh import ScriptRefresher
+from utils.atomic_file import atomic_write
+
+# 全市場個股期貨每日快照 (欄式 npz: 每個標的一列，只保留成交量最大的合約)
+BASE_DIR = os.path.dirname(__file__)
+SNAPSHOT_FILE = os.path.join(BASE_DIR, "futures_daily_snapshot.npz")
+SNAPSHOT_SCRIPT = os.path.abspath(os.path.join(BASE_DIR, "..", "scripts", "update_futures_snapshot.py"))
+SNAPSHOT_LOOKBACK_DAYS = 5
+
+# 檔案變更檢查間隔 (秒)，以及快照多久未更新就排程背景刷新 (秒，預設 1 天)
+CHECK_INTERVAL = float(os.environ.get("FUTURES_SNAPSHOT_CHECK_INTERVAL", "60"))
+SNAPSHOT_MAX_AGE = float(os.environ.get("FUTURES_SNAPSHOT_MAX_AGE", str(24 * 60 * 60)))
+# 快照載入中時其他請求的等待上限 (秒)
+RELOAD_WAIT = float(os.environ.get("FUTURES_SNAPSHOT_RELOAD_WAIT", "10"))
+
+# 記憶體中的快照 (整份替換，讀取端不需加鎖)
+_snapshot = {"data": None, "index": None, "mtime": None, "checked_at": float("-inf")}
+_snapshot_lock = threading.Lock()
+_reload_lock = threading.Lock()
+
+def select_front_contracts(df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
+    """
+    由全市場期貨日資料挑出每個標的的主力合約 (向量化分組)。
+    篩選邏輯與單檔查詢相同: 最新交易日、收盤價 > 0 優先，再依 Volume DESC, OI DESC。
+    """
+    futures_to_stock = {fid: sid for sid, fid in mapping.items()}
+    df = df[df['futures_id'].isin(futures_to_stock.keys())]
+    if df.empty:
+        return pd.DataFrame(columns=['stock_id', 'futures_id', 'close', 'open_interest', 'volume', 'date'])
+
+    df = df[df['date'] == df['date'].max()].copy()
+    for col in ('volume', 'open_interest', 'close'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df['has_close'] = df['close'] > 0
+
+    df = df.sort_values(
+        by=['futures_id', 'has_close', 'volume', 'open_interest'],
+        ascending=[True, False, False, False],
+        kind='mergesort',
+    ).drop_duplicates('futures_id', keep='first')
+    df['stock_id'] = df['futures_id'].map(futures_to_stock)
+    return df[['stock_id', 'futures_id', 'close', 'open_interest', 'volume', 'date']].reset_index(drop=True)
+
+def download_futures_snapshot(dl: DataLoader = None) -> pd.DataFrame:
+    """
+    一次抓取全市場期貨日資料 (不指定 futures_id)，由今日往前找最近一個有資料的交易日。
+    """
+    mapping = futures_mapping.get_mapping()
+    if not mapping:
+        raise RuntimeError("Futures mapping is not available")
+    dl = dl or DataLoader()
+    for days_ago in range(SNAPSHOT_LOOKBACK_DAYS + 1):
+        day = (datetime.now() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
+        df = dl.taiwan_futures_daily(futures_id='', start_date=day, end_date=day)
+        if df is not None and not df.empty:
+            return select_front_contracts(df, mapping)
+    return select_front_contracts(pd.DataFrame(columns=['futures_id', 'date']), mapping)
+
+def save_futures_snapshot(df: pd.DataFrame, path: str = None):
+    """寫入欄式快照 (原子寫入，讀取端不會看到寫到一半的檔案)"""
+    path = path or SNAPSHOT_FILE
+    with atomic_write(path) as f:
+        np.savez(
+            f,
+            stock_id=df['stock_id'].astype(str).to_numpy(dtype='U'),
+            futures_id=df['futures_id'].astype(str).to_numpy(dtype='U'),
+            close=df['close'].to_numpy(dtype=np.float64),
+            open_interest=df['open_interest'].to_numpy(dtype=np.int64),
+            volume=df['volume'].to_numpy(dtype=np.int64),
+            date=df['date'].astype(str).to_numpy(dtype='U'),
+        )
+
+def _load_if_changed():
+    try:
+        mtime = os.path.getmtime(SNAPSHOT_FILE)
+    except OSError:
+        return
+    if mtime == _snapshot["mtime"]:
+        return
+    try:
+        with np.load(SNAPSHOT_FILE) as npz:
+            data = {name: npz[name] for name in npz.files}
+    except Exception as e:
+        print(f"Error loading futures snapshot: {e}")
+        return
+    index = {stock_id: i for i, stock_id in enumerate(data['stock_id'].tolist())}
+    with _snapshot_lock:
+        _snapshot["data"] = data
+        _snapshot["index"] = index
+        _snapshot["mtime"] = mtime
+    print(f"Futures snapshot loaded ({len(index)} contracts).")
+
+def _reload_snapshot_if_changed():
+    """
+    檔案 mtime 改變時重新載入快照並重建 stock_id -> 列索引。
+    請求合併: 同時只有一個執行緒讀檔，其他執行緒等待同一次載入完成後 mtime 相同即直接返回
+    """
+    if not _reload_lock.acquire(timeout=RELOAD_WAIT):
+        return
+    try:
+        _load_if_changed()
+    finally:
+        _reload_lock.release()
+
+# 背景刷新 (Single-Flight，跨 worker 以檔案鎖保證只下載一次)
+snapshot_refresher = ScriptRefresher(
+    "futures_snapshot", SNAPSHOT_SCRIPT, lock_file=f"{SNAPSHOT_FILE}.lock", on_success=_reload_snapshot_if_changed
+)
+
+def _check_snapshot():
+    """節流檢查快照變更；快照不存在或過舊時排程背景刷新"""
+    now = time.monotonic()
+    if now - _snapshot["checked_at"] < CHECK_INTERVAL:
+        if _snapshot["data"] is None and _reload_lock.locked():
+            # 其他執行緒正在首次載入快照，等待並共用其結果
+            _reload_snapshot_if_changed()
+        return
+    _snapshot["checked_at"] = now
+    _reload_snapshot_if_changed()
+    if not os.path.exists(SNAPSHOT_FILE) or time.time() - os.path.getmtime(SNAPSHOT_FILE) > SNAPSHOT_MAX_AGE:
+        if snapshot_refresher.trigger():
+            print("Futures snapshot is missing or stale. Background refresh scheduled.")
+
+def _row_to_info(data: dict, i: int) -> dict:
+    return {
+        "stock_id": str(data['stock_id'][i]),
+        "futures_id": str(data['futures_id'][i]),
+        "close": float(data['close'][i]),
+        "open_interest": int(data['open_interest'][i]),
+        "date": str(data['date'][i]),
+    }
+
+def get_futures_infos(stock_ids: list, spot_prices: dict = None) -> dict:
+    """
+    批次查詢個股期貨資料 (只讀記憶體中的快照，不發出任何請求)。
+    提供 spot_prices (stock_id -> 現貨價) 時一併計算基差 basis = 期貨 - 現貨 與 basis_pct。
+
+    Returns:
+        stock_id -> 與 get_futures_info 相同格式的 dict，快照中沒有的代號不會出現在結果中
+    """
+    _check_snapshot()
+    data, index = _snapshot["data"], _snapshot["index"]
+    if data is None:
+        return {}
+
+    stock_ids = [str(s) for s in stock_ids]
+    rows = np.array([index.get(s, -1) for s in stock_ids], dtype=np.int64)
+    found = rows >= 0
+    results = {}
+    if spot_prices:
+        spot = np.array([spot_prices.get(s) or np.nan for s in stock_ids], dtype=np.float64)[found]
+        close = data['close'][rows[found]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            basis = close - spot
+            basis_pct = basis / spot * 100
+    for n, i in enumerate(rows[found].tolist()):
+        info = _row_to_info(data, i)
+        if spot_prices and not np.isnan(basis[n]):
+            info["basis"] = round(float(basis[n]), 2)
+            info["basis_pct"] = round(float(basis_pct[n]), 2)
+        results[info["stock_id"]] = info
+    return results
 
 def get_futures_info(stock_id: str):
     """
     透過 FinMind 獲取個股期貨數據 (收盤價與 OI)。
-    使用 static mapping 找出對應期貨代號。
+    優先讀取全市場每日快照 (記憶體查詢)，快照中沒有時才以 static mapping 找出期貨代號即時查詢。
     自動篩選當日交易量最大或近月合約。
     """
+    cached = get_futures_infos([stock_id]).get(str(stock_id))
+    if cached:
+        return cached
+
     results = {
         "stock_id": stock_id,
         "futures_id": None,
@@ -21,47 +192,28 @@ def get_futures_info(stock_id: str):
     }
 
     try:
-        dl = DataLoader()
-        
         # 1. 透過代號查找期貨代號
         futures_id = futures_mapping.get_futures_id(stock_id)
-        
+
         if not futures_id:
              # print(f"No futures found for {stock_id}")
              pass
         else:
+            dl = DataLoader()
+
             # 獲取近五天的資料
-            start_date = (datetime.now() - timedelta(days=5)).strftime("%Y-%m-%d")
-            
+            start_date = (datetime.now() - timedelta(days=SNAPSHOT_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+
             df = dl.taiwan_futures_daily(
                 futures_id=futures_id,
                 start_date=start_date
             )
-            
+
             if not df.empty:
-                # 取得最新日期
-                latest_date = df['date'].max()
-                today_df = df[df['date'] == latest_date].copy()
-                
-                # 資料處理：確保數值型別正確
-                today_df['volume'] = pd.to_numeric(today_df['volume'], errors='coerce').fillna(0)
-                today_df['open_interest'] = pd.to_numeric(today_df['open_interest'], errors='coerce').fillna(0)
-                today_df['close'] = pd.to_numeric(today_df['close'], errors='coerce').fillna(0)
-                
-                # 篩選邏輯：Volume DESC, OI DESC
-                # 先過濾掉收盤價為 0
-                valid_close_df = today_df[today_df['close'] > 0]
-                if not valid_close_df.empty:
-                    today_df = valid_close_df
-
-                today_df = today_df.sort_values(by=['volume', 'open_interest'], ascending=[False, False])
-                
-                target_row = today_df.iloc[0]
-                
-                results["futures_id"] = futures_id
-                results["close"] = float(target_row['close'])
-                results["open_interest"] = int(target_row['open_interest'])
-                results["date"] = target_row['date']
+                front = select_front_contracts(df, {str(stock_id): futures_id})
+                if not front.empty:
+                    results.update(_row_to_info(front.to_dict('list'), 0))
+                    results["stock_id"] = stock_id
 
     except Exception as e:
         print(f"Error fetching Futures data: {e}")
@@ -69,5 +221,6 @@ def get_futures_info(stock_id: str):
     return results
 
 if __name__ == "__main__":
+    # 於 backend 目錄以 python -m data_modules.futures 執行
     # 測試
     print(get_futures_info("1605"))
@@ -1,59 +1,123 @@
 import os
 import json
-import subprocess
-import sys
+import time
+import threading
+try:
+    from .background_refresh import ScriptRefresher
+except ImportError:
+    from background_refresh import ScriptRefresher
 
 CACHE_FILE = "futures_mapping_static.json"
-_HAS_REFRESHED = False  # 單次執行僅限刷新一次的旗標
+BASE_DIR = os.path.dirname(__file__)
+MAPPING_FILE = os.path.join(BASE_DIR, CACHE_FILE)
+UPDATE_SCRIPT = os.path.abspath(os.path.join(BASE_DIR, "..", "scripts", "update_futures_mapping.py"))
 
-def update_mapping_automatically():
-    """自動執行爬蟲腳本以更新對照表"""
-    print("對照表不存在，嘗試自動更新...")
+# 檔案變更檢查間隔 (秒)，以及對照表多久未更新就排程背景刷新 (秒，預設 7 天)
+CHECK_INTERVAL = float(os.environ.get("FUTURES_MAPPING_CHECK_INTERVAL", "60"))
+MAX_AGE = float(os.environ.get("FUTURES_MAPPING_MAX_AGE", str(7 * 24 * 60 * 60)))
+# 對照表重新載入的等待上限 (秒)
+RELOAD_WAIT = float(os.environ.get("FUTURES_MAPPING_RELOAD_WAIT", "10"))
+
+# 記憶體中的對照表 + 負向快取 (已知沒有個股期貨的代號，對照表更新時清空)
+_state = {"mapping": None, "mtime": None, "checked_at": float("-inf")}
+_NEGATIVE_CACHE = set()
+_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_metrics = {"lookups": 0, "hits": 0, "negative_hits": 0}
+
+def _load_if_changed():
     try:
-        base_dir = os.path.dirname(__file__)
-        script_path = os.path.abspath(os.path.join(base_dir, "..", "scripts", "update_futures_mapping.py"))
-        # 使用目前的 Python 解譯器執行
-        subprocess.run([sys.executable, script_path], check=True)
-        print("對照表更新成功。")
-        return True
+        mtime = os.path.getmtime(MAPPING_FILE)
+    except OSError:
+        return
+    if mtime == _state["mtime"]:
+        return
+    try:
+        with open(MAPPING_FILE, 'r', encoding='utf-8') as f:
+            mapping = json.load(f)
     except Exception as e:
-        print(f"自動更新失敗: {e}")
-        return False
+        print(f"Error loading futures mapping: {e}")
+        return
+    with _lock:
+        _state["mapping"] = mapping
+        _state["mtime"] = mtime
+        _NEGATIVE_CACHE.clear()
+    print(f"Futures mapping loaded ({len(mapping)} contracts).")
+
+def _reload_if_changed():
+    """
+    檔案 mtime 改變時重新載入對照表並清空負向快取。
+    請求合併: 同時只有一個執行緒讀檔，其他執行緒等待同一次載入完成後 mtime 相同即直接返回
+    """
+    if not _reload_lock.acquire(timeout=RELOAD_WAIT):
+        return
+    try:
+        _load_if_changed()
+    finally:
+        _reload_lock.release()
+
+# 背景刷新 (Single-Flight，跨 worker 以檔案鎖保證只爬取一次)
+futures_refresher = ScriptRefresher(
+    "futures_mapping", UPDATE_SCRIPT, lock_file=f"{MAPPING_FILE}.lock", on_success=_reload_if_changed
+)
+
+def schedule_refresh() -> bool:
+    """排程背景刷新 (立即返回)，已有刷新在執行時回傳 False"""
+    return futures_refresher.trigger()
+
+def _check_mapping():
+    """節流檢查檔案變更；對照表不存在或過舊時排程背景刷新 (不因查無代號而觸發)"""
+    now = time.monotonic()
+    if now - _state["checked_at"] < CHECK_INTERVAL:
+        if _state["mapping"] is None and _reload_lock.locked():
+            _reload_if_changed()  # 首次載入中，等待後使用同一份對照表
+        return
+    _state["checked_at"] = now
+    _reload_if_changed()
+    if not os.path.exists(MAPPING_FILE) or time.time() - os.path.getmtime(MAPPING_FILE) > MAX_AGE:
+        if schedule_refresh():
+            print("Futures mapping is missing or stale. Background refresh scheduled.")
 
 def get_futures_id(stock_id: str) -> str:
     """
     透過股票代號查詢對應的期貨代號。
-    使用靜態對照表 (futures_mapping_static.json)。
+    使用靜態對照表 (futures_mapping_static.json)，常駐記憶體。
+    查無代號時直接回傳 None 並記入負向快取，不會在請求路徑上觸發刷新。
     """
-    global _HAS_REFRESHED
-    market_file = os.path.join(os.path.dirname(__file__), CACHE_FILE)
-    
-    # 邏輯：讀取 -> 找不到 -> 沒刷過就刷一次 -> 再讀一次
-    def read_mapping():
-        if not os.path.exists(market_file):
-            return None
-        try:
-            with open(market_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading futures mapping: {e}")
-            return None
+    stock_id = str(stock_id)
+    _check_mapping()
 
-    mapping = read_mapping()
-    futures_id = mapping.get(str(stock_id)) if mapping else None
-
-    # 如果沒找到且還沒刷新過，嘗試刷新一次
-    if futures_id is None and not _HAS_REFRESHED:
-        if update_mapping_automatically():
-            _HAS_REFRESHED = True
-            mapping = read_mapping()
-            futures_id = mapping.get(str(stock_id)) if mapping else None
-        
+    with _lock:
+        _metrics["lookups"] += 1
+        if stock_id in _NEGATIVE_CACHE:
+            _metrics["negative_hits"] += 1
+            return None
+        mapping = _state["mapping"]
+        futures_id = mapping.get(stock_id) if mapping else None
+        if futures_id is None:
+            if mapping is not None:
+                _NEGATIVE_CACHE.add(stock_id)
+        else:
+            _metrics["hits"] += 1
     return futures_id
 
+def get_mapping() -> dict:
+    """取得完整的 股票代號 -> 期貨代號 對照表 (供全市場快照等批次作業使用)"""
+    _check_mapping()
+    return dict(_state["mapping"] or {})
+
 def get_futures_id_by_name(stock_name: str) -> str:
     return None
 
+def get_metrics() -> dict:
+    """查詢與背景刷新統計 (刷新結果 last_ok 與耗時 last_duration)"""
+    with _lock:
+        metrics = dict(_metrics)
+        metrics["mapping_size"] = len(_state["mapping"]) if _state["mapping"] else 0
+        metrics["negative_cache_size"] = len(_NEGATIVE_CACHE)
+    metrics["refresh"] = dict(futures_refresher.stats, running=futures_refresher.running)
+    return metrics
+
 if __name__ == "__main__":
     print("Testing map for '2330':", get_futures_id("2330"))
     print("Testing map for '2002':", get_futures_id("2002"))
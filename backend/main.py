@@ -1,16 +1,31 @@
+import time
+BOOT_STARTED = time.monotonic() # 記錄程序啟動時間 (計算冷啟動至第一個請求的耗時)
+
 import os
 import re
 import json
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
-from flask import Flask, request, jsonify
-from google import genai
-from google.genai import types
+from flask import Flask, Response, request, jsonify, g
 from dotenv import load_dotenv
-from google.genai.types import GenerateContentConfig, Tool, GoogleSearch 
-from utils.stock_analysis import get_precise_data, get_60m_data
-from utils.ticker_utils import get_ticker_by_name
+from utils.stock_analysis import get_precise_data, get_60m_data, analyze_stocks
+from utils.ticker_utils import get_ticker_by_name, get_tickers_by_names, search_tickers_by_prefix
+from utils import ticker_utils
 # from data_modules.chips import get_twse_chips # Removed
-from data_modules.cb import get_cb_info
+from data_modules.cb import get_cb_info, load_cb_mapping, cb_refresher
+from data_modules import futures, futures_mapping
+from utils import gemini_client
+from utils import bar_cache
+from utils import bar_store
+from utils import timing
+from utils import prompt_cache
+from utils import answer_cache
+from utils import context_serializer
+from utils.job_queue import JobQueue, QueueFullError
+from utils.screener import screen_gold_silver
 
 # 1. 載入環境變數
 load_dotenv(override=True)
@@ -18,6 +33,31 @@ PROJECT_ID = os.getenv("GCP_PROJECT_ID", "storied-phalanx-239007")
 LOCATION = "us-central1"
 MODEL_NAME = os.environ.get("MODEL_NAME", "gemini-2.0-flash-001") 
 API_SECRET = os.environ.get("API_SECRET")
+gemini_client.configure(project=PROJECT_ID, location=LOCATION)
+
+# 數據抓取設定: 有界執行緒池 + 各來源獨立逾時 (秒)
+DATA_FETCH_WORKERS = int(os.environ.get("DATA_FETCH_WORKERS", "6"))
+SOURCE_TIMEOUTS = {
+    "daily": float(os.environ.get("DAILY_FETCH_TIMEOUT", "20")),
+    "60m": float(os.environ.get("M60_FETCH_TIMEOUT", "20")),
+    "cb": float(os.environ.get("CB_FETCH_TIMEOUT", "10")),
+}
+data_executor = ThreadPoolExecutor(max_workers=DATA_FETCH_WORKERS, thread_name_prefix="data-fetch")
+
+# 批次分析設定: 單次請求檔數上限、整批數據抓取期限 (秒，日線 / 60分K / 可轉債共用同一個期限)、同時進行的 Gemini 呼叫數
+# 串流模式的期限低於 API Gateway 的 60 秒；非同步工作 ("async": true) 不經過 Gateway 等待，使用較長的期限
+BATCH_MAX_TICKERS = int(os.environ.get("BATCH_MAX_TICKERS", "100"))
+BATCH_FETCH_TIMEOUT = float(os.environ.get("BATCH_FETCH_TIMEOUT", "45"))
+BATCH_JOB_FETCH_TIMEOUT = float(os.environ.get("BATCH_JOB_FETCH_TIMEOUT", "240"))
+BATCH_GEMINI_WORKERS = int(os.environ.get("BATCH_GEMINI_WORKERS", "4"))
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_GEMINI_WORKERS, thread_name_prefix="batch-gemini")
+
+# 非同步工作模式: 背景 worker 數、佇列上限 (超過即拒絕)、結果保留秒數
+task_jobs = JobQueue(
+    workers=int(os.environ.get("TASK_JOB_WORKERS", "4")),
+    max_queue=int(os.environ.get("TASK_JOB_QUEUE_SIZE", "20")),
+    result_ttl=float(os.environ.get("TASK_JOB_RESULT_TTL", "3600")),
+)
 
 app = Flask(__name__)
 
@@ -27,41 +67,471 @@ gunicorn_logger = logging.getLogger('gunicorn.error')
 app.logger.handlers = gunicorn_logger.handlers
 app.logger.setLevel(gunicorn_logger.level)
 
-# 應用程式啟動時預熱快取
-print("Warming up stock cache...")
-try:
-    get_ticker_by_name("台積電")
-    print("Stock cache warmed up successfully.")
-except Exception as e:
-    print(f"Warning: Cache warming failed: {e}")
+# 應用程式啟動時於背景預熱快取 (不阻塞 gunicorn 開始服務)
+# 流程: 載入本地股票清單快照 -> 建立名稱索引 -> 載入可轉債對照表 -> 快照過期時於背景重新下載
+# WARMUP_ENABLED=0 時不預熱 (測試與基準測試使用，避免匯入 main 即連網下載)，第一次查詢時再延遲下載
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "1") != "0"
+READY = threading.Event()
+_warmup_state = {"pid": None, "first_request_logged": False}
+_warmup_lock = threading.Lock()
+
+def warm_up():
+    started = time.monotonic()
+    try:
+        if ticker_utils.load_stock_info_snapshot():
+            get_ticker_by_name("台積電") # 建立名稱索引
+            READY.set()
+            print(f"Stock cache warmed up from snapshot in {time.monotonic() - started:.2f}s.")
+        load_cb_mapping() # 載入可轉債對照表至記憶體 (過期時於背景更新)
+        if ticker_utils.is_snapshot_stale():
+            print("Stock info snapshot missing or stale, refreshing from FinMind...")
+            ticker_utils.refresh_stock_info()
+            get_ticker_by_name("台積電")
+            print(f"Stock info refreshed in {time.monotonic() - started:.2f}s.")
+    except Exception as e:
+        print(f"Warning: Cache warming failed: {e}")
+    finally:
+        # 預熱失敗時仍可服務 (查詢時會再延遲下載)
+        READY.set()
+
+def start_warmup():
+    """
+    啟動背景預熱 (每個 process 一次)。
+    gunicorn --preload 時 master 的執行緒不會被 fork 到 worker，因此在 worker 第一個請求時再檢查一次。
+    """
+    if not WARMUP_ENABLED:
+        return
+    with _warmup_lock:
+        if _warmup_state["pid"] == os.getpid():
+            return
+        _warmup_state["pid"] = os.getpid()
+    if READY.is_set():
+        return
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+if WARMUP_ENABLED:
+    print("Warming up stock cache in background...")
+    start_warmup()
+else:
+    READY.set()
+
+@app.before_request
+def log_first_request():
+    start_warmup()
+    if not _warmup_state["first_request_logged"]:
+        _warmup_state["first_request_logged"] = True
+        app.logger.info(f"First request served {time.monotonic() - BOOT_STARTED:.2f}s after process start (ready={READY.is_set()})")
+
+# 可轉債對照表的背景更新 (子行程) 耗時計入直方圖
+cb_refresher.on_finish = lambda name, ok, seconds: timing.observe(f"refresh_{name}", seconds * 1000)
+
+@app.before_request
+def start_request_timing():
+    g.trace = timing.start_trace()
+
+@app.after_request
+def add_server_timing(response):
+    """
+    回傳各階段耗時的 Server-Timing 標頭，並將請求總耗時計入直方圖。
+    有分段計時的請求另輸出一行結構化 JSON 日誌；串流回應的標頭先送出，耗時改於串流結束時記錄 (見 stream_task)。
+    """
+    trace = g.pop("trace", None)
+    if trace is None or response.is_streamed:
+        return response
+    total_ms = trace.elapsed_ms()
+    timing.observe(f"http_{request.endpoint}", total_ms)
+    response.headers["Server-Timing"] = trace.server_timing(total_ms)
+    if trace.spans:
+        timing.log_trace(
+            trace, f"{request.method} {request.path}", total_ms,
+            path=request.path, status=response.status_code,
+        )
+    return response
+
+def collect_metrics() -> dict:
+    """
+    各階段延遲直方圖 (毫秒) 與快取 / 連線統計
+    回傳: { "latency_ms": { span 名稱: { count, avg_ms, p50_ms, p95_ms, p99_ms, max_ms, buckets } }, ... }
+    """
+    return {
+        "latency_ms": timing.get_histograms(),
+        "bar_cache": bar_cache.get_stats(),
+        "bar_store": bar_store.get_stats(),
+        "gemini_client": gemini_client.get_metrics(),
+        "prompt_cache": prompt_cache.get_metrics(),
+        "answer_cache": answer_cache.get_stats(),
+        "context_tokens": context_serializer.get_metrics(),
+        "stock_info_download": ticker_utils.get_download_stats(),
+        "cb_refresh": dict(cb_refresher.stats, running=cb_refresher.running),
+        "futures_mapping": futures_mapping.get_metrics(),
+        "futures_snapshot_refresh": dict(futures.snapshot_refresher.stats, running=futures.snapshot_refresher.running),
+        "task_jobs": task_jobs.stats(),
+    }
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return jsonify(collect_metrics())
+
+@app.route('/ready', methods=['GET'])
+def readiness_endpoint():
+    """就緒檢查: 預熱完成前回傳 503 (可作為 Cloud Run startup probe)"""
+    if READY.is_set():
+        return jsonify({"ready": True})
+    return jsonify({"ready": False}), 503
+
+# System Prompt 檔案 (專案根目錄的 prompt/prompt.txt)，內容快取於記憶體: (mtime_ns, size) -> content
+PROMPT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prompt', 'prompt.txt')
+_prompt_state = {"cached": None}
 
 def read_prompt_file():
     """
-    讀取 prompt.txt
+    讀取 prompt.txt (每次只 stat 檔案，mtime 或大小改變時才重新讀取內容)
     回傳: (content, error_message)
     """
     try:
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        # Go up one level to find prompt folder
-        root_dir = os.path.dirname(base_dir)
-        file_path = os.path.join(root_dir, 'prompt', 'prompt.txt')
-        
-        if not os.path.exists(file_path):
-            return None, "錯誤: 找不到 prompt.txt 檔案"
-            
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read(), None
+        st = os.stat(PROMPT_FILE)
+        key = (st.st_mtime_ns, st.st_size)
+        cached = _prompt_state["cached"]
+        if cached is not None and cached[0] == key:
+            return cached[1], None
+
+        with open(PROMPT_FILE, 'r', encoding='utf-8') as f:
+            content = f.read()
+        _prompt_state["cached"] = (key, content)
+        return content, None
+    except FileNotFoundError:
+        return None, "錯誤: 找不到 prompt.txt 檔案"
     except Exception as e:
         return None, f"讀取 Prompt 發生錯誤: {str(e)}"
 
+def fetch_stock_context(ticker: str, bar_dates: dict = None) -> dict:
+    """
+    並行抓取日線、60分K 與可轉債對照表，並合併為單一 context。
+    每個來源有各自的逾時，逾時的來源會列在 "timed_out_sources"，
+    其餘準時回來的數據照常合併 (Partial Context)。
+    提供 bar_dates 時填入最新一根 K 棒的時間 { "1d": ..., "60m": ... } (分析結果快取的鍵)。
+    """
+    timed_out = []
+    started = time.monotonic()
+
+    # bind: 執行緒池中的分段計時寫入本請求的 Trace
+    source_futures = {
+        "daily": data_executor.submit(timing.bind(get_precise_data), ticker),
+        "60m": data_executor.submit(timing.bind(get_60m_data), ticker),
+        "cb": data_executor.submit(timing.bind(timing.span("cb_mapping")(load_cb_mapping))),
+    }
+
+    def collect(source):
+        # 逾時以同一起點計算，等待其他來源的時間不會延長本來源的期限
+        remaining = started + SOURCE_TIMEOUTS[source] - time.monotonic()
+        try:
+            return source_futures[source].result(timeout=max(remaining, 0))
+        except FutureTimeoutError:
+            app.logger.warning(f"Source '{source}' timed out after {SOURCE_TIMEOUTS[source]}s")
+            timed_out.append(source)
+        except Exception as e:
+            app.logger.error(f"Source '{source}' failed: {e}")
+        return None
+
+    daily_data = collect("daily")
+    m60_data = collect("60m")
+    cb_mapping = collect("cb")
+
+    if bar_dates is not None:
+        for interval, data in (("1d", daily_data), ("60m", m60_data)):
+            if data and "error" not in data and data.get("date"):
+                bar_dates[interval] = data["date"]
+
+    stock_data_context = merge_stock_context(ticker, daily_data, m60_data, cb_mapping)
+    stock_data_context["timed_out_sources"] = timed_out
+    return stock_data_context
+
+def merge_stock_context(ticker: str, daily_data: dict, m60_data: dict, cb_mapping: dict) -> dict:
+    """將日線、60分K 與可轉債數據合併為給 Gemini 的單一 context"""
+    stock_data_context = {}
+
+    # A. 日線數據 (基礎數據)
+    if daily_data and "error" not in daily_data:
+        stock_data_context.update(daily_data)
+
+    # B. 60分K 數據 (提取金包銀策略)
+    # 注意: 我們只提取 'strategy_gold_silver'，避免覆蓋日線的 MA 數值
+    if m60_data and "strategy_gold_silver" in m60_data:
+        stock_data_context["strategy_gold_silver"] = m60_data["strategy_gold_silver"]
+    else:
+        stock_data_context["strategy_gold_silver"] = None
+
+    # C. 可轉債數據 (需要日線現價來計算乖離率)
+    if "close" in stock_data_context and cb_mapping is not None:
+        cb_data = get_cb_info(ticker, stock_data_context["close"], mapping=cb_mapping)
+        if cb_data:
+            stock_data_context.update(cb_data) # 合併 has_cb, cb_list
+        else:
+            stock_data_context["has_cb"] = False
+            stock_data_context["cb_list"] = []
+
+    return stock_data_context
+
+def resolve_system_prompt(system_prompt: str = "") -> str:
+    """讀取 System Prompt (優先使用 Payload，否則讀取檔案)"""
+    if system_prompt:
+        return system_prompt
+    with timing.span("prompt"):
+        file_content, error = read_prompt_file()
+    if error:
+        app.logger.warning(error)
+        return "你是專業的投資分析師，請依據數據進行分析。"
+    return file_content
+
+def build_user_input(user_question: str, stock_data_context: dict) -> str:
+    """
+    構建最終給 Gemini 的輸入內容 (User Prompt)
+    明確標示這是系統自動獲取的 JSON 數據
+    """
+    # 將合併後的數據轉為精簡 JSON (編碼與 token 預算見 utils/context_serializer.py)
+    with timing.span("serialize"):
+        serialized = context_serializer.serialize(stock_data_context)
+    json_input_str = serialized["text"]
+    saved = serialized["baseline_tokens"] - serialized["tokens"]
+    app.logger.info(
+        f"Context serialized as {serialized['encoding']}: ~{serialized['tokens']} tokens "
+        f"(saved ~{saved} vs indented JSON)"
+        + (f", omitted over budget: {', '.join(serialized['omitted'])}" if serialized["omitted"] else "")
+    )
+    return f"""
+{user_question}
+
+---
+### 系統自動獲取數據 (JSON)
+請嚴格依據以下數據進行技術分析與策略判斷：
+```json
+{json_input_str}
+```
+"""
+
+def build_generation_request(user_question: str, system_prompt: str, stock_data_context: dict, use_cache: bool = True):
+    """
+    構建 Prompt，回傳 (contents, config)
+    大型 System Prompt 以 Vertex cached content 引用 (見 utils/prompt_cache.py)，否則 inline 帶入
+    """
+    final_system_prompt = resolve_system_prompt(system_prompt)
+    legend = context_serializer.system_legend()
+    if legend:
+        # 縮寫對照接在 System Prompt 之後 (內容固定，一併以 cached content 快取)
+        final_system_prompt = f"{final_system_prompt}\n\n{legend}"
+    final_user_input = build_user_input(user_question, stock_data_context)
+    config = prompt_cache.build_config(
+        MODEL_NAME,
+        final_system_prompt,
+        tools=[gemini_client.SEARCH_TOOL], # 啟用 Google Search 工具 (對應 Prompt 的基本面聯網要求)
+        use_cache=use_cache,
+        temperature=0.3, # 降低隨機性，讓分析更穩定
+    )
+    return final_user_input, config
+
+def call_gemini(user_question: str, system_prompt: str, stock_data_context: dict, call):
+    """
+    構建請求並執行 call(contents, config)。
+    引用的 cached content 已失效 (被刪除 / 過期) 時捨棄該快取，改以 inline System Prompt 重試一次。
+    """
+    contents, config = build_generation_request(user_question, system_prompt, stock_data_context)
+    try:
+        return call(contents, config)
+    except Exception as e:
+        if not config.cached_content or not prompt_cache.is_cache_error(e):
+            raise
+        app.logger.warning(f"Cached prompt {config.cached_content} rejected ({e}), retrying inline")
+        prompt_cache.invalidate(config.cached_content)
+        contents, config = build_generation_request(user_question, system_prompt, stock_data_context, use_cache=False)
+        return call(contents, config)
+
+# Gemini 沒有回傳文字時的回答 (不寫入分析結果快取)
+EMPTY_ANSWER = "抱歉，分析生成失敗，請稍後再試。"
+
+def generate_answer(user_question: str, system_prompt: str, stock_data_context: dict, usage: dict = None) -> str:
+    """構建 Prompt 並呼叫 Gemini 產生分析 (提供 usage 時填入 prompt / output token 數)"""
+    # --- 生成內容 (共用 Client 與連線池，憑證/連線失效時自動重建) ---
+    app.logger.info("Calling Gemini API...")
+    with timing.span("gemini"):
+        response = call_gemini(
+            user_question, system_prompt, stock_data_context,
+            lambda contents, config: gemini_client.call_with_client(lambda client: client.models.generate_content(
+                model=MODEL_NAME,
+                contents=contents,
+                config=config,
+            )),
+        )
+    prompt_cache.record_usage(response.usage_metadata)
+    if usage is not None:
+        usage.update(answer_cache.usage_from_metadata(response.usage_metadata))
+
+    answer = response.text if response.text else EMPTY_ANSWER
+    metrics = gemini_client.get_metrics()
+    app.logger.info(
+        f"Gemini response received. (client reuses: {metrics['reuses']}, "
+        f"~{metrics['saved_ms_per_request']} ms saved per reuse vs cold construction)"
+    )
+    return answer
+
+def stream_answer(user_question: str, system_prompt: str, stock_data_context: dict, usage: dict = None):
+    """以串流 API 呼叫 Gemini，逐段 yield 生成的文字 (提供 usage 時於串流結束後填入 token 數)"""
+    def open_stream(contents, config):
+        # 取得第一段後才算呼叫成功 (快取失效等錯誤在此拋出，可改用 inline 重試)
+        chunks = iter(gemini_client.call_with_client(lambda client: client.models.generate_content_stream(
+            model=MODEL_NAME,
+            contents=contents,
+            config=config,
+        )))
+        return next(chunks, None), chunks
+
+    app.logger.info("Calling Gemini streaming API...")
+    with timing.span("gemini"):
+        with timing.span("gemini_first_chunk"):
+            first, chunks = call_gemini(user_question, system_prompt, stock_data_context, open_stream)
+        usage_metadata = None
+        if first is not None:
+            for chunk in itertools.chain([first], chunks):
+                usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                if chunk.text:
+                    yield chunk.text
+        prompt_cache.record_usage(usage_metadata)
+        if usage is not None:
+            usage.update(answer_cache.usage_from_metadata(usage_metadata))
+    app.logger.info("Gemini stream completed.")
+
+def detect_ticker(user_question: str):
+    """由問題中偵測 4 碼股票代號，沒有時回傳 None"""
+    match = re.search(r'(\d{4})', user_question)
+    return match.group(1) if match else None
+
+def load_question_context(user_question: str, bar_dates: dict = None) -> dict:
+    """
+    由問題中偵測股票代號並抓取數據。
+    抓取失敗時回傳空 context，讓 AI 根據有限資訊或網路搜尋回答。
+    """
+    # 建立一個空字典，準備將所有來源的數據合併成單一 JSON
+    stock_data_context = {} 
+    ticker = detect_ticker(user_question)
+    
+    if ticker:
+        app.logger.info(f"Detected Ticker: {ticker}, fetching data...")
+        
+        try:
+            with timing.span("context"):
+                stock_data_context = fetch_stock_context(ticker, bar_dates)
+            app.logger.info("Stock data fetched and merged successfully.")
+        except Exception as e:
+            app.logger.error(f"Failed to fetch stock data: {e}")
+    return stock_data_context
+
+def answer_cache_key(user_question: str, system_prompt: str, stock_data_context: dict, bar_dates: dict):
+    """
+    分析結果快取的鍵。只有完整的 context (偵測到代號、日線與 60分K 都有資料、沒有逾時的來源) 才可快取，否則回傳 None。
+    """
+    ticker = detect_ticker(user_question)
+    if not ticker or not bar_dates.get("1d") or not bar_dates.get("60m"):
+        return None
+    if stock_data_context.get("timed_out_sources"):
+        return None
+    return answer_cache.make_key(
+        ticker, user_question, resolve_system_prompt(system_prompt), bar_dates["1d"], bar_dates["60m"]
+    )
+
+def lookup_answer(cache_key, use_cache: bool):
+    """查詢分析結果快取；use_cache=False (前端要求略過) 時只計數不查詢，稍後仍會寫入新的回答"""
+    if cache_key is None:
+        return None
+    if not use_cache or not answer_cache.ENABLED:
+        answer_cache.record_bypass()
+        return None
+    answer = answer_cache.get(cache_key)
+    if answer is not None:
+        app.logger.info("Answer cache hit, Gemini call skipped.")
+    return answer
+
+def store_answer(cache_key, answer: str, usage: dict, generation_seconds: float):
+    if cache_key is not None and answer_cache.ENABLED and answer and answer != EMPTY_ANSWER:
+        answer_cache.put(cache_key, answer, usage, generation_seconds)
+
+def run_task(user_question: str, system_prompt: str, use_cache: bool = True) -> dict:
+    """
+    完整分析流程 (數據抓取 + Gemini)，同步請求與背景工作共用。
+    相同代號 / 問題 / Prompt 且沒有新 K 棒時直接回傳快取的回答 ("cached": true)。
+    """
+    # --- 步驟 1: 數據獲取與合併 (Data Fetching & Merging) ---
+    bar_dates = {}
+    stock_data_context = load_question_context(user_question, bar_dates)
+    cache_key = answer_cache_key(user_question, system_prompt, stock_data_context, bar_dates)
+    cached = lookup_answer(cache_key, use_cache)
+    if cached is not None:
+        return {"answer": cached, "cached": True}
+    
+    # --- 步驟 2: 構建 Prompt 並呼叫 Gemini ---
+    usage = {}
+    started = time.perf_counter()
+    answer = generate_answer(user_question, system_prompt, stock_data_context, usage=usage)
+    store_answer(cache_key, answer, usage, time.perf_counter() - started)
+    return {"answer": answer}
+
+def sse_event(event: str, payload) -> str:
+    """Server-Sent Events 格式"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def stream_task(user_question: str, system_prompt: str, trace: timing.Trace = None, use_cache: bool = True):
+    """
+    串流模式: 先送出 context，再逐段轉送 Gemini 生成的文字。
+    事件順序: context -> token (多次) -> done；發生錯誤時送出 error。
+    done 事件附上各階段耗時 (毫秒)，串流結束時輸出計時日誌。
+    命中分析結果快取時以單一 token 事件送出完整回答，done 事件帶有 "cached": true。
+    """
+    trace = trace or timing.Trace()
+    with timing.use_trace(trace):
+        # 立即送出註解行，讓 Gateway / 前端在抓取數據前就收到第一個位元組
+        yield ": accepted\n\n"
+        try:
+            bar_dates = {}
+            stock_data_context = load_question_context(user_question, bar_dates)
+            yield sse_event("context", stock_data_context)
+            cache_key = answer_cache_key(user_question, system_prompt, stock_data_context, bar_dates)
+            cached = lookup_answer(cache_key, use_cache)
+            if cached is not None:
+                yield sse_event("token", {"text": cached})
+                yield sse_event("done", {"timings_ms": trace.totals(), "cached": True})
+                return
+
+            parts, usage = [], {}
+            started = time.perf_counter()
+            for text in stream_answer(user_question, system_prompt, stock_data_context, usage=usage):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            store_answer(cache_key, "".join(parts), usage, time.perf_counter() - started)
+            yield sse_event("done", {"timings_ms": trace.totals()})
+        except Exception as e:
+            app.logger.error(f"Streaming Task Error: {e}")
+            yield sse_event("error", {"error": str(e)})
+        finally:
+            total_ms = trace.elapsed_ms()
+            timing.observe("http_stream_task", total_ms)
+            timing.log_trace(trace, "POST /task (stream)", total_ms, stream=True)
+
 @app.route('/ticker', methods=['POST'])
 def ticker_endpoint():
     """
     透過股票名稱查詢代碼的 API 端點
     Payload: { "name": "台積電" }
+    批次查詢: { "names": ["台積電", "鴻海"] } -> { "results": { name: ticker } }
+    部分名稱: { "prefix": "台積", "limit": 10 } -> { "matches": [ { "name", "ticker" } ] }
     """
     try:
         data = request.get_json(silent=True)
+        if data and isinstance(data.get("names"), list):
+            return jsonify({"results": get_tickers_by_names(data["names"])})
+
+        if data and "prefix" in data:
+            prefix = data.get("prefix", "")
+            limit = int(data.get("limit", 10))
+            return jsonify({"prefix": prefix, "matches": search_tickers_by_prefix(prefix, limit)})
+
         if not data or "name" not in data:
             return jsonify({"error": "Missing 'name' in payload"}), 400
             
@@ -76,7 +546,9 @@ def ticker_endpoint():
 def execute_task():
     """
     核心分析任務端點
-    執行流程: 接收請求 -> 爬取數據(日線+60分+CB) -> 合併數據 -> Gemini 分析 -> 回傳
+    執行流程: 接收請求 -> 並行爬取數據(日線+60分+CB) -> 合併數據 -> Gemini 分析 -> 回傳
+    預設回傳 {"answer": ...}；"stream": true 時改以 SSE 串流回傳 (見 stream_task)；
+    "async": true 時回傳 202 與 job_id (見 get_task_status)。
     """
     try:
         data = request.get_json(silent=True)
@@ -85,110 +557,204 @@ def execute_task():
 
         user_question = data.get("question", "")
         system_prompt = data.get("system_prompt", "") # 前端可覆蓋 prompt
+        # 略過分析結果快取: payload "no_cache": true 或 Cache-Control: no-cache
+        use_cache = not (data.get("no_cache") or "no-cache" in request.headers.get("Cache-Control", ""))
             
         if not user_question:
             return jsonify({"error": "Question is empty"}), 400
 
-        # --- 步驟 1: 數據獲取與合併 (Data Fetching & Merging) ---
-        # 建立一個空字典，準備將所有來源的數據合併成單一 JSON
-        stock_data_context = {} 
-        match = re.search(r'(\d{4})', user_question)
-        
-        if match:
-            ticker = match.group(1)
-            app.logger.info(f"Detected Ticker: {ticker}, fetching data...")
-            
+        # 串流模式 (SSE): payload "stream": true 或 Accept: text/event-stream
+        if data.get("stream") or request.accept_mimetypes.best == "text/event-stream":
+            return Response(
+                stream_task(user_question, system_prompt, g.get("trace"), use_cache),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        # 非同步模式: 立即回傳 job_id，由背景 worker 執行，前端以 GET /task/<job_id> 查詢
+        if data.get("async"):
             try:
-                # A. 獲取日線數據 (基礎數據)
-                daily_data = get_precise_data(ticker)
-                if daily_data and "error" not in daily_data:
-                    stock_data_context.update(daily_data)
-                
-                # B. 獲取 60分K 數據 (提取金包銀策略)
-                # 注意: 我們只提取 'strategy_gold_silver'，避免覆蓋日線的 MA 數值
-                m60_data = get_60m_data(ticker)
-                if m60_data and "strategy_gold_silver" in m60_data:
-                    stock_data_context["strategy_gold_silver"] = m60_data["strategy_gold_silver"]
-                else:
-                    stock_data_context["strategy_gold_silver"] = None
-                
-                # C. 獲取可轉債數據 (需要日線現價來計算乖離率)
-                if "close" in stock_data_context:
-                    current_price = stock_data_context["close"]
-                    cb_data = get_cb_info(ticker, current_price)
-                    if cb_data:
-                        stock_data_context.update(cb_data) # 合併 has_cb, cb_list
-                    else:
-                        stock_data_context["has_cb"] = False
-                        stock_data_context["cb_list"] = []
-                
-                app.logger.info("Stock data fetched and merged successfully.")
-
-            except Exception as e:
-                app.logger.error(f"Failed to fetch stock data: {e}")
-                # 即使抓取失敗，程式仍繼續執行，讓 AI 根據有限資訊或網路搜尋回答
-        
-        # --- 步驟 2: 構建 Prompt ---
-        # 讀取 System Prompt (優先使用 Payload，否則讀取檔案)
-        final_system_prompt = ""
-        if system_prompt:
-            final_system_prompt = system_prompt
-        else:
-            file_content, error = read_prompt_file()
-            if error:
-                app.logger.warning(error)
-                final_system_prompt = "你是專業的投資分析師，請依據數據進行分析。"
-            else:
-                final_system_prompt = file_content
-        
-        # 將合併後的數據轉為 JSON 字串
-        json_input_str = json.dumps(stock_data_context, ensure_ascii=False, indent=2)
-        
-        # 構建最終給 Gemini 的輸入內容 (User Prompt)
-        # 明確標示這是系統自動獲取的 JSON 數據
-        final_user_input = f"""
-{user_question}
+                job_id = task_jobs.submit(
+                    timing.traced(run_task, "job_task"), user_question, system_prompt, use_cache
+                )
+            except QueueFullError as e:
+                app.logger.warning(f"Task rejected: {e}")
+                return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+            app.logger.info(f"Task queued as job {job_id}")
+            return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/task/{job_id}"}), 202
 
----
-### 系統自動獲取數據 (JSON)
-請嚴格依據以下數據進行技術分析與策略判斷：
-```json
-{json_input_str}
-```
-"""
+        return jsonify(run_task(user_question, system_prompt, use_cache))
 
-        # --- 步驟 3: 初始化 Gemini Client ---
-        app.logger.info(f"Initializing Gemini Client...")
-        client = genai.Client(
-            vertexai=True, 
-            project=PROJECT_ID,
-            location=LOCATION
-        )
+    except Exception as e:
+        app.logger.error(f"Task Execution Error: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        # 啟用 Google Search 工具 (對應 Prompt 的基本面聯網要求)
-        search_tool = Tool(
-            google_search=GoogleSearch() 
-        )
+def job_status(job_id: str):
+    """
+    非同步工作狀態，回傳 (body, HTTP status)
+    body: { "job_id", "status": queued/running/done/failed, "answer" 或 "error" }
+    """
+    job = task_jobs.get(job_id)
+    if job is None:
+        return {"error": "Job not found or expired"}, 404
 
-        # --- 步驟 4: 生成內容 ---
-        app.logger.info("Calling Gemini API...")
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=final_user_input,
-            config=GenerateContentConfig(
-                tools=[search_tool],
-                system_instruction=final_system_prompt,
-                temperature=0.3, # 降低隨機性，讓分析更穩定
+    body = {"job_id": job_id, "status": job["status"]}
+    if job["status"] == "done":
+        body.update(job["result"])
+    elif job["status"] == "failed":
+        body["error"] = job["error"]
+    return body, 200
+
+@app.route('/task/<job_id>', methods=['GET'])
+def get_task_status(job_id):
+    """查詢非同步工作狀態 (見 job_status)"""
+    body, status = job_status(job_id)
+    return jsonify(body), status
+
+def fetch_batch_contexts(tickers: list, timeout: float) -> dict:
+    """
+    以多檔下載取得各檔的 context (日線與 60分K 各一次批次分析 + 可轉債對照表)。
+    三個來源共用同一個期限 (timeout 秒，自開始起算)，逾時拋出 FutureTimeoutError。
+    """
+    started = time.monotonic()
+    daily_future = data_executor.submit(analyze_stocks, tickers, "1d")
+    m60_future = data_executor.submit(analyze_stocks, tickers, "60m")
+    cb_future = data_executor.submit(load_cb_mapping)
+
+    def collect(future):
+        return future.result(timeout=max(started + timeout - time.monotonic(), 0))
+
+    daily_results = collect(daily_future)
+    m60_results = collect(m60_future)
+    cb_mapping = collect(cb_future)
+    return {
+        t: merge_stock_context(t, daily_results.get(t), m60_results.get(t), cb_mapping)
+        for t in tickers
+    }
+
+def iter_batch_results(tickers: list, unresolved: list, question_template: str, system_prompt: str,
+                       fetch_timeout: float):
+    """逐檔產出批次分析結果 (完成一檔產出一檔)；串流與非同步模式共用"""
+    yield from unresolved
+    if not tickers:
+        return
+
+    app.logger.info(f"Batch task: fetching {len(tickers)} tickers...")
+    try:
+        contexts = fetch_batch_contexts(tickers, fetch_timeout)
+    except FutureTimeoutError:
+        app.logger.error(f"Batch data fetch timed out after {fetch_timeout}s")
+        yield {"error": f"Batch data fetch timed out after {fetch_timeout}s"}
+        return
+    except Exception as e:
+        app.logger.error(f"Batch data fetch failed: {e}")
+        yield {"error": f"Batch data fetch failed: {e}"}
+        return
+
+    if not question_template:
+        for t in tickers:
+            yield {"ticker": t, "data": contexts[t]}
+        return
+
+    pending = {
+        batch_executor.submit(
+            generate_answer, question_template.replace("{ticker}", t), system_prompt, contexts[t]
+        ): t
+        for t in tickers
+    }
+    for future in as_completed(pending):
+        t = pending[future]
+        try:
+            yield {"ticker": t, "data": contexts[t], "answer": future.result()}
+        except Exception as e:
+            app.logger.error(f"Batch task for {t} failed: {e}")
+            yield {"ticker": t, "data": contexts[t], "error": str(e)}
+
+def run_batch(tickers: list, unresolved: list, question_template: str, system_prompt: str) -> dict:
+    """非同步批次工作: 全部完成後一次回傳 { "results": [...] }"""
+    return {"results": list(iter_batch_results(
+        tickers, unresolved, question_template, system_prompt, BATCH_JOB_FETCH_TIMEOUT
+    ))}
+
+@app.route('/task/batch', methods=['POST'])
+def execute_batch_task():
+    """
+    投資組合批次分析端點
+    Payload: { "tickers": ["2330", "8299"], "names": ["台積電"], "question": "請分析 {ticker}", "system_prompt": "", "async": false }
+    日線與 60分K 各只發出一次多檔下載，結果以 NDJSON 逐檔串流回傳 (完成一檔送出一檔)。
+    未提供 question 時只回傳各檔的數據 context，不呼叫 Gemini。
+    經由 API Gateway (60 秒上限) 分析多檔時應加上 "async": true: 回傳 202 與 job_id，
+    以 GET /task/<job_id> 取得 { "results": [...] } (各元素與串流模式的每一行相同)。
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Empty payload"}), 400
+
+    tickers = [str(t).strip() for t in data.get("tickers", []) if str(t).strip()]
+    unresolved = []
+    for name, resolved in get_tickers_by_names(data.get("names", [])).items():
+        if resolved.startswith("【"):
+            unresolved.append({"name": name, "error": resolved})
+        else:
+            tickers.append(resolved)
+    # "2330.TW" 統一轉為數字代號，市場後綴交由後綴索引判斷
+    tickers = list(dict.fromkeys(t.split(".")[0] if t.split(".")[0].isdigit() else t for t in tickers))
+
+    if not tickers and not unresolved:
+        return jsonify({"error": "Missing 'tickers' or 'names' in payload"}), 400
+    if len(tickers) > BATCH_MAX_TICKERS:
+        return jsonify({"error": f"Too many tickers (max {BATCH_MAX_TICKERS})"}), 400
+
+    question_template = data.get("question", "")
+    system_prompt = data.get("system_prompt", "")
+
+    if data.get("async"):
+        try:
+            job_id = task_jobs.submit(
+                timing.traced(run_batch, "job_batch"), tickers, unresolved, question_template, system_prompt
             )
-        )
-        
-        answer = response.text if response.text else "抱歉，分析生成失敗，請稍後再試。"
-        app.logger.info("Gemini response received.")
+        except QueueFullError as e:
+            app.logger.warning(f"Batch rejected: {e}")
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+        app.logger.info(f"Batch task ({len(tickers)} tickers) queued as job {job_id}")
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/task/{job_id}"}), 202
+
+    def generate():
+        for item in iter_batch_results(tickers, unresolved, question_template, system_prompt, BATCH_FETCH_TIMEOUT):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
 
-        return jsonify({"answer": answer})
+    return Response(generate(), mimetype="application/x-ndjson")
 
+@app.route('/screen/gold-silver', methods=['POST'])
+def screen_gold_silver_endpoint():
+    """
+    全市場「金包銀」篩選端點 (60分K)
+    Payload (皆為選填): { "tickers": ["2330", "8299"], "status": ["SQUEEZE", "BREAKOUT"], "limit": 50, "async": false }
+    未指定 tickers 時篩選全市場上市櫃普通股，結果依糾結率 (convergence_rate) 由小到大排序。
+    "async": true 時回傳 202 與 job_id (以 GET /task/<job_id> 查詢)。
+    """
+    data = request.get_json(silent=True) or {}
+    tickers = data.get("tickers") or None
+    statuses = data.get("status") or None
+    if isinstance(statuses, str):
+        statuses = [statuses]
+    try:
+        limit = int(data.get("limit", 50))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'limit' must be an integer"}), 400
+
+    if data.get("async"):
+        try:
+            job_id = task_jobs.submit(screen_gold_silver, tickers, statuses, limit)
+        except QueueFullError as e:
+            app.logger.warning(f"Screen rejected: {e}")
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+        return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/task/{job_id}"}), 202
+
+    try:
+        return jsonify(screen_gold_silver(tickers, statuses, limit))
     except Exception as e:
-        app.logger.error(f"Task Execution Error: {e}")
+        app.logger.error(f"Gold-silver screen failed: {e}")
         return jsonify({"error": str(e)}), 500
 
 # 回溯相容或舊路徑轉發 (如果需要)
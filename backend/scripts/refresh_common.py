@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import requests
+from utils.atomic_file import atomic_write_bytes
+
+# 共用的參考資料刷新工具:
+# - 條件式下載 (ETag / Last-Modified)，伺服器回 304 時不傳輸內容
+# - 內容雜湊 (sha256)，伺服器不支援條件式請求時仍可略過未變更的資料
+# - 原子寫入 (utils/atomic_file: 先寫暫存檔再 os.replace)，其他 gunicorn worker 不會讀到寫到一半的檔案
+
+NOT_MODIFIED = "not_modified"  # 304，未傳輸內容
+UNCHANGED = "unchanged"        # 200，但內容雜湊與上次相同
+CHANGED = "changed"
+
+stats = {"requests": 0, "bytes_transferred": 0, "bytes_skipped": 0}
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def atomic_write_json(path: str, obj, **dump_kwargs) -> bool:
+    """
+    以原子寫入輸出 JSON，內容與現有檔案相同時不重寫。
+    Returns:
+        True 表示檔案有更新
+    """
+    dump_kwargs.setdefault("ensure_ascii", False)
+    data = json.dumps(obj, **dump_kwargs).encode("utf-8")
+    return write_if_changed(path, data)
+
+
+def write_if_changed(path: str, data: bytes) -> bool:
+    """內容雜湊與現有檔案相同時只更新 mtime (標記為已確認最新)，否則原子寫入"""
+    try:
+        with open(path, "rb") as f:
+            if sha256(f.read()) == sha256(data):
+                mark_fresh(path)
+                return False
+    except OSError:
+        pass
+    atomic_write_bytes(path, data)
+    return True
+
+
+def mark_fresh(path: str):
+    """來源未變更時更新輸出檔的 mtime，讓讀取端的過期判斷知道資料已確認為最新"""
+    if os.path.exists(path):
+        os.utime(path, None)
+
+
+class FetchResult:
+    """
+    條件式下載結果。
+    status 為 CHANGED 時 content 為新內容；呼叫端成功寫入輸出後需呼叫 commit() 保存驗證資訊，
+    避免寫入失敗後下次被誤判為未變更。
+    """
+
+    def __init__(self, status: str, content: bytes, state_file: str, state: dict):
+        self.status = status
+        self.content = content
+        self._state_file = state_file
+        self._state = state
+
+    @property
+    def changed(self) -> bool:
+        return self.status == CHANGED
+
+    def commit(self):
+        atomic_write_json(self._state_file, self._state, indent=2)
+
+
+def _load_state(state_file: str, url: str) -> dict:
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if state.get("url") == url else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def conditional_get(url: str, state_file: str, force: bool = False, session=None, **kwargs) -> FetchResult:
+    """
+    以上次保存的 ETag / Last-Modified 發出條件式請求，並比對內容雜湊。
+
+    Args:
+        url: 下載網址
+        state_file: 保存 ETag / Last-Modified / sha256 的 JSON 檔 (通常放在輸出檔旁)
+        force: 忽略已保存的驗證資訊 (輸出檔遺失時使用)
+        session: requests.Session (可重用連線)
+        **kwargs: 傳給 requests.get 的參數 (timeout, verify 等)
+
+    Raises:
+        requests.HTTPError: 非 200 / 304 的回應
+    """
+    state = {} if force else _load_state(state_file, url)
+    headers = dict(kwargs.pop("headers", None) or {})
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    kwargs.setdefault("timeout", 60)
+
+    resp = (session or requests).get(url, headers=headers, **kwargs)
+    stats["requests"] += 1
+
+    if resp.status_code == 304 and state:
+        stats["bytes_skipped"] += state.get("size", 0)
+        return FetchResult(NOT_MODIFIED, None, state_file, state)
+    resp.raise_for_status()
+
+    content = resp.content
+    stats["bytes_transferred"] += len(content)
+    new_state = {
+        "url": url,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "sha256": sha256(content),
+        "size": len(content),
+    }
+    if state.get("sha256") != new_state["sha256"]:
+        return FetchResult(CHANGED, content, state_file, new_state)
+    # 內容相同: 只更新驗證資訊 (伺服器可能換了 ETag)
+    result = FetchResult(UNCHANGED, content, state_file, new_state)
+    result.commit()
+    return result
+
+
+def report(name: str) -> str:
+    """傳輸 / 略過位元組數摘要"""
+    return (
+        f"[{name}] requests={stats['requests']} "
+        f"bytes_transferred={stats['bytes_transferred']} bytes_skipped={stats['bytes_skipped']}"
+    )
+
+
+def reset_stats():
+    for key in stats:
+        stats[key] = 0
@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# 讓腳本可直接以 python scripts/run_backtest.py 執行
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pandas as pd
+from utils import backtest, bar_store
+from utils.ticker_utils import get_universe, to_symbol
+from scripts.update_bar_store import ingest
+
+def load_frames(symbols: list, interval: str, start=None) -> dict:
+    """由本地 K 棒倉庫讀取回測資料 (未指定 symbols 時讀取倉庫中此週期的全部代號)"""
+    frames = {}
+    for symbol in symbols or bar_store.symbols(interval):
+        df = bar_store.read(symbol, interval, start=start)
+        if df is not None:
+            frames[symbol] = df
+    return frames
+
+def main():
+    parser = argparse.ArgumentParser(description="回測 analyze_stock 的支撐/壓力、跌破與 KD 訊號 (資料來自本地 K 棒倉庫)")
+    parser.add_argument("--tickers", nargs="*", help="股票代號 (例如 2330 8299)，未指定時使用倉庫中的全部股票")
+    parser.add_argument("--universe", action="store_true", help="全市場上市櫃普通股 (搭配 --ingest)")
+    parser.add_argument("--ingest", action="store_true", help="先將指定股票增量匯入本地 K 棒倉庫 (同 scripts/update_bar_store.py)")
+    parser.add_argument("--start", help="只回測此日期 (含) 之後的 K 棒，例如 2020-01-01")
+    parser.add_argument("--interval", default="1d")
+    parser.add_argument("--horizons", nargs="*", type=int, default=list(backtest.HORIZONS))
+    parser.add_argument("--output", help="回測結果 JSON 輸出路徑")
+    args = parser.parse_args()
+
+    symbols = None
+    if args.universe:
+        symbols = list(get_universe())
+    elif args.tickers:
+        symbols = [to_symbol(t) for t in args.tickers]
+
+    if args.ingest:
+        if not symbols:
+            parser.error("--ingest 需搭配 --tickers 或 --universe")
+        ingest(symbols, args.interval)
+
+    started = time.perf_counter()
+    start = pd.Timestamp(args.start, tz=bar_store.TZ) if args.start else None
+    frames = load_frames(symbols, args.interval, start)
+    loaded = time.perf_counter()
+    report = backtest.run_backtest(frames, tuple(args.horizons))
+    print(f"讀取 {len(frames)} 檔 {loaded - started:.2f}s，回測 {report['bars']} 根 K 棒 {report.get('elapsed_seconds', 0):.2f}s")
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"回測結果已儲存至: {args.output}")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
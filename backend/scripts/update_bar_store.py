@@ -0,0 +1,111 @@
+import os
+import sys
+import argparse
+
+# 讓腳本可直接以 python scripts/update_bar_store.py 執行
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+import pandas as pd
+from utils import bar_store
+from utils.stock_analysis import download_bars
+from utils.ticker_utils import get_universe
+
+# 收盤後增量匯入全市場 K 棒至本地倉庫 (utils/bar_store):
+# - 倉庫中沒有的代號下載 INITIAL_PERIOD 的完整歷史
+# - 已有的代號從最後一根 K 棒的交易日起下載 (與既有資料重疊一日)，只接上新的 K 棒
+# - 重疊 K 棒的收盤價與上游不同時 (除權息後 Yahoo 回溯調整歷史價格) 重新下載完整歷史
+# - 尚未定稿的當日 K 棒 (bar_store.SETTLED_AFTER 之前執行時) 不寫入
+INTERVALS = ("1d", "60m")
+INITIAL_PERIOD = {"1d": "10y", "60m": "1y"}  # Yahoo 的 60分K 只提供近兩年
+DOWNLOAD_BATCH = 200
+ADJUST_TOLERANCE = 1e-4  # 重疊 K 棒收盤價的相對差異上限
+
+
+def _download(symbols: list, interval: str, **kwargs):
+    """分批多檔下載，逐檔產出 (symbol, DataFrame)；批次失敗時記錄並略過"""
+    return download_bars(symbols, interval, batch_size=DOWNLOAD_BATCH, skip_failed_batches=True, **kwargs)
+
+
+def _is_adjusted(symbol: str, interval: str, df: pd.DataFrame) -> bool:
+    """上游與本地重疊 K 棒的收盤價不一致 (歷史價格已回溯調整)"""
+    index = bar_store.to_local_index(df.index)
+    stored = bar_store.read(symbol, interval, start=index[0])
+    if stored is None:
+        return False
+    overlap = stored.index.intersection(index)
+    if overlap.empty:
+        return False
+    old = stored.loc[overlap, "Close"].to_numpy()
+    new = pd.Series(df["Close"].to_numpy(dtype=np.float64), index=index).loc[overlap].to_numpy()
+    return bool(np.any(np.abs(new - old) > ADJUST_TOLERANCE * np.abs(old)))
+
+
+def ingest(symbols: list, interval: str, now=None) -> dict:
+    """
+    增量匯入單一週期。
+    回傳: { "created", "appended", "rewritten", "unchanged", "rows" } (各為檔數，rows 為新增的 K 棒數)
+    """
+    now = pd.Timestamp.now(bar_store.TZ) if now is None else now
+    summary = {"created": 0, "appended": 0, "rewritten": 0, "unchanged": 0, "rows": 0}
+
+    # 依最後一根 K 棒的交易日分組 (收盤後執行時幾乎所有代號同一組，每批只需一次下載)
+    groups = {}
+    for symbol in symbols:
+        last_ts = bar_store.last_timestamp(symbol, interval)
+        groups.setdefault(None if last_ts is None else last_ts.strftime("%Y-%m-%d"), []).append(symbol)
+
+    adjusted = []
+    for start, group in sorted(groups.items(), key=lambda item: item[0] or ""):
+        kwargs = {"period": INITIAL_PERIOD[interval]} if start is None else {"start": start}
+        print(f"[{interval}] 下載 {len(group)} 檔 ({'period=' + kwargs.get('period', '') if start is None else 'start=' + start})...")
+        for symbol, df in _download(group, interval, **kwargs):
+            df = bar_store.completed(df, now)
+            if df.empty:
+                summary["unchanged"] += 1
+            elif start is None:
+                summary["rows"] += bar_store.write(symbol, interval, df)
+                summary["created"] += 1
+            elif _is_adjusted(symbol, interval, df):
+                adjusted.append(symbol)
+            else:
+                rows = bar_store.append(symbol, interval, df)
+                summary["rows"] += rows
+                summary["appended" if rows else "unchanged"] += 1
+
+    if adjusted:
+        print(f"[{interval}] {len(adjusted)} 檔歷史價格已調整，重新下載完整歷史...")
+        for symbol, df in _download(adjusted, interval, period=INITIAL_PERIOD[interval]):
+            df = bar_store.completed(df, now)
+            if not df.empty:
+                bar_store.write(symbol, interval, df)
+                summary["rewritten"] += 1
+    return summary
+
+
+def update_bar_store(intervals=INTERVALS, symbols: list = None) -> bool:
+    """匯入全市場 (或指定代號) 的日線與 60分K 至 bar_store.STORE_DIR"""
+    try:
+        symbols = symbols or list(get_universe())
+    except Exception as e:
+        print(f"無法取得股票清單: {e}")
+        return False
+
+    ok = True
+    for interval in intervals:
+        summary = ingest(symbols, interval)
+        print(
+            f"[{interval}] 新建 {summary['created']} 檔、接上 {summary['appended']} 檔 ({summary['rows']} 根)、"
+            f"重建 {summary['rewritten']} 檔、無新資料 {summary['unchanged']} 檔，儲存至: {bar_store.STORE_DIR}"
+        )
+        if not any(summary[k] for k in ("created", "appended", "rewritten", "unchanged")):
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="收盤後增量匯入全市場 K 棒至本地 K 棒倉庫")
+    parser.add_argument("--intervals", nargs="*", default=list(INTERVALS))
+    parser.add_argument("--symbols", nargs="*", help="yfinance 代號 (例如 2330.TW)，未指定時為全市場上市櫃普通股")
+    args = parser.parse_args()
+    sys.exit(0 if update_bar_store(args.intervals, args.symbols) else 1)
@@ -1,18 +1,29 @@
 import requests
 import pandas as pd
-import json
 import os
+import sys
 import urllib3
 import io
 import datetime
+import argparse
+import importlib.util
+
+# 讓腳本可直接以 python scripts/update_cb_mapping.py 執行
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_modules.cb import CBMapping, MAPPING_FILE, JSON_EXPORT_FILE, REQUIRED_COLUMNS
+try:
+    from . import refresh_common
+except ImportError:
+    import refresh_common
 
 # 忽略 SSL 警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # 設定路徑
 BASE_DIR = os.path.dirname(__file__)
-DATA_MODULES_DIR = os.path.join(BASE_DIR, "..", "data_modules")
-OUTPUT_FILE = os.path.join(DATA_MODULES_DIR, "cb_mapping_dynamic.json")
+OUTPUT_FILE = MAPPING_FILE
+STATE_FILE = f"{OUTPUT_FILE}.fetch.json"  # 上次下載的 ETag / Last-Modified / sha256
 LOG_FILE = os.path.join(BASE_DIR, "cb_download.log")
 URL = "https://cbas16889.pscnet.com.tw/api/MiDownloadExcel/GetExcel_IssuedCB"
 
@@ -23,77 +34,64 @@ def log_message(msg):
         f.write(f"[{timestamp}] {msg}\n")
     print(f"[{timestamp}] {msg}")
 
-def update_cb_mapping():
+def excel_engine() -> str:
+    """優先使用 Rust 實作的 calamine (唯讀、快速)，未安裝時退回 openpyxl"""
+    return "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+
+def read_issued_cb_excel(content: bytes) -> pd.DataFrame:
+    """只讀取必要的四個欄位"""
+    return pd.read_excel(io.BytesIO(content), usecols=REQUIRED_COLUMNS, engine=excel_engine())
+
+def update_cb_mapping(export_json: bool = False):
     log_message("開始執行可轉債對照表更新...")
     
     try:
-        resp = requests.get(URL, verify=False, timeout=60)
-        
-        if resp.status_code == 404:
-            log_message(f"Error 404: 找不到檔案 - {URL}")
-            return False
-            
-        if resp.status_code != 200:
-            log_message(f"Error {resp.status_code}: 下載失敗 - {URL}")
-            return False
+        # 輸出檔遺失時忽略驗證資訊，強制完整下載
+        result = refresh_common.conditional_get(
+            URL, STATE_FILE, force=not os.path.exists(OUTPUT_FILE), verify=False, timeout=60
+        )
+        log_message(refresh_common.report("cb_mapping"))
+
+        if not result.changed:
+            refresh_common.mark_fresh(OUTPUT_FILE)
+            log_message(f"來源未變更 ({result.status})，略過解析與寫入。")
+            return True
             
         # 解析 Excel
-        log_message("下載成功，開始解析 Excel...")
+        log_message(f"下載成功，開始解析 Excel (engine={excel_engine()})...")
         try:
-            df = pd.read_excel(io.BytesIO(resp.content))
-            
-            # 檢查必要欄位
-            required_cols = ['債券代號', '標的債券', '轉換價格', '轉換標的代碼']
-            if not all(col in df.columns for col in required_cols):
-                 log_message(f"Error: Excel 缺少必要欄位。現有欄位: {df.columns.tolist()}")
-                 return False
+            try:
+                df = read_issued_cb_excel(result.content)
+            except ValueError as e:
+                # usecols 找不到欄位時 pandas 會拋出 ValueError
+                log_message(f"Error: Excel 缺少必要欄位 {REQUIRED_COLUMNS} - {e}")
+                return False
 
-            # 建構 Mapping
-            # 格式: { "stock_id": [ { "cb_id": "...", "cb_name": "...", "price": ... }, ... ] }
-            mapping = {}
-            count = 0
-            
-            for _, row in df.iterrows():
-                try:
-                    # 轉換標的代碼可能有小數點或轉成 float，轉字串處理
-                    stock_id = str(row['轉換標的代碼']).strip().split('.')[0]
-                    cb_id = str(row['債券代號']).strip()
-                    cb_name = str(row['標的債券']).strip()
-                    price_raw = row['轉換價格']
-                    
-                    # 處理價格轉型
-                    try:
-                        price = float(price_raw)
-                    except ValueError:
-                        price = 0.0
+            # 建構 Mapping (向量化分組) 並儲存為 npz
+            mapping = CBMapping.from_frame(df)
+            mapping.save(OUTPUT_FILE)
+            result.commit()
+            if export_json:
+                mapping.export_json(JSON_EXPORT_FILE)
+                log_message(f"已匯出除錯用 JSON: {JSON_EXPORT_FILE}")
 
-                    if stock_id not in mapping:
-                        mapping[stock_id] = []
-                    
-                    mapping[stock_id].append({
-                        "cb_id": cb_id,
-                        "cb_name": cb_name,
-                        "conversion_price": price
-                    })
-                    count += 1
-                except Exception as e:
-                    continue # 略過錯誤行
-            
-            # 儲存 JSON
-            os.makedirs(DATA_MODULES_DIR, exist_ok=True)
-            with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-                json.dump(mapping, f, ensure_ascii=False, indent=2)
-                
-            log_message(f"更新成功。共處理 {count} 筆可轉債資料，已儲存至 {OUTPUT_FILE}")
+            log_message(f"更新成功。共處理 {mapping.total_bonds} 筆可轉債資料 ({len(mapping)} 檔股票)，已儲存至 {OUTPUT_FILE}")
             return True
 
         except Exception as e:
              log_message(f"Error: 解析 Excel 失敗 - {e}")
              return False
 
+    except requests.HTTPError as e:
+        log_message(f"Error {e.response.status_code}: 下載失敗 - {URL}")
+        return False
+
     except Exception as e:
         log_message(f"Error: 請求發生例外 - {e}")
         return False
 
 if __name__ == "__main__":
-    update_cb_mapping()
+    parser = argparse.ArgumentParser(description="更新可轉債對照表 (data_modules/cb_mapping.npz)")
+    parser.add_argument("--json", action="store_true", help="同時匯出 cb_mapping_dynamic.json 供除錯")
+    args = parser.parse_args()
+    sys.exit(0 if update_cb_mapping(export_json=args.json) else 1)
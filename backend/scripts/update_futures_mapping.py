@@ -1,13 +1,22 @@
 import requests
 from bs4 import BeautifulSoup
-import json
 import os
 import re
+import sys
 from FinMind.data import DataLoader
 import pandas as pd
 
+# 讓腳本可直接以 python scripts/update_futures_mapping.py 執行 (refresh_common 使用 utils)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+try:
+    from . import refresh_common
+except ImportError:
+    import refresh_common
+
 URL = "https://www.taifex.com.tw/cht/4/contractName"
 OUTPUT_FILE = os.path.join(os.path.dirname(__file__), "..", "data_modules", "futures_mapping_static.json")
+STATE_FILE = f"{OUTPUT_FILE}.fetch.json"  # 上次下載的 ETag / Last-Modified / sha256
 
 def normalize(name):
     """移除干擾字元以進行比對"""
@@ -16,26 +25,33 @@ def normalize(name):
 def scrape_futures_mapping():
     print(f"正在從期交所爬取最新代號對照表: {URL}")
     try:
-        # 1. 取得 FinMind 股票清單 (用於平衡名稱與代號)
+        # 1. 爬取期交所 (條件式請求；輸出檔遺失時強制完整下載)
+        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+        try:
+            result = refresh_common.conditional_get(
+                URL, STATE_FILE, force=not os.path.exists(OUTPUT_FILE), headers=headers, timeout=15
+            )
+        except requests.HTTPError as e:
+            print(f"無法存取網頁: {e.response.status_code}")
+            return False
+        print(refresh_common.report("futures_mapping"))
+
+        if not result.changed:
+            refresh_common.mark_fresh(OUTPUT_FILE)
+            print(f"期交所頁面未變更 ({result.status})，略過解析與寫入。")
+            return True
+
+        # 2. 取得 FinMind 股票清單 (用於平衡名稱與代號)
         print("正在獲取 FinMind 股票清單以進行名稱對應...")
         dl = DataLoader()
         stock_info = dl.taiwan_stock_info()
         name_to_id = {normalize(row['stock_name']): row['stock_id'] for _, row in stock_info.iterrows()}
 
-        # 2. 爬取期交所
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-        response = requests.get(URL, headers=headers, timeout=15)
-        response.encoding = 'utf-8'
-        
-        if response.status_code != 200:
-            print(f"無法存取網頁: {response.status_code}")
-            return
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = BeautifulSoup(result.content.decode('utf-8', errors='replace'), 'html.parser')
         table = soup.find('table', {'class': 'table_c'})
         if not table:
             print("找不到資料表格 (table_c)")
-            return
+            return False
             
         mapping = {}
         rows = table.find_all('tr')
@@ -71,20 +87,22 @@ def scrape_futures_mapping():
                         mapping[stock_id] = final_ticker
 
         if mapping:
-            # 確保目錄存在
-            os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-            with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-                json.dump(mapping, f, ensure_ascii=False, indent=2)
-            print(f"成功更新對照表，共 {len(mapping)} 筆資料，儲存至: {OUTPUT_FILE}")
+            # 原子寫入 (內容相同時不重寫)，成功後才保存驗證資訊
+            written = refresh_common.atomic_write_json(OUTPUT_FILE, mapping, indent=2)
+            result.commit()
+            print(f"{'成功更新' if written else '內容未變更，保留'}對照表，共 {len(mapping)} 筆資料，儲存至: {OUTPUT_FILE}")
             
             # 驗證幾個關鍵點
             print(f"驗證 2330: {mapping.get('2330')}")
             print(f"驗證 2002: {mapping.get('2002')}")
+            return True
         else:
             print("未抓取到任何有效對應。")
+            return False
 
     except Exception as e:
         print(f"發生錯誤: {e}")
+        return False
 
 if __name__ == "__main__":
-    scrape_futures_mapping()
+    sys.exit(0 if scrape_futures_mapping() else 1)
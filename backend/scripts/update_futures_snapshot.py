@@ -0,0 +1,24 @@
+import os
+import sys
+
+# 讓腳本可直接以 python scripts/update_futures_snapshot.py 執行
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_modules import futures
+
+def update_futures_snapshot():
+    """一次下載全市場個股期貨日資料，挑出各標的主力合約並寫入 data_modules/futures_daily_snapshot.npz"""
+    try:
+        snapshot = futures.download_futures_snapshot()
+        if snapshot.empty:
+            print("近期查無個股期貨資料，保留既有快照。")
+            return False
+        futures.save_futures_snapshot(snapshot)
+        print(f"個股期貨快照已更新 ({snapshot['date'].iloc[0]})，共 {len(snapshot)} 檔，儲存至: {futures.SNAPSHOT_FILE}")
+        return True
+    except Exception as e:
+        print(f"個股期貨快照更新失敗: {e}")
+        return False
+
+if __name__ == "__main__":
+    sys.exit(0 if update_futures_snapshot() else 1)
@@ -0,0 +1,20 @@
+import os
+import sys
+
+# 讓腳本可直接以 python scripts/update_stock_info_snapshot.py 執行
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils import ticker_utils
+
+def update_stock_info_snapshot():
+    """下載 FinMind 全台股清單並寫入 utils/stock_info_snapshot.csv (建置時執行，隨部署打包)"""
+    try:
+        stock_info = ticker_utils.download_stock_info()
+        print(f"股票清單快照已更新，共 {len(stock_info)} 筆資料，儲存至: {ticker_utils.SNAPSHOT_FILE}")
+        return True
+    except Exception as e:
+        print(f"股票清單快照更新失敗: {e}")
+        return False
+
+if __name__ == "__main__":
+    sys.exit(0 if update_stock_info_snapshot() else 1)
@@ -0,0 +1,4 @@
+import os
+
+# 匯入 main 時不啟動背景預熱 (預熱會連網下載股票清單並以子行程更新可轉債對照表)
+os.environ["WARMUP_ENABLED"] = "0"
@@ -0,0 +1,52 @@
+from datetime import datetime
+import pytest
+from utils import answer_cache
+
+def taipei(*args) -> float:
+    return datetime(*args, tzinfo=answer_cache.TAIPEI).timestamp()
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    answer_cache.clear()
+    yield
+    answer_cache.clear()
+
+@pytest.mark.parametrize("now, expected", [
+    (taipei(2024, 5, 10, 9, 5), taipei(2024, 5, 10, 10, 0)),     # 盤中第一根
+    (taipei(2024, 5, 10, 10, 0), taipei(2024, 5, 10, 11, 0)),    # 剛收盤的那一刻算下一根
+    (taipei(2024, 5, 10, 13, 10), taipei(2024, 5, 10, 13, 30)),  # 最後一根半小時 K
+    (taipei(2024, 5, 10, 14, 0), taipei(2024, 5, 13, 10, 0)),    # 週五收盤後 -> 週一
+    (taipei(2024, 5, 11, 12, 0), taipei(2024, 5, 13, 10, 0)),    # 週六
+])
+def test_next_bar_close(now, expected):
+    assert answer_cache.next_bar_close(now) == expected
+
+def test_key_normalizes_question_and_tracks_inputs():
+    key = answer_cache.make_key("2330", "分析　2330  TSMC", "prompt", "2024-05-10 00:00", "2024-05-10 12:00")
+    assert key == answer_cache.make_key("2330", " 分析 2330 tsmc", "prompt", "2024-05-10 00:00", "2024-05-10 12:00")
+    assert key != answer_cache.make_key("2330", "分析 2330 tsmc", "prompt v2", "2024-05-10 00:00", "2024-05-10 12:00")
+    assert key != answer_cache.make_key("2330", "分析 2330 tsmc", "prompt", "2024-05-10 00:00", "2024-05-10 13:00")
+
+def test_entry_expires_at_next_bar_close(mocker):
+    answer_cache.put("k", "回答", {"prompt_tokens": 1_000_000, "output_tokens": 500_000}, 8.0,
+                     now=taipei(2024, 5, 10, 10, 30))
+    mocker.patch("utils.answer_cache.time.time", return_value=taipei(2024, 5, 10, 10, 59))
+    assert answer_cache.get("k") == "回答"
+    mocker.patch("utils.answer_cache.time.time", return_value=taipei(2024, 5, 10, 11, 0))
+    assert answer_cache.get("k") is None
+
+    stats = answer_cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+    assert stats["avoided_generation_seconds"] == 8.0
+    assert stats["avoided_cost_usd"] == pytest.approx(0.15 + 0.30)
+
+def test_lru_eviction(mocker):
+    mocker.patch.object(answer_cache, "MAX_ENTRIES", 2)
+    answer_cache.put("a", "A")
+    answer_cache.put("b", "B")
+    assert answer_cache.get("a") == "A"  # a 變為最近使用
+    answer_cache.put("c", "C")
+    assert answer_cache.get("b") is None
+    assert answer_cache.get("a") == "A" and answer_cache.get("c") == "C"
+    assert answer_cache.get_stats()["evictions"] == 1
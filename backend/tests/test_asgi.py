@@ -0,0 +1,133 @@
+import json
+import time
+import asyncio
+import httpx
+import pytest
+import asgi
+
+def http_client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi.app), base_url="http://test")
+
+class Client:
+    """同步呼叫 ASGI app (每次請求一個 event loop)"""
+    def request(self, method, path, **kwargs):
+        async def send():
+            async with http_client() as http:
+                return await http.request(method, path, **kwargs)
+        return asyncio.run(send())
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+@pytest.fixture
+def client():
+    return Client()
+
+@pytest.fixture(autouse=True)
+def no_answer_cache():
+    asgi.answer_cache.clear()
+    yield
+    asgi.answer_cache.clear()
+
+def patch_sources(mocker, daily=None):
+    mocker.patch('main.get_precise_data', side_effect=daily or (lambda ticker: {"stock_id": "2330.TW", "close": 110.0}))
+    mocker.patch('main.get_60m_data', return_value={"strategy_gold_silver": {"status": "SQUEEZE"}})
+    mocker.patch('main.load_cb_mapping', return_value={})
+    mocker.patch('main.read_prompt_file', return_value=("prompt", None))
+
+async def async_iter(items):
+    for item in items:
+        yield item
+
+def test_task_returns_answer_with_server_timing(mocker, client):
+    def fake_daily(ticker):
+        with asgi.timing.span("yf_1d", desc="2330.TW"):
+            time.sleep(0.01)
+        return {"stock_id": "2330.TW", "close": 110.0}
+
+    patch_sources(mocker, fake_daily)
+    gemini_client = mocker.Mock()
+    gemini_client.aio.models.generate_content = mocker.AsyncMock(
+        return_value=mocker.Mock(text="分析結果", usage_metadata=None)
+    )
+    mocker.patch('asgi.gemini_client.get_client', return_value=gemini_client)
+
+    response = client.post('/task', json={"question": "分析 2330"})
+
+    assert response.json() == {"answer": "分析結果"}
+    header = response.headers["Server-Timing"]
+    # 執行緒中的 span 也寫入同一請求
+    for name in ('yf_1d;dur=', 'cb_mapping;dur=', 'context;dur=', 'gemini;dur=', 'total;dur='):
+        assert name in header
+    metrics = client.get('/metrics').json()
+    assert metrics["latency_ms"]["http_execute_task"]["count"] >= 1
+    assert metrics["asgi"]["thread_limit"] == asgi.THREAD_LIMIT
+    # 舊路徑與 Flask 版相同
+    assert client.post('/', json={"question": "分析 2330"}).json() == {"answer": "分析結果"}
+
+def test_task_streams_context_then_tokens(mocker, client):
+    patch_sources(mocker)
+    gemini_client = mocker.Mock()
+    gemini_client.aio.models.generate_content_stream = mocker.AsyncMock(return_value=async_iter([
+        mocker.Mock(text="台積電"), mocker.Mock(text=None), mocker.Mock(text="多頭")
+    ]))
+    mocker.patch('asgi.gemini_client.get_client', return_value=gemini_client)
+
+    response = client.post('/task', json={"question": "分析 2330"}, headers={"Accept": "text/event-stream"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert events[0] == [": accepted"]
+    assert [e[0] for e in events[1:]] == ["event: context", "event: token", "event: token", "event: done"]
+    assert json.loads(events[1][1][len("data: "):])["close"] == 110.0
+    assert json.loads(events[3][1][len("data: "):]) == {"text": "多頭"}
+
+def test_fetch_stock_context_partial_on_timeout(mocker):
+    def slow_60m(ticker):
+        time.sleep(1)
+        return {"strategy_gold_silver": {"status": "SQUEEZE"}}
+
+    patch_sources(mocker)
+    mocker.patch('main.get_60m_data', side_effect=slow_60m)
+    mocker.patch.dict(asgi.SOURCE_TIMEOUTS, {"60m": 0.1})
+
+    started = time.monotonic()
+    context = asyncio.run(asgi.fetch_stock_context("2330"))
+
+    assert time.monotonic() - started < 0.9
+    assert context["timed_out_sources"] == ["60m"]
+    assert context["close"] == 110.0
+    assert context["strategy_gold_silver"] is None
+
+def test_concurrent_tasks_wait_on_gemini_without_threads(mocker):
+    patch_sources(mocker)
+    async def slow_generate(**kwargs):
+        await asyncio.sleep(0.2)
+        return mocker.Mock(text="分析結果", usage_metadata=None)
+    gemini_client = mocker.Mock()
+    gemini_client.aio.models.generate_content = slow_generate
+    mocker.patch('asgi.gemini_client.get_client', return_value=gemini_client)
+
+    async def fire(n):
+        async with http_client() as http:
+            return await asyncio.gather(*(http.post('/task', json={"question": "分析 2330"}) for _ in range(n)))
+
+    started = time.monotonic()
+    responses = asyncio.run(fire(100))
+
+    assert all(r.json() == {"answer": "分析結果"} for r in responses)
+    # 依序執行需 20 秒；同時等待 Gemini 時不占用執行緒
+    assert time.monotonic() - started < 5
+
+def test_ticker_endpoint_and_errors(mocker, client):
+    mocker.patch('main.get_ticker_by_name', return_value="2330.TW")
+    mocker.patch('main.search_tickers_by_prefix', return_value=[{"name": "台積電", "ticker": "2330.TW"}])
+
+    assert client.post('/ticker', json={"name": "台積電"}).json() == {"name": "台積電", "ticker": "2330.TW"}
+    assert client.post('/ticker', json={"prefix": "台積"}).json()["matches"][0]["ticker"] == "2330.TW"
+    assert client.post('/ticker', json={}).status_code == 400
+    assert client.post('/task', content=b"not json").status_code == 400
+    assert client.post('/task', json={"question": ""}).status_code == 400
@@ -0,0 +1,20 @@
+import os
+import pytest
+from utils.atomic_file import atomic_write, atomic_write_bytes
+
+def test_atomic_write_replaces_target(tmp_path):
+    path = tmp_path / "nested" / "data.bin"
+    atomic_write_bytes(str(path), b"old")
+    atomic_write_bytes(str(path), b"new")
+    assert path.read_bytes() == b"new"
+    assert os.listdir(path.parent) == ["data.bin"]
+
+def test_atomic_write_keeps_old_file_and_removes_tmp_on_failure(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with atomic_write(str(path)) as f:
+            f.write(b"partial")
+            raise RuntimeError("write failed")
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["data.bin"]
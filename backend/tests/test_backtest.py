@@ -0,0 +1,74 @@
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from utils import backtest, bar_store
+from scripts import run_backtest
+from utils.indicators import compute_signal_series
+from utils.stock_analysis import analyze_dataframe
+
+def random_bars(n, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.01, n))
+    high = np.maximum(open_, close) * (1 + abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * (1 - abs(rng.normal(0, 0.01, n)))
+    volume = rng.integers(1000, 100000, n).astype(float)
+    index = pd.date_range("2020-01-01", periods=n, freq="D")
+    return pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume}, index=index)
+
+@pytest.mark.parametrize("seed", range(4))
+def test_signal_series_matches_latest_bar_analysis(seed):
+    df = random_bars(160, seed)
+    signals = compute_signal_series(*(df[c].to_numpy() for c in ["Open", "High", "Low", "Close", "Volume"]))
+
+    # 每根 K 棒的訊號 = 只用到該根為止的資料做 analyze_dataframe (無未來資料)
+    for t in range(19, len(df), 3):
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = analyze_dataframe(df.iloc[:t + 1].copy(), "TEST", "1d")
+        assert signals["support_type"][t] == expected["support_type"]
+        assert signals["resist_type"][t] == expected["resist_type"]
+        assert signals["breakdown_signal"][t] == expected["breakdown_signal"]
+        assert signals["kd_signal"][t] == expected["kd_signal"]
+        assert round(float(signals["support_price"][t]), 2) == expected["support_price"]
+        assert round(float(signals["resist_price"][t]), 2) == expected["resist_price"]
+
+def test_forward_returns_and_future_extremes():
+    close = np.array([10.0, 11.0, 12.1, 9.0])
+
+    np.testing.assert_allclose(backtest.forward_returns(close, 1)[:3], [0.1, 0.1, 9.0 / 12.1 - 1])
+    assert np.isnan(backtest.forward_returns(close, 1)[3])
+    np.testing.assert_array_equal(backtest.future_extreme(close, 2, np.min)[:2], [11.0, 9.0])
+    assert np.isnan(backtest.future_extreme(close, 2, np.min)[2:]).all()
+
+def test_run_backtest_report():
+    frames = {f"{i}.TW": random_bars(300, i) for i in range(5)}
+    frames["short.TW"] = random_bars(10, 99)
+
+    report = backtest.run_backtest(frames, horizons=(1, 5))
+
+    assert report["tickers"] == 5
+    assert report["bars"] == 5 * (300 - backtest.MIN_BARS + 1)
+    golden = report["signals"]["kd_signal"]["GOLDEN_CROSS"]
+    assert golden["direction"] == "UP" and golden["horizons"]["5"]["count"] > 0
+    assert 0 <= golden["horizons"]["5"]["hit_rate"] <= 1
+    supports = report["levels"]["support_type"]
+    assert sum(level["count"] for level in supports.values()) == report["bars"]
+    assert all(0 <= rate <= 1 for level in supports.values() for rate in level["hold_rate"].values())
+
+def test_run_backtest_reads_bar_store(tmp_path, mocker):
+    mocker.patch.object(bar_store, 'STORE_DIR', str(tmp_path))
+    bar_store.clear()
+    df = random_bars(30, 1)
+    df.index = df.index.tz_localize("Asia/Taipei")
+    bar_store.write("2330.TW", "1d", df)
+
+    frames = run_backtest.load_frames(None, "1d")
+
+    assert list(frames) == ["2330.TW"]
+    np.testing.assert_array_equal(frames["2330.TW"]["Close"].to_numpy(), df["Close"].to_numpy())
+    assert run_backtest.load_frames(["9999.TW"], "1d") == {}
+    assert len(run_backtest.load_frames(None, "1d", start=df.index[10])["2330.TW"]) == 20
+    assert backtest.run_backtest(frames)["tickers"] == 1
+    bar_store.clear()
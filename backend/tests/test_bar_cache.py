@@ -0,0 +1,97 @@
+import time
+import threading
+import pytest
+import numpy as np
+import pandas as pd
+from utils import bar_cache
+
+def make_bars(start, rows, freq="h", base=100.0):
+    index = pd.date_range(start, periods=rows, freq=freq, tz="Asia/Taipei")
+    close = base + np.arange(rows, dtype=float)
+    return pd.DataFrame({
+        'Open': close - 1, 'High': close + 1, 'Low': close - 2, 'Close': close,
+        'Volume': [1000] * rows, 'Dividends': [0.0] * rows
+    }, index=index)
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    bar_cache.clear()
+    yield
+    bar_cache.clear()
+
+def test_get_bars_hit_skips_upstream(mocker):
+    full = mocker.Mock(return_value=make_bars("2024-01-02 09:00", 50))
+    since = mocker.Mock()
+
+    first = bar_cache.get_bars("2330.TW", "60m", full, since)
+    second = bar_cache.get_bars("2330.TW", "60m", full, since)
+
+    assert full.call_count == 1
+    since.assert_not_called()
+    assert list(second.columns) == bar_cache.BAR_COLUMNS
+    assert second.index.equals(first.index)
+    assert str(second.index.tz) == "Asia/Taipei"
+    stats = bar_cache.get_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["bytes"] == 50 * 8 * 6
+
+def test_get_bars_stale_fetches_only_tail(mocker):
+    history = make_bars("2024-01-02 09:00", 50)
+    full = mocker.Mock(return_value=history)
+    bar_cache.get_bars("2330.TW", "60m", full, mocker.Mock())
+
+    # 最後一根 K 棒更新 + 新增兩根
+    tail = make_bars(history.index[-1], 3, base=500.0)
+    since = mocker.Mock(return_value=tail)
+    mocker.patch.dict(bar_cache.INTERVAL_TTL, {"60m": 0})
+
+    df = bar_cache.get_bars("2330.TW", "60m", full, since)
+
+    assert full.call_count == 1
+    assert since.call_args[0][0] == history.index[-1]
+    assert len(df) == 50 # 維持原視窗長度
+    assert df['Close'].iloc[-3:].tolist() == [500.0, 501.0, 502.0]
+    assert df.index[-4] == history.index[-2]
+    assert bar_cache.get_stats()["rows_downloaded"] == 53
+
+def test_get_bars_evicts_by_byte_budget(mocker):
+    mocker.patch.object(bar_cache, 'MAX_BYTES', 50 * 8 * 6 * 2)
+    for symbol in ["2330.TW", "2317.TW", "8299.TWO"]:
+        bar_cache.get_bars(symbol, "1d", lambda: make_bars("2024-01-02", 50, freq="D"), mocker.Mock())
+
+    stats = bar_cache.get_stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= bar_cache.MAX_BYTES
+
+def test_get_bars_does_not_cache_empty(mocker):
+    full = mocker.Mock(return_value=pd.DataFrame())
+    assert bar_cache.get_bars("9999.TW", "1d", full, mocker.Mock()).empty
+    assert bar_cache.get_bars("9999.TW", "1d", full, mocker.Mock()).empty
+    assert full.call_count == 2
+
+def test_get_bars_coalesces_concurrent_misses(mocker):
+    release = threading.Event()
+    def slow_download():
+        release.wait(5)
+        return make_bars("2024-01-02 09:00", 20)
+    full = mocker.Mock(side_effect=slow_download)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(bar_cache.get_bars("2330.TW", "60m", full, mocker.Mock())))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    while bar_cache.get_stats()["single_flight"]["coalesced"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert full.call_count == 1
+    assert len(results) == 4
+    # 每個呼叫端拿到各自的 DataFrame
+    results[0]["K"] = 1.0
+    assert all("K" not in df.columns and len(df) == 20 for df in results[1:])
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import bar_store, bar_cache, ticker_utils
+from utils.stock_analysis import analyze_stock
+from scripts import update_bar_store
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, mocker):
+    mocker.patch.object(bar_store, 'STORE_DIR', str(tmp_path / "bar_store"))
+    mocker.patch.object(bar_store, 'ENABLED', True)
+    # analyze_stock 會記錄市場後綴，不寫入原始碼目錄的索引檔
+    mocker.patch.object(ticker_utils, 'SUFFIX_INDEX_FILE', str(tmp_path / "market_suffix_index.json"))
+    mocker.patch.object(ticker_utils, '_SUFFIX_INDEX', None)
+    bar_store.clear()
+    bar_cache.clear()
+    yield bar_store
+    bar_store.clear()
+    bar_cache.clear()
+
+def daily_bars(days, end=None, close=100.0):
+    end = end or pd.Timestamp.now(bar_store.TZ).normalize() - pd.Timedelta(days=1)
+    index = pd.bdate_range(end=end, periods=days, tz=bar_store.TZ)
+    close = close + np.arange(days, dtype=np.float64)
+    return pd.DataFrame({
+        "Open": close - 1, "High": close + 1, "Low": close - 2, "Close": close,
+        "Volume": np.full(days, 1000.0),
+    }, index=index)
+
+def test_read_is_zero_copy_and_survives_append(store):
+    df = daily_bars(60)
+    assert store.write("2330.TW", "1d", df) == 60
+
+    stored = store.read("2330.TW", "1d", start=df.index[10])
+    matrix, _ = store._open("2330.TW", "1d")
+    assert len(stored) == 50 and stored.index[0] == df.index[10]
+    np.testing.assert_array_equal(stored.to_numpy(), df.iloc[10:].to_numpy())
+    # 價量欄位直接指向映射區，不可寫入；新增指標欄位不影響映射
+    assert np.shares_memory(stored["Close"].to_numpy(), matrix)
+    with pytest.raises(ValueError):
+        stored["Close"].to_numpy()[0] = 0
+    stored["MA5"] = stored["Close"].rolling(5).mean()
+
+    # 重疊的最後一根以新資料取代，其餘接在尾端；已讀出的舊資料不受影響
+    tail = daily_bars(3, end=df.index[-1] + pd.offsets.BDay(2), close=500.0)
+    assert store.append("2330.TW", "1d", tail) == 2
+    updated = store.read("2330.TW", "1d")
+    assert len(updated) == 62 and updated["Close"].iloc[-3:].tolist() == [500.0, 501.0, 502.0]
+    assert stored["Close"].iloc[-1] == df["Close"].iloc[-1]
+    assert store.last_timestamp("2330.TW", "1d") == tail.index[-1]
+    assert store.symbols("1d") == ["2330.TW"] and store.read("2317.TW", "1d") is None
+
+def test_analyze_stock_reads_store_and_fetches_only_today(store, mocker):
+    df = daily_bars(300)
+    store.write("2330.TW", "1d", df)
+    mock_yf = mocker.patch('utils.stock_analysis.yf.Ticker')
+
+    # 收盤後 / 開盤前: 完全不連網
+    mocker.patch.object(bar_store, 'is_current', return_value=True)
+    result = analyze_stock("2330", "1d")
+    assert result["stock_id"] == "2330.TW" and result["close"] == df["Close"].iloc[-1]
+    mock_yf.return_value.history.assert_not_called()
+
+    # 盤中: 只向上游抓最後一根之後的 K 棒
+    mocker.patch.object(bar_store, 'is_current', return_value=False)
+    today = daily_bars(2, end=df.index[-1] + pd.offsets.BDay(1), close=900.0)
+    mock_yf.return_value.history.return_value = today
+    result = analyze_stock("2330", "1d")
+    assert result["close"] == 901.0
+    mock_yf.return_value.history.assert_called_once_with(start=df.index[-1], interval="1d")
+
+def test_ingest_creates_appends_and_rebuilds_adjusted(store, mocker):
+    # 週五收盤後執行
+    now = pd.Timestamp("2026-10-16 15:00", tz=bar_store.TZ)
+    last = now.normalize() - pd.offsets.BDay(1)
+
+    def download(batch, **kwargs):
+        if "period" in kwargs:
+            frames = {"2330.TW": daily_bars(30, end=last - pd.offsets.BDay(1)), "2317.TW": daily_bars(30, end=last)}
+        else:
+            # 增量: 與既有資料重疊，2317 的歷史價格已調整
+            frames = {
+                "2330.TW": daily_bars(3, end=now.normalize(), close=129.0),
+                "2317.TW": daily_bars(2, end=now.normalize(), close=50.0),
+            }
+        return pd.concat({s: frames[s] for s in batch if s in frames}, axis=1)
+
+    mocker.patch('utils.stock_analysis.yf.download', side_effect=download)
+    summary = update_bar_store.ingest(["2330.TW", "2317.TW"], "1d", now=now)
+    assert summary["created"] == 2 and summary["rows"] == 60
+
+    summary = update_bar_store.ingest(["2330.TW", "2317.TW"], "1d", now=now)
+    assert (summary["appended"], summary["rewritten"], summary["rows"]) == (1, 1, 2)
+    assert store.last_timestamp("2330.TW", "1d") == now.normalize()
+    assert len(store.read("2330.TW", "1d")) == 32
+
+    # 收盤定稿前執行: 不寫入當日 K 棒
+    early = now.normalize() + pd.Timedelta(hours=10)
+    assert store.completed(daily_bars(3, end=now.normalize()), early).index[-1] < now.normalize()
+    # 週五的 K 棒到下週一開盤前都是最新
+    assert store.is_current(now, pd.Timestamp("2026-10-19 08:59", tz=bar_store.TZ))
+    assert not store.is_current(now, pd.Timestamp("2026-10-19 09:00", tz=bar_store.TZ))
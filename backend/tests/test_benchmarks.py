@@ -0,0 +1,30 @@
+from benchmarks import bench_hot_paths
+
+def result(**timings):
+    return {"results": {name: {"min": t, "median": t} for name, t in timings.items()}}
+
+def test_compare_flags_regression_beyond_threshold():
+    baseline = result(fast=1.0, slow=1.0)
+    current = result(fast=1.2, slow=1.5, added=0.1)
+    rows = {row["name"]: row for row in bench_hot_paths.compare(baseline, current, threshold=0.25)}
+    assert rows["fast"]["regressed"] is False
+    assert rows["slow"]["regressed"] is True
+    assert abs(rows["slow"]["change"] - 0.5) < 1e-9
+    # 基準線中沒有的項目只列出不判定
+    assert rows["added"]["baseline"] is None and rows["added"]["regressed"] is False
+
+def test_synthetic_data_is_reproducible():
+    a = bench_hot_paths.synthetic_ohlcv(100, seed=3)
+    b = bench_hot_paths.synthetic_ohlcv(100, seed=3)
+    assert a.equals(b)
+    assert (a["High"] >= a[["Open", "Close"]].max(axis=1)).all()
+    assert (a["Low"] <= a[["Open", "Close"]].min(axis=1)).all()
+
+def test_run_smoke():
+    report = bench_hot_paths.run(sizes=(60,), repeat=1, number=1)
+    assert {
+        "analyze_stock[1d,60]", "get_cb_info[hit]", "cb_mapping_build[vectorized,npz]",
+        "get_ticker_by_name[exact]", "build_user_input",
+    } <= set(report["results"])
+    assert all(r["min"] > 0 for r in report["results"].values())
+    assert "python" in report["machine"]
@@ -1,16 +1,48 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
 import pytest
-from data_modules.cb import get_cb_info
-
-def test_get_cb_info_success(mocker):
-    mock_response = {
-        "aaData": [
-            ["47631", "材料一", "100", "0", "0"],
-            ["47632", "材料二", "120", "0", "0"],
-            ["23301", "台積一", "500", "0", "0"]
-        ]
-    }
-    
-    mocker.patch('requests.get', return_value=mocker.Mock(status_code=200, json=lambda: mock_response))
+from data_modules import cb
+from data_modules.cb import CBMapping, get_cb_info
+from benchmarks.bench_hot_paths import build_cb_mapping_rowwise
+
+MAPPING = {
+    "4763": [
+        {"cb_id": "47631", "cb_name": "材料一", "conversion_price": 100.0},
+        {"cb_id": "47632", "cb_name": "材料二", "conversion_price": 120.0}
+    ],
+    "2330": [
+        {"cb_id": "23301", "cb_name": "台積一", "conversion_price": 500.0}
+    ]
+}
+
+def to_frame(mapping):
+    """將 MAPPING 結構還原為發行資料 Excel 的四個欄位"""
+    return pd.DataFrame([
+        {'債券代號': item["cb_id"], '標的債券': item["cb_name"], '轉換價格': item["conversion_price"], '轉換標的代碼': stock_id}
+        for stock_id, items in mapping.items() for item in items
+    ], columns=cb.REQUIRED_COLUMNS)
+
+def write_mapping(path, mapping, mtime=None):
+    CBMapping.from_frame(to_frame(mapping)).save(path)
+    if mtime:
+        os.utime(path, (mtime, mtime))
+
+@pytest.fixture
+def mapping_file(tmp_path, mocker):
+    path = str(tmp_path / "cb_mapping.npz")
+    mocker.patch.object(cb, 'MAPPING_FILE', path)
+    mocker.patch.dict(cb._state, {"mapping": None, "mtime": None, "checked_at": float("-inf")})
+    refresher = cb.ScriptRefresher("cb_mapping", "unused", lock_file=f"{path}.lock", on_success=cb._reload_if_changed)
+    mocker.patch.object(cb, 'cb_refresher', refresher)
+    return path
+
+def test_get_cb_info_success(mapping_file, mocker):
+    write_mapping(mapping_file, MAPPING)
+    run_script = mocker.patch.object(cb.cb_refresher, '_run_script')
     
     # 測試材料 (4763)
     result = get_cb_info("4763", current_price=110)
@@ -20,9 +52,86 @@ def test_get_cb_info_success(mocker):
     assert result["cb_list"][0]["deviation_rate"] == 10.0
     # 47632: (110 - 120) / 120 * 100% = -8.33
     assert result["cb_list"][1]["deviation_rate"] == -8.33
+    # 今日已更新的對照表不觸發下載
+    run_script.assert_not_called()
 
-def test_get_cb_info_none(mocker):
-    mocker.patch('requests.get', return_value=mocker.Mock(status_code=200, json=lambda: {"aaData": []}))
+def test_get_cb_info_none(mapping_file, mocker):
+    write_mapping(mapping_file, {})
+    mocker.patch.object(cb.cb_refresher, '_run_script')
     result = get_cb_info("2330")
     assert result["has_cb"] is False
     assert len(result["cb_list"]) == 0
+
+def test_outdated_mapping_served_while_refreshing(mapping_file, mocker):
+    yesterday = time.time() - 2 * 24 * 60 * 60
+    write_mapping(mapping_file, MAPPING, mtime=yesterday)
+    release = threading.Event()
+
+    def slow_update():
+        release.wait(2)
+        write_mapping(mapping_file, {"4763": [{"cb_id": "47633", "cb_name": "材料三", "conversion_price": 90.0}]})
+    run_script = mocker.patch.object(cb.cb_refresher, '_run_script', side_effect=slow_update)
+    mocker.patch.object(cb, 'CHECK_INTERVAL', 0)
+
+    # 更新進行中: 多次請求仍使用舊版，且只啟動一次下載
+    for _ in range(5):
+        assert [c["cb_id"] for c in get_cb_info("4763")["cb_list"]] == ["47631", "47632"]
+
+    release.set()
+    assert cb.cb_refresher.wait(2)
+    assert run_script.call_count == 1
+    assert [c["cb_id"] for c in get_cb_info("4763")["cb_list"]] == ["47633"]
+    assert cb.cb_refresher.stats["last_ok"] is True
+
+def test_missing_mapping_waits_for_first_download(mapping_file, mocker):
+    mocker.patch.object(cb.cb_refresher, '_run_script', side_effect=lambda: write_mapping(mapping_file, MAPPING))
+
+    assert get_cb_info("2330", current_price=550)["cb_list"][0]["deviation_rate"] == 10.0
+
+def test_from_frame_matches_excel_rows():
+    df = pd.DataFrame({
+        '債券代號': ['47631', ' 23301 ', '47632', '99991'],
+        '標的債券': ['材料一', '台積一', '材料二', '缺代碼'],
+        '轉換價格': [100, '500.5', '-', 10],
+        '轉換標的代碼': [4763.0, '2330', 4763.0, None],
+    })
+
+    mapping = CBMapping.from_frame(df)
+
+    assert len(mapping) == 2 and mapping.total_bonds == 3
+    assert mapping.to_dict() == {
+        "2330": [{"cb_id": "23301", "cb_name": "台積一", "conversion_price": 500.5}],
+        "4763": [
+            {"cb_id": "47631", "cb_name": "材料一", "conversion_price": 100.0},
+            {"cb_id": "47632", "cb_name": "材料二", "conversion_price": 0.0},
+        ],
+    }
+    assert "9999" not in mapping and mapping.get("9999") is None
+
+def test_save_load_and_json_export(tmp_path):
+    mapping = CBMapping.from_frame(to_frame(MAPPING))
+    mapping.save(str(tmp_path / "cb_mapping.npz"))
+    mapping.export_json(str(tmp_path / "cb_mapping_dynamic.json"))
+
+    loaded = CBMapping.load(str(tmp_path / "cb_mapping.npz"))
+    assert loaded.to_dict() == MAPPING
+    with open(tmp_path / "cb_mapping_dynamic.json", encoding='utf-8') as f:
+        assert json.load(f) == MAPPING
+
+def test_vectorized_build_matches_rowwise_and_round_trips(tmp_path):
+    # 計時比較見 benchmarks/bench_hot_paths.py 的 cb_mapping_build[*] 項目
+    rng = np.random.default_rng(0)
+    n = 5000
+    df = pd.DataFrame({
+        '債券代號': [f"{i:05d}" for i in range(n)],
+        '標的債券': [f"債券{i}" for i in range(n)],
+        '轉換價格': rng.uniform(10, 500, n).round(2),
+        '轉換標的代碼': rng.integers(1000, 1800, n).astype(float),
+    })
+
+    path = tmp_path / "cb_mapping.npz"
+    CBMapping.from_frame(df).save(str(path))
+    mapping = CBMapping.load(str(path))
+    assert mapping.to_dict() == build_cb_mapping_rowwise(df)
+    # 原子寫入不留下暫存檔
+    assert os.listdir(tmp_path) == ["cb_mapping.npz"]
@@ -0,0 +1,75 @@
+import json
+import pytest
+from utils import context_serializer
+
+def make_context(cb_rows=5):
+    return {
+        "stock_id": "2330.TW", "date": "2024-05-10 00:00", "interval": "1d", "close": 110.0,
+        "ma5": 108.0, "ma10": 107.0, "ma20": 105.0, "ma60": 100.0, "ma120": 95.0, "ma240": 90.0,
+        "support_price": 100.0, "resist_price": 120.0, "support_type": "60d_low", "resist_type": "60d_high",
+        "smart_money_support": 104.0, "breakdown_signal": "NONE", "short_term_support": 108.0, "trend_support": 105.0,
+        "volume": 34343, "vol_ma5": 29896, "k": 40.5, "d": 34.3, "kd_signal": "NEUTRAL",
+        "strategy_gold_silver": {
+            "pattern_found": True, "pattern_type": "GOLD_WRAPPED_SILVER", "status": "SQUEEZE",
+            "description": "均線糾結，等待突破。", "ma60_trend": "UP", "convergence_rate": 1.2,
+        },
+        "has_cb": True,
+        "cb_list": [
+            {"cb_id": f"2330{i}", "cb_name": f"台積{i}", "conversion_price": 100.0 + i, "deviation_rate": 10.0 - i}
+            for i in range(cb_rows)
+        ],
+        "timed_out_sources": [],
+    }
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    context_serializer.reset_metrics()
+    yield
+    context_serializer.reset_metrics()
+
+def test_encodings_shrink_and_preserve_data():
+    context = make_context()
+    sizes = {e: context_serializer.serialize(context, e, budget=0)["tokens"] for e in context_serializer.ENCODINGS}
+    assert sizes["pretty"] > sizes["compact"] > sizes["tabular"] > sizes["abbreviated"]
+
+    tabular = json.loads(context_serializer.encode(context, "tabular"))
+    table = tabular["cb_list"]
+    assert table["columns"] == ["cb_id", "cb_name", "conversion_price", "deviation_rate"]
+    assert [dict(zip(table["columns"], row)) for row in table["rows"]] == context["cb_list"]
+    assert {k: v for k, v in tabular.items() if k != "cb_list"} == {k: v for k, v in context.items() if k != "cb_list"}
+
+    # 縮寫可由 System Prompt 的對照還原
+    abbreviated = json.loads(context_serializer.encode(context, "abbreviated"))
+    legend = context_serializer.system_legend("abbreviated")
+    assert abbreviated["c"] == 110.0 and abbreviated["cb"]["cols"][0] == "cid"
+    assert "c=close" in legend and "cid=cb_id" in legend
+    assert context_serializer.system_legend("tabular") is None
+
+def test_budget_drops_low_priority_fields_first():
+    context = make_context()
+    full = context_serializer.serialize(context, "tabular", budget=0)
+    result = context_serializer.serialize(context, "tabular", budget=full["tokens"] - 10)
+
+    assert result["tokens"] <= full["tokens"] - 10
+    assert result["omitted"][0] == "strategy_gold_silver.description"
+    assert "description" not in json.loads(result["text"])["strategy_gold_silver"]
+    assert "description" in context["strategy_gold_silver"] # 不修改原本的 context
+
+    # 預算過小時只捨棄 DROP_ORDER 中的欄位，核心數據保留
+    tiny = context_serializer.serialize(context, "tabular", budget=1)
+    data = json.loads(tiny["text"])
+    assert tiny["omitted"] == list(context_serializer.DROP_ORDER)
+    assert len(data["cb_list"]["rows"]) == 1
+    for key in ("stock_id", "date", "close", "ma20", "ma60", "support_price", "resist_price", "k", "d"):
+        assert key in data
+
+    metrics = context_serializer.get_metrics()
+    assert metrics["requests"] == 3 and metrics["trimmed"] == 2 and metrics["over_budget"] == 1
+    assert metrics["saved_tokens"] > 0
+
+def test_estimate_tokens():
+    assert context_serializer.estimate_tokens("台積電") == 3
+    assert context_serializer.estimate_tokens('{"close":110}') == 8 # { " close(2) " : 110 }
+    assert context_serializer.estimate_tokens("") == 0
+    with pytest.raises(ValueError):
+        context_serializer.encode({}, "yaml")
@@ -1,7 +1,16 @@
 import pytest
 import pandas as pd
+from data_modules import futures
 from data_modules.futures import get_futures_info
 
+@pytest.fixture(autouse=True)
+def snapshot_file(tmp_path, mocker):
+    path = str(tmp_path / "futures_daily_snapshot.npz")
+    mocker.patch.object(futures, 'SNAPSHOT_FILE', path)
+    mocker.patch.dict(futures._snapshot, {"data": None, "index": None, "mtime": None, "checked_at": float("-inf")})
+    mocker.patch.object(futures.snapshot_refresher, 'trigger', return_value=True)
+    return path
+
 def test_get_futures_info_success(mocker):
     # Mock FinMind Data
     mock_df = pd.DataFrame({
@@ -34,3 +43,54 @@ def test_get_futures_info_no_mapping(mocker):
     
     result = get_futures_info("0000")
     assert result["futures_id"] is None
+
+def market_df():
+    return pd.DataFrame({
+        'date': ['2024-01-25', '2024-01-26', '2024-01-26', '2024-01-26', '2024-01-26', '2024-01-26'],
+        'futures_id': ['CDF', 'CDF', 'CDF', 'CBF', 'CBF', 'TX'],
+        'close': ['600', '630', '640', '0', '25.5', '18000'],
+        'open_interest': [1, 2000, 2010, 300, 100, 9999],
+        'volume': [999, 100, 500, 800, 10, 9999],
+    })
+
+def test_select_front_contracts():
+    front = futures.select_front_contracts(market_df(), {"2330": "CDF", "2002": "CBF"})
+
+    rows = front.set_index('stock_id')
+    assert sorted(rows.index) == ["2002", "2330"]
+    assert rows.loc["2330", "close"] == 640.0
+    # 收盤價 > 0 的合約優先於成交量較大但無收盤價的合約
+    assert rows.loc["2002", "close"] == 25.5
+    assert (front['date'] == '2024-01-26').all()
+
+def test_snapshot_lookup_skips_finmind(snapshot_file, mocker):
+    front = futures.select_front_contracts(market_df(), {"2330": "CDF", "2002": "CBF"})
+    futures.save_futures_snapshot(front)
+    mock_dl = mocker.patch('data_modules.futures.DataLoader')
+
+    result = get_futures_info("2330")
+
+    assert result == {"stock_id": "2330", "futures_id": "CDF", "close": 640.0, "open_interest": 2010, "date": "2024-01-26"}
+    mock_dl.assert_not_called()
+
+def test_get_futures_infos_with_basis(snapshot_file):
+    futures.save_futures_snapshot(futures.select_front_contracts(market_df(), {"2330": "CDF", "2002": "CBF"}))
+
+    results = futures.get_futures_infos(["2330", "2002", "0000"], spot_prices={"2330": 632.0})
+
+    assert set(results) == {"2330", "2002"}
+    assert results["2330"]["basis"] == 8.0
+    assert results["2330"]["basis_pct"] == pytest.approx(1.27, abs=0.01)
+    assert "basis" not in results["2002"]
+
+def test_download_futures_snapshot_uses_one_bulk_request(mocker):
+    mocker.patch.object(futures.futures_mapping, 'get_mapping', return_value={"2330": "CDF"})
+    dl = mocker.Mock()
+    dl.taiwan_futures_daily.side_effect = [pd.DataFrame(), market_df()]
+
+    snapshot = futures.download_futures_snapshot(dl)
+
+    assert snapshot['stock_id'].tolist() == ["2330"]
+    # 不指定 futures_id，今日無資料時往前一天
+    assert dl.taiwan_futures_daily.call_count == 2
+    assert dl.taiwan_futures_daily.call_args.kwargs['futures_id'] == ''
@@ -0,0 +1,67 @@
+import json
+import os
+import time
+import threading
+import pytest
+from data_modules import futures_mapping
+
+def write_mapping(path, mapping, mtime=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(mapping, f)
+    if mtime:
+        os.utime(path, (mtime, mtime))
+
+@pytest.fixture
+def mapping_file(tmp_path, mocker):
+    path = str(tmp_path / futures_mapping.CACHE_FILE)
+    mocker.patch.object(futures_mapping, 'MAPPING_FILE', path)
+    mocker.patch.dict(futures_mapping._state, {"mapping": None, "mtime": None, "checked_at": float("-inf")})
+    mocker.patch.object(futures_mapping, '_NEGATIVE_CACHE', set())
+    mocker.patch.object(futures_mapping, 'CHECK_INTERVAL', 0)
+    refresher = futures_mapping.ScriptRefresher(
+        "futures_mapping", "unused", lock_file=f"{path}.lock", on_success=futures_mapping._reload_if_changed
+    )
+    mocker.patch.object(futures_mapping, 'futures_refresher', refresher)
+    return path
+
+def test_lookup_and_negative_cache(mapping_file, mocker):
+    write_mapping(mapping_file, {"2330": "CDF"})
+    run_script = mocker.patch.object(futures_mapping.futures_refresher, '_run_script')
+
+    assert futures_mapping.get_futures_id("2330") == "CDF"
+    assert futures_mapping.get_futures_id("9999") is None
+    assert futures_mapping.get_futures_id("9999") is None
+
+    metrics = futures_mapping.get_metrics()
+    assert metrics["negative_hits"] == 1
+    assert metrics["negative_cache_size"] == 1
+    # 查無代號不會觸發刷新
+    run_script.assert_not_called()
+
+def test_file_change_reloads_and_clears_negative_cache(mapping_file, mocker):
+    mocker.patch.object(futures_mapping.futures_refresher, '_run_script')
+    write_mapping(mapping_file, {"2330": "CDF"}, mtime=time.time() - 10)
+    assert futures_mapping.get_futures_id("2002") is None
+
+    write_mapping(mapping_file, {"2330": "CDF", "2002": "CBF"})
+    assert futures_mapping.get_futures_id("2002") == "CBF"
+
+def test_missing_mapping_schedules_async_refresh(mapping_file, mocker):
+    release = threading.Event()
+
+    def slow_script():
+        release.wait(2)
+        write_mapping(mapping_file, {"2330": "CDF"})
+
+    run_script = mocker.patch.object(futures_mapping.futures_refresher, '_run_script', side_effect=slow_script)
+
+    # 請求路徑不等待刷新
+    assert futures_mapping.get_futures_id("2330") is None
+    release.set()
+    assert futures_mapping.futures_refresher.wait(2)
+    run_script.assert_called_once()
+    assert futures_mapping.get_futures_id("2330") == "CDF"
+
+    refresh = futures_mapping.get_metrics()["refresh"]
+    assert refresh["last_ok"] is True
+    assert refresh["last_duration"] is not None
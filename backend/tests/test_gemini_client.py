@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import httpx
+import pytest
+from utils import gemini_client
+
+@pytest.fixture(autouse=True)
+def fresh_holder(mocker):
+    mocker.patch.object(gemini_client, '_client', None)
+    mocker.patch.dict(gemini_client._metrics, {"cold_starts": 0, "reuses": 0, "resets": 0, "cold_init_seconds_total": 0.0})
+    return mocker.patch('utils.gemini_client.genai.Client')
+
+def test_client_created_once_across_threads(fresh_holder):
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(gemini_client.get_client())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert fresh_holder.call_count == 1
+    assert all(c is seen[0] for c in seen)
+    # 連線池設定會傳入 httpx
+    limits = fresh_holder.call_args.kwargs["http_options"].client_args["limits"]
+    assert limits.max_connections == gemini_client.POOL_MAX_CONNECTIONS
+    metrics = gemini_client.get_metrics()
+    assert metrics["cold_starts"] == 1 and metrics["reuses"] == 7
+
+def test_call_with_client_recreates_after_transport_error(fresh_holder):
+    first, second = object(), object()
+    fresh_holder.side_effect = [first, second]
+    calls = []
+
+    def fn(client):
+        calls.append(client)
+        if client is first:
+            raise httpx.ConnectError("connection reset")
+        return "ok"
+
+    assert gemini_client.call_with_client(fn) == "ok"
+    assert calls == [first, second]
+    assert gemini_client.get_metrics()["resets"] == 1
+
+def test_call_with_client_does_not_retry_other_errors(fresh_holder):
+    def fn(client):
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        gemini_client.call_with_client(fn)
+    assert fresh_holder.call_count == 1
+
+def test_acall_with_client_recreates_after_transport_error(fresh_holder):
+    first, second = object(), object()
+    fresh_holder.side_effect = [first, second]
+
+    async def fn(client):
+        if client is first:
+            raise httpx.ConnectError("connection reset")
+        return "ok"
+
+    assert asyncio.run(gemini_client.acall_with_client(fn)) == "ok"
+    assert gemini_client.get_metrics()["resets"] == 1
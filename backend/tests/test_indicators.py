@@ -0,0 +1,96 @@
+import pytest
+import numpy as np
+import pandas as pd
+from utils.indicators import compute_indicators, smooth_kd
+from utils.stock_analysis import analyze_stock
+from utils import bar_cache
+
+def random_ohlcv(rows, seed=0, flat_tail=0, nan_row=None):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, rows)))
+    open_ = close * (1 + rng.normal(0, 0.01, rows))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, rows)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, rows)))
+    volume = rng.integers(1000, 100000, rows).astype(float)
+    if flat_tail:
+        # 高低價相同 -> RSV 分母為 0
+        for arr in (open_, high, low, close):
+            arr[-flat_tail:] = close[-flat_tail]
+    if nan_row is not None:
+        close[nan_row] = np.nan
+    index = pd.date_range("2023-01-02 09:00", periods=rows, freq="h")
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+
+def reference_indicators(df):
+    """原 analyze_stock 的 pandas / 逐列迴圈實作"""
+    ref = {f"ma{w}": df['Close'].rolling(window=w).mean() for w in (5, 10, 20, 60, 120, 240)}
+    ref["vol_ma5"] = df['Volume'].rolling(window=5).mean()
+    low_min = df['Low'].rolling(window=9).min()
+    high_max = df['High'].rolling(window=9).max()
+    rsv = ((df['Close'] - low_min) / (high_max - low_min) * 100).fillna(50)
+    k_values, d_values = [50], [50]
+    for r in rsv:
+        k = (2/3) * k_values[-1] + (1/3) * r
+        d = (2/3) * d_values[-1] + (1/3) * k
+        k_values.append(k)
+        d_values.append(d)
+    ref["rsv"], ref["k"], ref["d"] = rsv, k_values[1:], d_values[1:]
+    recent_60 = df.tail(60)
+    ref["high_60"], ref["low_60"] = recent_60['High'].max(), recent_60['Low'].min()
+    recent_20 = df.tail(20).copy()
+    red_candles = recent_20[recent_20['Close'] > recent_20['Open']]
+    ref["banker_low"] = red_candles.loc[red_candles['Volume'].idxmax()]['Low'] if not red_candles.empty else np.nan
+    return ref
+
+def run_kernel(df):
+    return compute_indicators(*(df[c].to_numpy() for c in ['Open', 'High', 'Low', 'Close', 'Volume']))
+
+@pytest.mark.parametrize("rows,seed,flat_tail,nan_row", [
+    (25, 1, 0, None),
+    (300, 2, 0, None),
+    (700, 3, 12, None),   # 跨越多個 KD 分塊 + 分母為 0
+    (400, 4, 0, 150),     # 含缺值 K 棒
+    (2500, 5, 0, None),   # 長歷史 (分塊遞迴不可溢位)
+])
+def test_kernel_matches_reference(rows, seed, flat_tail, nan_row):
+    df = random_ohlcv(rows, seed, flat_tail, nan_row)
+    ref = reference_indicators(df)
+    out = run_kernel(df)
+
+    for key in ["ma5", "ma10", "ma20", "ma60", "ma120", "ma240", "vol_ma5", "rsv", "k", "d"]:
+        np.testing.assert_allclose(out[key], np.asarray(ref[key], dtype=float), rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=key)
+    for key in ["high_60", "low_60", "banker_low"]:
+        np.testing.assert_allclose(out[key], ref[key], rtol=0, atol=0, equal_nan=True, err_msg=key)
+
+def test_kernel_banker_candle_without_red_candles():
+    df = random_ohlcv(60, seed=6)
+    df['Open'] = df['Close'] + 1 # 全部收黑
+    assert np.isnan(run_kernel(df)["banker_low"])
+
+def test_kernel_supports_2d_batch():
+    frames = [random_ohlcv(300, seed) for seed in range(4)]
+    stacked = [np.stack([f[c].to_numpy() for f in frames]) for c in ['Open', 'High', 'Low', 'Close', 'Volume']]
+    batch = compute_indicators(*stacked)
+    for i, df in enumerate(frames):
+        single = run_kernel(df)
+        for key in ["ma240", "k", "d", "high_60", "banker_low"]:
+            np.testing.assert_allclose(batch[key][i], single[key], rtol=1e-12, equal_nan=True)
+
+def test_smooth_kd_initial_value():
+    np.testing.assert_allclose(smooth_kd(np.array([50.0] * 10)), [50.0] * 10)
+    np.testing.assert_allclose(smooth_kd(np.array([80.0])), [50 * 2/3 + 80 / 3])
+
+def test_analyze_stock_matches_reference_outputs(mocker):
+    df = random_ohlcv(400, seed=7)
+    bar_cache.clear()
+    mocker.patch('utils.stock_analysis.yf.Ticker').return_value.history.return_value = df.copy()
+
+    result = analyze_stock("IND.TW", interval="1d")
+    bar_cache.clear()
+
+    ref = reference_indicators(df)
+    assert result["k"] == round(ref["k"][-1], 2)
+    assert result["d"] == round(ref["d"][-1], 2)
+    assert result["ma240"] == round(float(ref["ma240"].iloc[-1]), 2)
+    assert result["vol_ma5"] == int(ref["vol_ma5"].iloc[-1])
+    assert result["smart_money_support"] == round(float(ref["banker_low"]), 2)
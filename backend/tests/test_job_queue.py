@@ -0,0 +1,48 @@
+import threading
+import time
+import pytest
+from utils.job_queue import JobQueue, QueueFullError
+
+def wait_for(jobs, job_id, status, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get(job_id)
+        if job and job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not reach {status}")
+
+def test_job_runs_and_retains_result():
+    jobs = JobQueue(workers=2, max_queue=5, result_ttl=60)
+    job_id = jobs.submit(lambda a, b: {"answer": a + b}, 1, 2)
+
+    job = wait_for(jobs, job_id, "done")
+    assert job["result"] == {"answer": 3}
+
+def test_job_failure_is_recorded():
+    jobs = JobQueue(workers=1, max_queue=5, result_ttl=60)
+
+    def boom():
+        raise RuntimeError("Vertex down")
+
+    job = wait_for(jobs, jobs.submit(boom), "failed")
+    assert job["error"] == "Vertex down"
+
+def test_submit_rejects_when_queue_full():
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_queue=1, result_ttl=60)
+    running = jobs.submit(release.wait)
+    wait_for(jobs, running, "running")
+    jobs.submit(release.wait) # 佔滿佇列
+
+    with pytest.raises(QueueFullError):
+        jobs.submit(release.wait)
+    assert jobs.stats()["queued"] == 1
+    release.set()
+
+def test_results_expire_after_ttl():
+    jobs = JobQueue(workers=1, max_queue=5, result_ttl=0.05)
+    job_id = jobs.submit(lambda: "ok")
+    wait_for(jobs, job_id, "done")
+    time.sleep(0.1)
+    assert jobs.get(job_id) is None
@@ -0,0 +1,300 @@
+import json
+import time
+import pytest
+import main
+
+def test_fetch_stock_context_merges_sources(mocker):
+    mocker.patch('main.get_precise_data', return_value={"stock_id": "2330.TW", "close": 110.0, "ma20": 100.0})
+    mocker.patch('main.get_60m_data', return_value={"strategy_gold_silver": {"status": "SQUEEZE"}, "ma20": 999})
+    mocker.patch('main.load_cb_mapping', return_value={
+        "2330": [{"cb_id": "23301", "cb_name": "台積一", "conversion_price": 100.0}]
+    })
+
+    context = main.fetch_stock_context("2330")
+
+    assert context["close"] == 110.0
+    assert context["ma20"] == 100.0 # 60分K 不可覆蓋日線均線
+    assert context["strategy_gold_silver"] == {"status": "SQUEEZE"}
+    assert context["has_cb"] is True
+    assert context["cb_list"][0]["deviation_rate"] == 10.0
+    assert context["timed_out_sources"] == []
+
+def test_fetch_stock_context_partial_on_timeout(mocker):
+    def slow_60m(ticker):
+        time.sleep(1)
+        return {"strategy_gold_silver": {"status": "SQUEEZE"}}
+
+    mocker.patch('main.get_precise_data', return_value={"stock_id": "2330.TW", "close": 110.0})
+    mocker.patch('main.get_60m_data', side_effect=slow_60m)
+    mocker.patch('main.load_cb_mapping', return_value={})
+    mocker.patch.dict(main.SOURCE_TIMEOUTS, {"60m": 0.1})
+
+    started = time.monotonic()
+    context = main.fetch_stock_context("2330")
+
+    assert time.monotonic() - started < 0.9
+    assert context["timed_out_sources"] == ["60m"]
+    assert context["close"] == 110.0
+    assert context["strategy_gold_silver"] is None
+    assert context["has_cb"] is False
+
+def test_batch_task_streams_per_ticker(mocker):
+    analyze = mocker.patch('main.analyze_stocks', side_effect=lambda tickers, interval: {
+        t: {"stock_id": f"{t}.TW", "close": 110.0, "interval": interval} for t in tickers
+    })
+    mocker.patch('main.load_cb_mapping', return_value={})
+    mocker.patch('main.get_tickers_by_names', side_effect=lambda names: {
+        name: "2317.TW" if name == "鴻海" else "【資料不足，無法確認】" for name in names
+    })
+    mocker.patch('main.generate_answer', side_effect=lambda q, sp, ctx: f"answer:{q}")
+
+    client = main.app.test_client()
+    response = client.post('/task/batch', json={
+        "tickers": ["2330", "2330.TW"],
+        "names": ["鴻海", "不存在"],
+        "question": "請分析 {ticker}"
+    })
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(l) for l in response.get_data(as_text=True).splitlines()]
+    assert lines[0] == {"name": "不存在", "error": "【資料不足，無法確認】"}
+    answers = {l["ticker"]: l["answer"] for l in lines[1:]}
+    assert answers == {"2330": "answer:請分析 2330", "2317": "answer:請分析 2317"}
+    # 每個週期只呼叫一次批次分析
+    assert sorted(c.args[1] for c in analyze.call_args_list) == ["1d", "60m"]
+    assert analyze.call_args_list[0].args[0] == ["2330", "2317"]
+
+def test_batch_task_async_job(mocker):
+    mocker.patch('main.analyze_stocks', side_effect=lambda tickers, interval: {
+        t: {"stock_id": f"{t}.TW", "close": 110.0} for t in tickers
+    })
+    mocker.patch('main.load_cb_mapping', return_value={})
+    mocker.patch('main.generate_answer', side_effect=lambda q, sp, ctx: f"answer:{q}")
+
+    client = main.app.test_client()
+    response = client.post('/task/batch', json={"tickers": ["2330", "2317"], "question": "請分析 {ticker}", "async": True})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+
+    deadline = time.monotonic() + 5
+    body = client.get(f'/task/{job_id}').get_json()
+    while body["status"] not in ("done", "failed") and time.monotonic() < deadline:
+        time.sleep(0.02)
+        body = client.get(f'/task/{job_id}').get_json()
+    assert body["status"] == "done"
+    assert {r["ticker"]: r["answer"] for r in body["results"]} == {"2330": "answer:請分析 2330", "2317": "answer:請分析 2317"}
+
+def test_batch_fetch_shares_one_deadline(mocker):
+    def analyze(tickers, interval):
+        time.sleep(0.3 if interval == "1d" else 1.0)
+        return {}
+    mocker.patch('main.analyze_stocks', side_effect=analyze)
+    mocker.patch('main.load_cb_mapping', return_value={})
+
+    started = time.monotonic()
+    lines = list(main.iter_batch_results(["2330"], [], "", "", fetch_timeout=0.4))
+
+    # 日線在期限內完成；60分K 只等剩餘的時間 (各自重新計時需 0.7 秒)
+    assert time.monotonic() - started < 0.6
+    assert lines == [{"error": "Batch data fetch timed out after 0.4s"}]
+
+def test_batch_task_requires_tickers():
+    client = main.app.test_client()
+    assert client.post('/task/batch', json={"question": "x"}).status_code == 400
+
+def test_task_streams_context_then_tokens(mocker):
+    mocker.patch('main.fetch_stock_context', return_value={"stock_id": "2330.TW", "close": 110.0})
+    mocker.patch('main.read_prompt_file', return_value=("prompt", None))
+    client_mock = mocker.Mock()
+    client_mock.models.generate_content_stream.return_value = iter([
+        mocker.Mock(text="台積電"), mocker.Mock(text=None), mocker.Mock(text="多頭")
+    ])
+    mocker.patch('main.gemini_client.call_with_client', side_effect=lambda fn: fn(client_mock))
+
+    response = main.app.test_client().post('/task', json={"question": "分析 2330", "stream": True})
+
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    events = [block.split("\n") for block in body.strip().split("\n\n")]
+    assert events[0] == [": accepted"]
+    assert [e[0] for e in events[1:]] == ["event: context", "event: token", "event: token", "event: done"]
+    assert json.loads(events[1][1][len("data: "):])["close"] == 110.0
+    assert json.loads(events[2][1][len("data: "):]) == {"text": "台積電"}
+
+def test_task_non_streaming_contract(mocker):
+    mocker.patch('main.fetch_stock_context', return_value={})
+    mocker.patch('main.generate_answer', return_value="分析結果")
+
+    response = main.app.test_client().post('/task', json={"question": "分析 2330"})
+
+    assert response.get_json() == {"answer": "分析結果"}
+
+def test_task_async_submit_and_poll(mocker):
+    mocker.patch('main.run_task', return_value={"answer": "背景分析結果"})
+    client = main.app.test_client()
+
+    response = client.post('/task', json={"question": "分析 2330", "async": True})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+
+    deadline = time.time() + 2
+    while time.time() < deadline:
+        body = client.get(f'/task/{job_id}').get_json()
+        if body["status"] == "done":
+            break
+        time.sleep(0.01)
+    assert body == {"job_id": job_id, "status": "done", "answer": "背景分析結果"}
+    assert client.get('/task/unknown').status_code == 404
+
+def test_task_async_rejected_when_queue_full(mocker):
+    mocker.patch.object(main.task_jobs, 'submit', side_effect=main.QueueFullError("Task queue is full"))
+
+    response = main.app.test_client().post('/task', json={"question": "分析 2330", "async": True})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+
+def test_ticker_endpoint_batch_and_prefix(mocker):
+    mocker.patch('main.get_tickers_by_names', return_value={"台積電": "2330.TW"})
+    mocker.patch('main.search_tickers_by_prefix', return_value=[{"name": "台積電", "ticker": "2330.TW"}])
+    client = main.app.test_client()
+
+    assert client.post('/ticker', json={"names": ["台積電"]}).get_json() == {"results": {"台積電": "2330.TW"}}
+    assert client.post('/ticker', json={"prefix": "台積"}).get_json()["matches"][0]["ticker"] == "2330.TW"
+    assert client.post('/ticker', json={}).status_code == 400
+
+def test_warm_up_loads_snapshot_and_sets_ready(mocker):
+    mocker.patch.object(main, 'READY', main.threading.Event())
+    mocker.patch('main.ticker_utils.load_stock_info_snapshot', return_value=True)
+    mocker.patch('main.ticker_utils.is_snapshot_stale', return_value=False)
+    refresh = mocker.patch('main.ticker_utils.refresh_stock_info')
+    mocker.patch('main.get_ticker_by_name', return_value="2330.TW")
+    mocker.patch('main.load_cb_mapping', return_value={})
+    client = main.app.test_client()
+
+    assert client.get('/ready').status_code == 503
+    main.warm_up()
+
+    refresh.assert_not_called()
+    assert client.get('/ready').get_json() == {"ready": True}
+
+def test_screen_gold_silver_endpoint(mocker):
+    screen = mocker.patch('main.screen_gold_silver', return_value={"results": [{"ticker": "2330.TW", "status": "SQUEEZE"}]})
+    client = main.app.test_client()
+
+    response = client.post('/screen/gold-silver', json={"status": "SQUEEZE", "limit": 5})
+
+    assert response.get_json()["results"][0]["ticker"] == "2330.TW"
+    screen.assert_called_once_with(None, ["SQUEEZE"], 5)
+    assert client.post('/screen/gold-silver', json={"limit": "many"}).status_code == 400
+
+def test_task_returns_server_timing_and_metrics(mocker):
+    def fake_daily(ticker):
+        with main.timing.span("yf_1d", desc="2330.TW"):
+            time.sleep(0.01)
+        return {"stock_id": "2330.TW", "close": 110.0}
+
+    mocker.patch('main.get_precise_data', side_effect=fake_daily)
+    mocker.patch('main.get_60m_data', return_value={})
+    mocker.patch('main.load_cb_mapping', return_value={})
+    mocker.patch('main.read_prompt_file', return_value=("prompt", None))
+    mocker.patch('main.gemini_client.call_with_client', return_value=mocker.Mock(text="分析結果"))
+    client = main.app.test_client()
+
+    response = client.post('/task', json={"question": "分析 2330"})
+
+    header = response.headers["Server-Timing"]
+    # 執行緒池中的 span 也寫入同一請求
+    for name in ('yf_1d;dur=', 'desc="2330.TW"', 'cb_mapping;dur=', 'context;dur=', 'prompt;dur=',
+                 'serialize;dur=', 'gemini;dur=', 'total;dur='):
+        assert name in header
+    latency = client.get('/metrics').get_json()["latency_ms"]
+    assert latency["yf_1d"]["count"] >= 1 and latency["yf_1d"]["max_ms"] >= 10
+    assert latency["http_execute_task"]["count"] >= 1
+
+def test_read_prompt_file_rereads_only_on_change(tmp_path, mocker):
+    prompt_file = tmp_path / "prompt.txt"
+    prompt_file.write_text("v1", encoding="utf-8")
+    mocker.patch('main.PROMPT_FILE', str(prompt_file))
+    mocker.patch.dict(main._prompt_state, {"cached": None})
+    opened = mocker.patch('builtins.open', wraps=open)
+
+    assert main.read_prompt_file() == ("v1", None)
+    assert main.read_prompt_file() == ("v1", None)
+    assert opened.call_count == 1
+
+    prompt_file.write_text("v2 changed", encoding="utf-8")
+    assert main.read_prompt_file() == ("v2 changed", None)
+    assert opened.call_count == 2
+    prompt_file.unlink()
+    assert main.read_prompt_file()[0] is None
+
+def test_generate_answer_retries_inline_when_cached_prompt_rejected(mocker):
+    from google.genai import errors
+    mocker.patch('main.read_prompt_file', return_value=("prompt", None))
+    mocker.patch('main.prompt_cache.get_cache_name', return_value="cachedContents/gone")
+    invalidate = mocker.patch('main.prompt_cache.invalidate')
+    configs = []
+
+    def fake_call(fn):
+        client = mocker.Mock()
+        def generate_content(model, contents, config):
+            configs.append(config)
+            if config.cached_content:
+                raise errors.ClientError(404, {"error": {"message": "cache not found"}})
+            return mocker.Mock(text="分析結果", usage_metadata=None)
+        client.models.generate_content.side_effect = generate_content
+        return fn(client)
+    mocker.patch('main.gemini_client.call_with_client', side_effect=fake_call)
+
+    assert main.generate_answer("分析 2330", "", {}) == "分析結果"
+    assert [c.cached_content for c in configs] == ["cachedContents/gone", None]
+    assert configs[1].system_instruction == "prompt"
+    invalidate.assert_called_once_with("cachedContents/gone")
+
+def test_task_answer_cache_hit_and_bypass(mocker):
+    main.answer_cache.clear()
+    mocker.patch('main.get_precise_data', return_value={"stock_id": "2330.TW", "close": 110.0, "date": "2024-05-10 00:00"})
+    mocker.patch('main.get_60m_data', return_value={"date": "2024-05-10 12:00", "strategy_gold_silver": None})
+    mocker.patch('main.load_cb_mapping', return_value={})
+    mocker.patch('main.read_prompt_file', return_value=("prompt", None))
+    call = mocker.patch('main.gemini_client.call_with_client', return_value=mocker.Mock(
+        text="分析結果", usage_metadata=mocker.Mock(prompt_token_count=4000, candidates_token_count=800)
+    ))
+    client = main.app.test_client()
+
+    assert client.post('/task', json={"question": "分析 2330"}).get_json() == {"answer": "分析結果"}
+    assert client.post('/task', json={"question": "分析  2330 "}).get_json() == {"answer": "分析結果", "cached": True}
+    assert call.call_count == 1
+
+    # 前端要求略過快取: 重新生成 (並更新快取)
+    assert client.post('/task', json={"question": "分析 2330", "no_cache": True}).get_json() == {"answer": "分析結果"}
+    assert client.post('/task', json={"question": "分析 2330"}, headers={"Cache-Control": "no-cache"}).status_code == 200
+    assert call.call_count == 3
+
+    # 新的 60分K -> 鍵不同，重新生成
+    mocker.patch('main.get_60m_data', return_value={"date": "2024-05-10 13:00", "strategy_gold_silver": None})
+    assert "cached" not in client.post('/task', json={"question": "分析 2330"}).get_json()
+
+    stats = client.get('/metrics').get_json()["answer_cache"]
+    assert (stats["hits"], stats["bypasses"]) == (1, 2)
+    assert stats["avoided_prompt_tokens"] == 4000
+    main.answer_cache.clear()
+
+def test_task_partial_context_is_not_cached(mocker):
+    main.answer_cache.clear()
+    mocker.patch('main.get_precise_data', return_value={"stock_id": "2330.TW", "close": 110.0, "date": "2024-05-10 00:00"})
+    mocker.patch('main.get_60m_data', return_value={"error": "no data"})
+    mocker.patch('main.load_cb_mapping', return_value={})
+    mocker.patch('main.generate_answer', return_value="分析結果")
+
+    main.run_task("分析 2330", "")
+    assert main.run_task("分析 2330", "") == {"answer": "分析結果"}
+    assert main.answer_cache.get_stats()["stores"] == 0
+
+def test_metrics_include_futures_refresh_stats():
+    metrics = main.app.test_client().get('/metrics').get_json()
+    assert {"lookups", "hits", "mapping_size", "refresh"} <= set(metrics["futures_mapping"])
+    assert {"last_ok", "last_duration", "running"} <= set(metrics["futures_mapping"]["refresh"])
+    assert "running" in metrics["futures_snapshot_refresh"]
@@ -0,0 +1,102 @@
+import datetime
+import pytest
+from google.genai import errors
+from utils import prompt_cache
+
+LONG_PROMPT = "策略" * 3000
+
+class FakeCaches:
+    """離線的 caches API: 記錄呼叫並回傳帶有 expire_time 的物件"""
+
+    def __init__(self, mocker, ttl=3600, existing=()):
+        self.mocker = mocker
+        self.ttl = ttl
+        self.existing = list(existing)
+        self.created = []
+        self.updated = []
+
+    def _cached(self, name, display_name=None, model="gemini-test", ttl=None):
+        expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=ttl or self.ttl)
+        return self.mocker.Mock(name=name, display_name=display_name, model=model, expire_time=expire)
+
+    def list(self):
+        return iter(self.existing)
+
+    def create(self, model, config):
+        self.created.append(config)
+        cached = self._cached(f"cachedContents/{len(self.created)}", config.display_name, model)
+        cached.name = f"cachedContents/{len(self.created)}"
+        return cached
+
+    def update(self, name, config):
+        self.updated.append((name, config.ttl))
+        cached = self._cached(name)
+        cached.name = name
+        return cached
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    prompt_cache.clear()
+    yield
+    prompt_cache.clear()
+
+@pytest.fixture
+def client(mocker):
+    fake = mocker.Mock()
+    fake.caches = FakeCaches(mocker)
+    return fake
+
+def test_short_prompt_stays_inline(client):
+    config = prompt_cache.build_config("gemini-test", "短 prompt", tools=None, client=client, temperature=0.3)
+    assert config.cached_content is None
+    assert config.system_instruction == "短 prompt"
+    assert client.caches.created == []
+    assert prompt_cache.get_metrics()["inline_requests"] == 1
+
+def test_large_prompt_cached_once_and_referenced_by_name(client):
+    first = prompt_cache.build_config("gemini-test", LONG_PROMPT, client=client, temperature=0.3)
+    second = prompt_cache.build_config("gemini-test", LONG_PROMPT, client=client, temperature=0.3)
+
+    assert first.cached_content == second.cached_content == "cachedContents/1"
+    assert first.system_instruction is None and first.temperature == 0.3
+    assert len(client.caches.created) == 1
+    assert client.caches.created[0].system_instruction == LONG_PROMPT
+    assert client.caches.created[0].ttl == f"{prompt_cache.TTL_SECONDS}s"
+    assert prompt_cache.get_metrics()["cached_requests"] == 2
+
+def test_renews_when_close_to_expiry(client, mocker):
+    prompt_cache.get_cache_name("gemini-test", LONG_PROMPT, client=client)
+    entry = next(iter(prompt_cache._entries.values()))
+    entry["expires_at"] -= prompt_cache.TTL_SECONDS - prompt_cache.RENEW_BEFORE / 2
+
+    assert prompt_cache.get_cache_name("gemini-test", LONG_PROMPT, client=client) == "cachedContents/1"
+    assert client.caches.updated == [("cachedContents/1", f"{prompt_cache.TTL_SECONDS}s")]
+    assert len(client.caches.created) == 1
+
+def test_reuses_cache_created_by_another_instance(client, mocker):
+    display_name = prompt_cache.DISPLAY_PREFIX + prompt_cache._key("gemini-test", LONG_PROMPT, None)[:16]
+    existing = client.caches._cached("cachedContents/shared", display_name,
+                                     "projects/p/locations/l/publishers/google/models/gemini-test")
+    existing.name = "cachedContents/shared"
+    client.caches.existing = [existing]
+
+    assert prompt_cache.get_cache_name("gemini-test", LONG_PROMPT, client=client) == "cachedContents/shared"
+    assert client.caches.created == []
+
+def test_failure_falls_back_inline_and_backs_off(client, mocker):
+    client.caches.create = mocker.Mock(side_effect=errors.ClientError(400, {"error": {"message": "too small"}}))
+
+    assert prompt_cache.build_config("gemini-test", LONG_PROMPT, client=client).system_instruction == LONG_PROMPT
+    assert prompt_cache.get_cache_name("gemini-test", LONG_PROMPT, client=client) is None
+    assert client.caches.create.call_count == 1  # RETRY_AFTER 內不再嘗試
+    assert prompt_cache.get_metrics()["failures"] == 1
+
+def test_invalidate_and_usage_metrics(client, mocker):
+    name = prompt_cache.get_cache_name("gemini-test", LONG_PROMPT, client=client)
+    prompt_cache.invalidate(name)
+    assert prompt_cache.get_metrics()["entries"] == 0
+
+    prompt_cache.record_usage(mocker.Mock(prompt_token_count=6000, cached_content_token_count=5000))
+    prompt_cache.record_usage(None)
+    metrics = prompt_cache.get_metrics()
+    assert metrics["cached_token_ratio"] == round(5000 / 6000, 4)
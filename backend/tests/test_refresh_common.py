@@ -0,0 +1,116 @@
+import io
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import pytest
+from scripts import refresh_common
+from scripts import update_cb_mapping
+from data_modules.cb import CBMapping
+
+class StubServer:
+    """本機 HTTP stub: 支援 ETag / Last-Modified，可關閉驗證標頭以測試內容雜湊"""
+
+    def __init__(self):
+        self.payload = b"v1"
+        self.validators = True
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(dict(self.headers))
+                etag = f'"{refresh_common.sha256(stub.payload)[:16]}"'
+                if stub.validators and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if stub.validators:
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", "Fri, 26 Jan 2024 00:00:00 GMT")
+                self.send_header("Content-Length", str(len(stub.payload)))
+                self.end_headers()
+                self.wfile.write(stub.payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/data"
+        threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+@pytest.fixture
+def server():
+    stub = StubServer()
+    refresh_common.reset_stats()
+    yield stub
+    stub.httpd.shutdown()
+    stub.httpd.server_close()
+
+def test_etag_not_modified_skips_body(server, tmp_path):
+    state_file = str(tmp_path / "data.fetch.json")
+    server.payload = b"x" * 1000
+
+    first = refresh_common.conditional_get(server.url, state_file)
+    assert first.status == refresh_common.CHANGED and first.content == server.payload
+    first.commit()
+
+    second = refresh_common.conditional_get(server.url, state_file)
+    assert second.status == refresh_common.NOT_MODIFIED and second.content is None
+    assert server.requests[-1]["If-None-Match"]
+    assert refresh_common.stats == {"requests": 2, "bytes_transferred": 1000, "bytes_skipped": 1000}
+
+def test_content_hash_detects_unchanged_without_validators(server, tmp_path):
+    state_file = str(tmp_path / "data.fetch.json")
+    server.validators = False
+
+    refresh_common.conditional_get(server.url, state_file).commit()
+    assert refresh_common.conditional_get(server.url, state_file).status == refresh_common.UNCHANGED
+
+    server.payload = b"v2"
+    assert refresh_common.conditional_get(server.url, state_file).status == refresh_common.CHANGED
+
+def test_uncommitted_fetch_is_retried(server, tmp_path):
+    state_file = str(tmp_path / "data.fetch.json")
+
+    refresh_common.conditional_get(server.url, state_file)  # 寫入輸出失敗，未 commit
+    assert refresh_common.conditional_get(server.url, state_file).changed
+    assert "If-None-Match" not in server.requests[-1]
+
+def test_atomic_write_json_skips_identical_content(tmp_path):
+    path = str(tmp_path / "mapping.json")
+
+    assert refresh_common.atomic_write_json(path, {"2330": "CDF"}) is True
+    os.utime(path, (1, 1))
+    assert refresh_common.atomic_write_json(path, {"2330": "CDF"}) is False
+    # 未重寫但更新 mtime，讀取端的過期判斷視為最新
+    assert os.path.getmtime(path) > 1
+    assert refresh_common.atomic_write_json(path, {"2330": "CDF", "2002": "CBF"}) is True
+    assert os.listdir(tmp_path) == ["mapping.json"]
+
+def test_update_cb_mapping_skips_unchanged_excel(server, tmp_path, mocker):
+    df = pd.DataFrame({'債券代號': ['47631'], '標的債券': ['材料一'], '轉換價格': [100], '轉換標的代碼': [4763]})
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    server.payload = buffer.getvalue()
+    output = str(tmp_path / "cb_mapping.npz")
+    mocker.patch.object(update_cb_mapping, 'URL', server.url)
+    mocker.patch.object(update_cb_mapping, 'OUTPUT_FILE', output)
+    mocker.patch.object(update_cb_mapping, 'STATE_FILE', f"{output}.fetch.json")
+    mocker.patch.object(update_cb_mapping, 'LOG_FILE', str(tmp_path / "cb_download.log"))
+    parse = mocker.spy(update_cb_mapping, 'read_issued_cb_excel')
+
+    assert update_cb_mapping.update_cb_mapping() is True
+    assert CBMapping.load(output).to_dict() == {
+        "4763": [{"cb_id": "47631", "cb_name": "材料一", "conversion_price": 100.0}]
+    }
+    assert update_cb_mapping.update_cb_mapping() is True
+
+    parse.assert_called_once()
+    assert refresh_common.stats["bytes_skipped"] == len(server.payload)
+
+    # 輸出檔遺失時忽略 ETag，強制完整下載
+    os.remove(output)
+    assert update_cb_mapping.update_cb_mapping() is True
+    assert os.path.exists(output)
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import screener, ticker_utils
+from utils.stock_analysis import check_gold_wrapped_silver
+
+def make_frames(count, seed=0):
+    frames = {}
+    for i in range(count):
+        rng = np.random.default_rng(seed + i)
+        n = int(rng.integers(200, 320))
+        close = 100 * np.exp(np.cumsum(rng.normal(rng.normal(0, 0.002), rng.choice([0.001, 0.004, 0.01]), n)))
+        volume = rng.integers(1000, 100000, n).astype(float)
+        if i % 3 == 0:
+            volume[-1] *= 3
+        frames[f"{1000 + i}.TW"] = pd.DataFrame({"Close": close, "Volume": volume})
+    return frames
+
+def per_ticker_state(df):
+    df = df.copy()
+    for w in (5, 10, 20, 60, 120, 240):
+        df[f"MA{w}"] = df["Close"].rolling(w).mean()
+    df["VolMA5"] = df["Volume"].rolling(5).mean()
+    return check_gold_wrapped_silver(df)
+
+def test_screen_arrays_matches_per_ticker_check():
+    frames = make_frames(150)
+    symbols = list(frames)
+
+    state = screener.screen_arrays(*screener.stack_bars(frames, symbols))
+
+    for i, symbol in enumerate(symbols):
+        expected = per_ticker_state(frames[symbol])
+        assert state["status"][i] == expected["status"]
+        assert state["pattern_type"][i] == expected["pattern_type"]
+        assert state["ma60_trend"][i] == expected["ma60_trend"]
+        assert round(float(state["convergence_rate"][i]), 3) == expected["convergence_rate"]
+    # 樣本需涵蓋多種形態，避免全部為 NONE 而失去比對意義
+    assert len(set(state["status"].tolist())) >= 4
+
+def test_process_pool_matches_inline(mocker):
+    frames = make_frames(7, seed=100)
+    arrays = screener.stack_bars(frames, list(frames))
+    inline = screener.screen_arrays(*arrays)
+
+    mocker.patch.object(screener, 'SCREEN_CHUNK_SIZE', 2)
+    mocker.patch.object(screener, 'SCREEN_PROCESSES', 2)
+    pooled = screener.screen_arrays(*arrays)
+
+    for key in inline:
+        np.testing.assert_array_equal(pooled[key], inline[key])
+
+def test_screen_gold_silver_ranks_by_convergence(mocker):
+    frames = make_frames(300)
+    frames["9999.TW"] = frames["1000.TW"].iloc[:10]  # K 棒不足，不列入篩選
+    eligible = sum(len(df) >= screener.SCREEN_MIN_BARS for df in frames.values())
+    mocker.patch.object(screener, 'get_universe', return_value={s: f"股票{s[:4]}" for s in frames})
+    fetch = mocker.patch.object(screener, 'fetch_bulk_history', side_effect=lambda symbols, interval: {
+        s: frames[s] for s in symbols
+    })
+    mocker.patch.object(screener, 'SCREEN_DOWNLOAD_BATCH', 100)
+
+    result = screener.screen_gold_silver(limit=10)
+
+    assert result["universe"] == 301 and result["screened"] == eligible
+    assert fetch.call_count == 4
+    rates = [r["convergence_rate"] for r in result["results"]]
+    assert len(rates) == min(10, result["matched"]) and rates == sorted(rates)
+    assert all(r["status"] != "NONE" for r in result["results"])
+    assert result["results"][0]["name"] == f"股票{result['results'][0]['ticker'][:4]}"
+
+    squeezed = screener.screen_gold_silver(statuses=["SQUEEZE"], limit=1000)
+    assert squeezed["results"] and {r["status"] for r in squeezed["results"]} == {"SQUEEZE"}
+
+def test_screen_gold_silver_accepts_stock_ids(mocker):
+    mocker.patch.object(ticker_utils, 'get_market_suffix', side_effect=lambda t: ".TWO" if t == "8299" else None)
+    fetch = mocker.patch.object(screener, 'fetch_bulk_history', return_value={})
+
+    result = screener.screen_gold_silver(["2330", "8299", "AAPL"])
+
+    fetch.assert_called_once_with(["2330.TW", "8299.TWO", "AAPL"], "60m")
+    assert result["results"] == [] and result["screened"] == 0
+
+def test_screen_gold_silver_excludes_tickers_without_ma240(mocker):
+    # 100 根 K 棒: 單檔分析不判讀金包銀 (MA240 不足)，篩選也不可改以 MA120 判讀
+    frames = make_frames(2, seed=200)
+    frames["1000.TW"] = frames["1000.TW"].iloc[:100]
+    frames["1001.TW"] = pd.concat([frames["1001.TW"]] * 2, ignore_index=True)
+    mocker.patch.object(screener, 'fetch_bulk_history', return_value=frames)
+
+    result = screener.screen_gold_silver(list(frames), statuses=list(screener.GOLD_SILVER_DESCRIPTIONS))
+
+    assert result["screened"] == 1
+    assert [r["ticker"] for r in result["results"]] == ["1001.TW"]
@@ -0,0 +1,77 @@
+import time
+import threading
+import pytest
+from utils.single_flight import SingleFlight, SingleFlightTimeout
+
+def run_concurrently(n, target):
+    results, errors = [None] * n, [None] * n
+    def worker(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"rows": 42}
+
+    threads, results, errors = run_concurrently(5, lambda: flight.do("2330", fetch, timeout=5))
+    while flight.get_stats()["coalesced"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert errors == [None] * 5
+    assert all(r is results[0] for r in results)
+    stats = flight.get_stats()
+    assert stats["executions"] == 1 and stats["coalesced"] == 4 and stats["in_flight"] == 0
+
+    # 完成後的新呼叫重新執行
+    assert flight.do("2330", fetch) == {"rows": 42}
+    assert len(calls) == 2
+
+def test_error_propagates_to_all_waiters():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    def fetch():
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    threads, results, errors = run_concurrently(3, lambda: flight.do("key", fetch, timeout=5))
+    while flight.get_stats()["coalesced"] < 2:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert flight.get_stats()["errors"] == 1
+
+def test_waiter_timeout_does_not_cancel_leader():
+    flight = SingleFlight("test", timeout=0.05)
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do("key", lambda: release.wait(5) and "done"))
+    leader.start()
+    while flight.get_stats()["in_flight"] == 0:
+        time.sleep(0.001)
+
+    with pytest.raises(SingleFlightTimeout):
+        flight.do("key", lambda: "never runs")
+    # 不同 key 不受影響
+    assert flight.do("other", lambda: "other") == "other"
+
+    release.set()
+    leader.join()
+    stats = flight.get_stats()
+    assert stats["timeouts"] == 1 and stats["executions"] == 2 and stats["in_flight"] == 0
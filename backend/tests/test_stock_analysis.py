@@ -2,7 +2,16 @@ import pytest
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from utils.stock_analysis import analyze_stock, get_precise_data, get_60m_data, check_gold_wrapped_silver
+from utils.stock_analysis import analyze_stock, analyze_stocks, get_precise_data, get_60m_data, check_gold_wrapped_silver
+from utils import bar_cache, ticker_utils
+
+@pytest.fixture
+def suffix_index(tmp_path, mocker):
+    mocker.patch.object(ticker_utils, 'SUFFIX_INDEX_FILE', str(tmp_path / "market_suffix_index.json"))
+    mocker.patch.object(ticker_utils, '_SUFFIX_INDEX', None)
+    bar_cache.clear()
+    yield ticker_utils
+    bar_cache.clear()
 
 def generate_mock_df(rows=300):
     dates = [datetime.now() - timedelta(hours=i) for i in range(rows)]
@@ -110,3 +119,54 @@ def test_analyze_stock_success(mocker):
     assert 'k' in result
     assert 'd' in result
     assert 'kd_signal' in result
+
+def test_analyze_stock_uses_known_suffix(mocker, suffix_index):
+    suffix_index.record_market_suffix("8299", ".TWO")
+    mock_yf = mocker.patch('utils.stock_analysis.yf.Ticker')
+    mock_yf.return_value.history.return_value = generate_mock_df(300)
+
+    result = analyze_stock("8299", interval="1d")
+
+    assert result['stock_id'] == "8299.TWO"
+    assert [c.args[0] for c in mock_yf.call_args_list] == ["8299.TWO"]
+
+def test_analyze_stock_records_probed_suffix(mocker, suffix_index):
+    def ticker(symbol):
+        t = mocker.Mock()
+        t.history.return_value = generate_mock_df(300) if symbol.endswith(".TWO") else pd.DataFrame()
+        return t
+    mocker.patch('utils.stock_analysis.yf.Ticker', side_effect=ticker)
+
+    result = analyze_stock("6488", interval="1d")
+
+    assert result['stock_id'] == "6488.TWO"
+    assert suffix_index.get_market_suffix("6488") == ".TWO"
+    # 重新由磁碟載入仍保留探測結果
+    suffix_index._SUFFIX_INDEX = None
+    assert suffix_index.get_market_suffix("6488") == ".TWO"
+
+def test_analyze_stocks_bulk_download_with_suffix_retry(mocker, suffix_index):
+    suffix_index.record_market_suffix("2330", ".TW")
+
+    def download(symbols, **kwargs):
+        # 只有 2330.TW 與 6488.TWO 有資料
+        frames = {s: generate_mock_df(300) for s in symbols if s in ("2330.TW", "6488.TWO")}
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis=1)
+    mock_download = mocker.patch('utils.stock_analysis.yf.download', side_effect=download)
+
+    results = analyze_stocks(["2330", "6488", "9999"], interval="1d")
+
+    assert results["2330"]["stock_id"] == "2330.TW"
+    assert results["6488"]["stock_id"] == "6488.TWO"
+    assert "error" in results["9999"]
+    assert [c.args[0] for c in mock_download.call_args_list] == [
+        ["2330.TW", "6488.TW", "9999.TW"],
+        ["6488.TWO", "9999.TWO"],
+    ]
+    assert suffix_index.get_market_suffix("6488") == ".TWO"
+
+    # 再次批次分析時，未過期的快取不重複下載
+    analyze_stocks(["2330", "6488"], interval="1d")
+    assert mock_download.call_count == 2
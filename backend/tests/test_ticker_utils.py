@@ -1,8 +1,15 @@
+import json
 import pytest
 import pandas as pd
 from utils.ticker_utils import get_ticker_by_name
 from utils import ticker_utils
 
+@pytest.fixture(autouse=True)
+def data_files(tmp_path, mocker):
+    mocker.patch.object(ticker_utils, 'SUFFIX_INDEX_FILE', str(tmp_path / "market_suffix_index.json"))
+    mocker.patch.object(ticker_utils, '_SUFFIX_INDEX', None)
+    mocker.patch.object(ticker_utils, 'SNAPSHOT_FILE', str(tmp_path / "stock_info_snapshot.csv"))
+
 @pytest.fixture
 def mock_stock_info():
     data = {
@@ -27,6 +34,20 @@ def test_get_ticker_by_name_success(mocker, mock_stock_info):
     # 測試上櫃股票
     assert get_ticker_by_name("欣銓") == "8299.TWO"
 
+def test_suffix_index_built_from_stock_info(mocker, mock_stock_info):
+    ticker_utils.CACHED_STOCK_INFO = None
+    mock_dl = mocker.patch('utils.ticker_utils.DataLoader')
+    mock_dl.return_value.taiwan_stock_info.return_value = mock_stock_info
+
+    get_ticker_by_name("台積電")
+
+    assert ticker_utils.get_market_suffix("2330") == ".TW"
+    assert ticker_utils.get_market_suffix("8299") == ".TWO"
+    assert ticker_utils.get_market_suffix("9999") is None
+    assert [ticker_utils.to_symbol(t) for t in ("8299", " 9999", "AAPL")] == ["8299.TWO", "9999.TW", "AAPL"]
+    with open(ticker_utils.SUFFIX_INDEX_FILE, encoding='utf-8') as f:
+        assert json.load(f)["2317"] == ".TW"
+
 def test_get_ticker_by_name_not_found(mocker, mock_stock_info):
     ticker_utils.CACHED_STOCK_INFO = mock_stock_info
     
@@ -40,3 +61,61 @@ def test_get_ticker_by_name_exception(mocker):
     
     result = get_ticker_by_name("台積電")
     assert "【查詢發生錯誤: API Error】" in result
+
+@pytest.fixture
+def full_stock_info():
+    return pd.DataFrame({
+        'stock_id': ['2330', '2330', '3665', '2317', '2303', '6488'],
+        'stock_name': ['台積電', '台積電', '貿聯-KY', '鴻海', '聯電', '環球晶'],
+        'type': ['twse', 'twse', 'twse', 'twse', 'twse', 'tpex']
+    })
+
+def test_get_ticker_by_name_normalized(full_stock_info):
+    ticker_utils.CACHED_STOCK_INFO = full_stock_info
+
+    assert get_ticker_by_name("貿聯-KY") == "3665.TW"
+    assert get_ticker_by_name("貿聯") == "3665.TW"
+    assert get_ticker_by_name("貿聯－ｋｙ") == "3665.TW"
+    assert get_ticker_by_name(" 台積電 ") == "2330.TW"
+
+def test_get_tickers_by_names_batch(full_stock_info):
+    ticker_utils.CACHED_STOCK_INFO = full_stock_info
+
+    result = ticker_utils.get_tickers_by_names(["台積電", "環球晶", "不存在"])
+    assert result == {"台積電": "2330.TW", "環球晶": "6488.TWO", "不存在": "【資料不足，無法確認】"}
+
+def test_search_tickers_by_prefix(full_stock_info):
+    ticker_utils.CACHED_STOCK_INFO = full_stock_info
+
+    assert ticker_utils.search_tickers_by_prefix("台") == [{"name": "台積電", "ticker": "2330.TW"}]
+    assert [m["ticker"] for m in ticker_utils.search_tickers_by_prefix("聯")] == ["2303.TW"]
+    assert ticker_utils.search_tickers_by_prefix("無") == []
+
+def test_name_index_rebuilt_when_stock_info_changes(full_stock_info, mock_stock_info):
+    ticker_utils.CACHED_STOCK_INFO = full_stock_info
+    assert get_ticker_by_name("聯電") == "2303.TW"
+
+    ticker_utils.CACHED_STOCK_INFO = mock_stock_info
+    assert get_ticker_by_name("聯電") == "【資料不足，無法確認】"
+
+def test_download_writes_snapshot_used_on_next_boot(mocker, mock_stock_info):
+    ticker_utils.CACHED_STOCK_INFO = None
+    mock_dl = mocker.patch('utils.ticker_utils.DataLoader')
+    mock_dl.return_value.taiwan_stock_info.return_value = mock_stock_info
+    assert get_ticker_by_name("欣銓") == "8299.TWO"
+    assert not ticker_utils.is_snapshot_stale()
+
+    # 模擬重新啟動: 由快照載入，不再呼叫 FinMind
+    ticker_utils.CACHED_STOCK_INFO = None
+    mock_dl.reset_mock()
+    assert get_ticker_by_name("欣銓") == "8299.TWO"
+    mock_dl.assert_not_called()
+    assert ticker_utils.CACHED_STOCK_INFO['stock_id'].tolist() == ['2330', '8299', '2317']
+
+def test_snapshot_stale_when_missing_or_old(mocker):
+    assert ticker_utils.is_snapshot_stale()
+    with open(ticker_utils.SNAPSHOT_FILE, 'w', encoding='utf-8') as f:
+        f.write("stock_id,stock_name,type\n")
+    assert not ticker_utils.is_snapshot_stale()
+    mocker.patch.object(ticker_utils, 'SNAPSHOT_MAX_AGE', -1)
+    assert ticker_utils.is_snapshot_stale()
@@ -0,0 +1,60 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils import timing
+
+@pytest.fixture(autouse=True)
+def clean_histograms():
+    timing.reset()
+    yield
+    timing.reset()
+
+def test_span_records_trace_and_histogram():
+    trace = timing.Trace()
+    with timing.use_trace(trace):
+        with timing.span("yf_1d", desc='2330"TW'):
+            pass
+        with timing.span("yf_1d"):
+            pass
+    with timing.span("outside"):  # 沒有 Trace 時只計入直方圖
+        pass
+
+    assert [name for name, _, _ in trace.spans] == ["yf_1d", "yf_1d"]
+    header = trace.server_timing(12.0)
+    assert header.startswith('yf_1d;dur=') and 'desc="2330TW"' in header
+    assert header.endswith("total;dur=12.0")
+    hist = timing.get_histograms()
+    assert hist["yf_1d"]["count"] == 2 and hist["outside"]["count"] == 1
+
+def test_bind_propagates_trace_to_thread_pool():
+    trace = timing.Trace()
+    with timing.use_trace(trace), ThreadPoolExecutor(2) as pool:
+        work = timing.span("cb_mapping")(lambda: threading.current_thread().name)
+        pool.submit(timing.bind(work)).result()
+        pool.submit(work).result()  # 未 bind: 不寫入 Trace
+    assert list(trace.totals()) == ["cb_mapping"]
+    assert timing.get_histograms()["cb_mapping"]["count"] == 2
+
+def test_histogram_buckets_and_quantiles():
+    for ms in [1] * 90 + [300] * 9 + [100000]:
+        timing.observe("gemini", ms)
+    hist = timing.get_histograms()["gemini"]
+    assert hist["buckets"]["<=5"] == 90
+    assert hist["buckets"]["<=250"] == 90
+    assert hist["buckets"]["<=500"] == 99
+    assert hist["buckets"]["+Inf"] == 100
+    assert (hist["p50_ms"], hist["p95_ms"], hist["p99_ms"]) == (5, 500, 500)
+    assert hist["max_ms"] == 100000
+
+def test_traced_job_logs_json(capsys):
+    def job(x):
+        with timing.span("gemini"):
+            return x * 2
+
+    assert timing.traced(job, "job_task", async_job=True)(21) == 42
+    entry = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert entry["severity"] == "INFO"
+    assert set(entry["spans_ms"]) == {"gemini"}
+    assert entry["async_job"] is True
+    assert timing.get_histograms()["job_task"]["count"] == 1
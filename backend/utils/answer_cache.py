@@ -0,0 +1,159 @@
+import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# /task 分析結果快取:
+# 同一檔股票、相同問題與 System Prompt，且最新日線 / 60分K 時間戳相同時，直接回傳上次的 Gemini 回答。
+# 盤中最新一根 60分K 仍在變動，因此項目最多保留到下一根 60分K 收盤 (之後一定重新生成)。
+
+MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "256"))
+ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") != "0"
+
+# 台股 60分K 收盤時間 (台北時間，週一至週五)
+TAIPEI = timezone(timedelta(hours=8))
+BAR_CLOSES = [
+    tuple(int(part) for part in t.split(":"))
+    for t in os.environ.get("ANSWER_CACHE_BAR_CLOSES", "10:00,11:00,12:00,13:00,13:30").split(",")
+]
+
+# 估算省下的 Vertex 費用 (美元 / 百萬 tokens，預設為 gemini-2.0-flash 定價)
+INPUT_PRICE_PER_M = float(os.environ.get("GEMINI_INPUT_PRICE_PER_M", "0.15"))
+OUTPUT_PRICE_PER_M = float(os.environ.get("GEMINI_OUTPUT_PRICE_PER_M", "0.60"))
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> _Entry
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "bypasses": 0,
+    "stores": 0,
+    "expirations": 0,
+    "evictions": 0,
+    "avoided_prompt_tokens": 0,
+    "avoided_output_tokens": 0,
+    "avoided_generation_seconds": 0.0,
+}
+
+
+class _Entry:
+    __slots__ = ("answer", "expires_at", "prompt_tokens", "output_tokens", "generation_seconds")
+
+    def __init__(self, answer, expires_at, prompt_tokens, output_tokens, generation_seconds):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.generation_seconds = generation_seconds
+
+
+def normalize_question(question: str) -> str:
+    """全形轉半形、去除多餘空白、英文轉小寫 (只差在空白或大小寫的問題視為相同)"""
+    question = unicodedata.normalize("NFKC", question or "")
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+def make_key(ticker: str, question: str, system_prompt: str, daily_bar: str, m60_bar: str) -> str:
+    """快取鍵: 股票代號 + 正規化問題 + System Prompt 雜湊 + 最新日線 / 60分K 時間戳"""
+    prompt_hash = hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+    parts = [str(ticker), normalize_question(question), prompt_hash, str(daily_bar), str(m60_bar)]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def next_bar_close(now: float = None) -> float:
+    """下一根 60分K 的收盤時間 (epoch 秒)；收盤後與週末順延到下一個交易日的第一根"""
+    current = datetime.fromtimestamp(time.time() if now is None else now, TAIPEI)
+    day = current.replace(hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(8):
+        if day.weekday() < 5:
+            for hour, minute in BAR_CLOSES:
+                close = day.replace(hour=hour, minute=minute)
+                if close > current:
+                    return close.timestamp()
+        day += timedelta(days=1)
+    return current.timestamp()
+
+
+def usage_from_metadata(usage_metadata) -> dict:
+    """由 Gemini 回應的 usage_metadata 取出 prompt / output token 數"""
+    usage = {}
+    for field, name in (("prompt_token_count", "prompt_tokens"), ("candidates_token_count", "output_tokens")):
+        value = getattr(usage_metadata, field, None)
+        if isinstance(value, int):
+            usage[name] = value
+    return usage
+
+
+def get(key: str):
+    """查詢快取，命中時回傳回答並累計省下的 tokens / 生成時間，未命中或已過期回傳 None"""
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            del _entries[key]
+            _stats["expirations"] += 1
+            entry = None
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        _stats["avoided_prompt_tokens"] += entry.prompt_tokens
+        _stats["avoided_output_tokens"] += entry.output_tokens
+        _stats["avoided_generation_seconds"] += entry.generation_seconds
+        return entry.answer
+
+
+def put(key: str, answer: str, usage: dict = None, generation_seconds: float = 0.0, now: float = None):
+    """寫入回答 (到下一根 60分K 收盤為止有效)，超過 MAX_ENTRIES 時淘汰最久未使用的項目"""
+    usage = usage or {}
+    entry = _Entry(
+        answer,
+        next_bar_close(now),
+        int(usage.get("prompt_tokens") or 0),
+        int(usage.get("output_tokens") or 0),
+        float(generation_seconds),
+    )
+    with _lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        _stats["stores"] += 1
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def record_bypass():
+    with _lock:
+        _stats["bypasses"] += 1
+
+
+def get_stats() -> dict:
+    """
+    命中率與省下的花費。
+    avoided_cost_usd: 命中時免去的 Gemini 呼叫以 prompt / output token 定價估算 (未扣除 context caching 折扣)
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_entries)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["avoided_generation_seconds"] = round(stats["avoided_generation_seconds"], 2)
+    stats["avoided_cost_usd"] = round(
+        stats["avoided_prompt_tokens"] / 1e6 * INPUT_PRICE_PER_M
+        + stats["avoided_output_tokens"] / 1e6 * OUTPUT_PRICE_PER_M, 6
+    )
+    stats["max_entries"] = MAX_ENTRIES
+    return stats
+
+
+def clear():
+    """清空快取與統計 (測試用)"""
+    with _lock:
+        _entries.clear()
+        for key in _stats:
+            _stats[key] = 0.0 if isinstance(_stats[key], float) else 0
@@ -0,0 +1,34 @@
+import os
+from contextlib import contextmanager
+
+# 原子寫入: 先寫入 pid 後綴的暫存檔並 fsync，再以 os.replace 取代目標檔案。
+# 讀取端 (含其他 gunicorn worker 與已映射舊檔的讀取端) 只會看到完整的舊檔或新檔；
+# 多個行程同時寫入時各自使用不同暫存檔，寫入失敗時清除暫存檔。
+
+
+@contextmanager
+def atomic_write(path: str):
+    """
+    以二進位模式開啟暫存檔供寫入，區塊正常結束後 fsync 並取代 path。
+
+    Usage:
+        with atomic_write(path) as f:
+            np.savez(f, ...)
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """以原子寫入輸出 data"""
+    with atomic_write(path) as f:
+        f.write(data)
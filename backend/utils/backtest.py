@@ -0,0 +1,129 @@
+import time
+
+import numpy as np
+import pandas as pd
+try:
+    from .indicators import compute_signal_series
+    from .bar_cache import BAR_COLUMNS
+except ImportError:
+    from indicators import compute_signal_series
+    from bar_cache import BAR_COLUMNS
+
+# 前瞻報酬的觀察天數 (K 棒數)
+HORIZONS = (1, 5, 20)
+# analyze_stock 至少需要 20 根 K 棒，之前的 K 棒不列入統計
+MIN_BARS = 20
+
+# 各訊號的預期方向 (+1 看多 / -1 看空)，命中 = 前瞻報酬與預期方向同號
+SIGNAL_DIRECTIONS = {
+    "kd_signal": {"GOLDEN_CROSS": 1, "DEAD_CROSS": -1, "HIGH_PASSIVATION": 1, "LOW_PASSIVATION": -1},
+    "breakdown_signal": {"TRUE_BREAKDOWN": -1, "BREAKDOWN": -1, "WASH_SALE": 1},
+}
+
+
+def forward_returns(close: np.ndarray, horizon: int) -> np.ndarray:
+    """close[t + horizon] / close[t] - 1，尾端不足 horizon 根為 NaN"""
+    out = np.full(close.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[:-horizon] = close[horizon:] / close[:-horizon] - 1
+    return out
+
+
+def future_extreme(x: np.ndarray, horizon: int, func) -> np.ndarray:
+    """下一根起 horizon 根內的最小/最大值 (不含當根)，尾端不足 horizon 根為 NaN"""
+    out = np.full(x.shape, np.nan)
+    if len(x) > horizon:
+        out[:-horizon] = func(np.lib.stride_tricks.sliding_window_view(x[1:], horizon), axis=-1)
+    return out
+
+
+def ticker_events(df: pd.DataFrame, horizons=HORIZONS) -> dict:
+    """
+    單檔逐根訊號與前瞻結果 (陣列皆與 K 棒對齊，已去除前 MIN_BARS - 1 根)。
+    """
+    values = {c: df[c].to_numpy(dtype=np.float64) for c in BAR_COLUMNS}
+    signals = compute_signal_series(*(values[c] for c in BAR_COLUMNS))
+    events = {key: arr[MIN_BARS - 1:] for key, arr in signals.items()}
+    for h in horizons:
+        events[f"ret_{h}"] = forward_returns(values["Close"], h)[MIN_BARS - 1:]
+        events[f"low_{h}"] = future_extreme(values["Low"], h, np.min)[MIN_BARS - 1:]
+        events[f"high_{h}"] = future_extreme(values["High"], h, np.max)[MIN_BARS - 1:]
+    return events
+
+
+def _return_stats(returns: np.ndarray, direction: int = None) -> dict:
+    returns = returns[~np.isnan(returns)]
+    if len(returns) == 0:
+        return {"count": 0, "mean_return": None, "median_return": None, "hit_rate": None}
+    return {
+        "count": int(len(returns)),
+        "mean_return": round(float(np.mean(returns)) * 100, 3),
+        "median_return": round(float(np.median(returns)) * 100, 3),
+        "hit_rate": round(float(np.mean(returns * direction > 0)), 4) if direction else None,
+    }
+
+
+def _rate(hit: np.ndarray, valid: np.ndarray):
+    return round(float(hit[valid].mean()), 4) if valid.any() else None
+
+
+def run_backtest(frames: dict, horizons=HORIZONS) -> dict:
+    """
+    對多檔歷史 K 棒回測 analyze_stock 的訊號。
+
+    Args:
+        frames: { symbol: OHLCV DataFrame }
+        horizons: 前瞻報酬的 K 棒數
+
+    Returns:
+        baseline: 全部 K 棒的前瞻報酬 (比較基準)
+        signals: 各訊號 (kd_signal / breakdown_signal) 的次數、命中率與前瞻報酬 (%)
+        levels: 支撐守住率 (未來 N 根最低價 >= 支撐) 與壓力觸及率 (未來 N 根最高價 >= 壓力)，依類型分組
+    """
+    started = time.perf_counter()
+    parts = [ticker_events(df, horizons) for df in frames.values() if len(df) >= MIN_BARS]
+    if not parts:
+        return {"tickers": 0, "bars": 0, "horizons": list(horizons), "baseline": {}, "signals": {}, "levels": {}}
+    events = {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+    report = {
+        "tickers": len(parts),
+        "bars": int(len(events["kd_signal"])),
+        "horizons": list(horizons),
+        "baseline": {str(h): _return_stats(events[f"ret_{h}"]) for h in horizons},
+        "signals": {},
+        "levels": {"support_type": {}, "resist_type": {}},
+    }
+
+    for field, directions in SIGNAL_DIRECTIONS.items():
+        report["signals"][field] = {}
+        for signal, direction in directions.items():
+            mask = events[field] == signal
+            report["signals"][field][signal] = {
+                "direction": "UP" if direction > 0 else "DOWN",
+                "horizons": {str(h): _return_stats(events[f"ret_{h}"][mask], direction) for h in horizons},
+            }
+
+    for level_type in np.unique(events["support_type"]).tolist():
+        mask = events["support_type"] == level_type
+        support = events["support_price"][mask]
+        report["levels"]["support_type"][level_type] = {
+            "count": int(mask.sum()),
+            "hold_rate": {
+                str(h): _rate(events[f"low_{h}"][mask] >= support, ~np.isnan(events[f"low_{h}"][mask]))
+                for h in horizons
+            },
+        }
+    for level_type in np.unique(events["resist_type"]).tolist():
+        mask = events["resist_type"] == level_type
+        resist = events["resist_price"][mask]
+        report["levels"]["resist_type"][level_type] = {
+            "count": int(mask.sum()),
+            "reach_rate": {
+                str(h): _rate(events[f"high_{h}"][mask] >= resist, ~np.isnan(events[f"high_{h}"][mask]))
+                for h in horizons
+            },
+        }
+
+    report["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return report
@@ -0,0 +1,231 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+try:
+    from .single_flight import SingleFlight
+except ImportError:
+    from single_flight import SingleFlight
+
+# 快取的欄位 (以 float64 緊湊陣列儲存，捨棄 Dividends / Stock Splits 等欄位)
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# 記憶體預算 (bytes)，超過時依 LRU 淘汰
+MAX_BYTES = int(os.environ.get("BAR_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# 各週期的有效秒數：過期後只抓取最後一根 K 棒之後的資料 (Tail Refresh)
+INTERVAL_TTL = {
+    "1d": int(os.environ.get("BAR_CACHE_TTL_1D", "600")),
+    "60m": int(os.environ.get("BAR_CACHE_TTL_60M", "300")),
+}
+DEFAULT_TTL = 300
+
+# 同一 (symbol, interval) 同時只發出一次下載，其他請求等待並共用結果；等待上限 (秒)
+FETCH_WAIT_TIMEOUT = float(os.environ.get("BAR_CACHE_FETCH_WAIT_TIMEOUT", "30"))
+_flights = SingleFlight("bar_cache", timeout=FETCH_WAIT_TIMEOUT)
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # (symbol, interval) -> _Entry
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "refreshes": 0,
+    "evictions": 0,
+    "rows_downloaded": 0,
+}
+
+
+class _Entry:
+    __slots__ = ("timestamps", "values", "tz", "max_rows", "fetched_at")
+
+    def __init__(self, timestamps, values, tz, max_rows, fetched_at):
+        self.timestamps = timestamps  # int64 (UTC ns)
+        self.values = values          # float64, shape = (rows, len(BAR_COLUMNS))
+        self.tz = tz
+        self.max_rows = max_rows
+        self.fetched_at = fetched_at
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + self.values.nbytes
+
+
+def _to_arrays(df: pd.DataFrame):
+    """DataFrame -> (timestamps, values, tz)"""
+    index = pd.DatetimeIndex(df.index)
+    tz = str(index.tz) if index.tz is not None else None
+    timestamps = np.ascontiguousarray(index.asi8, dtype=np.int64)
+    values = np.ascontiguousarray(df[BAR_COLUMNS].to_numpy(dtype=np.float64))
+    return timestamps, values, tz
+
+
+def _to_frame(entry: _Entry) -> pd.DataFrame:
+    """由快取陣列重建 DataFrame (回傳副本，呼叫端可自由新增欄位)"""
+    index = pd.DatetimeIndex(entry.timestamps.copy())
+    if entry.tz:
+        index = index.tz_localize("UTC").tz_convert(entry.tz)
+    return pd.DataFrame(entry.values.copy(), index=index, columns=BAR_COLUMNS)
+
+
+def _merge_tail(entry: _Entry, tail: pd.DataFrame) -> _Entry:
+    """
+    將新抓取的 K 棒接在快取尾端。
+    最後一根快取 K 棒可能是盤中未收完的 K 棒，因此時間戳 >= 新資料起點的舊資料一律以新資料取代。
+    """
+    tail_ts, tail_values, _ = _to_arrays(tail)
+    keep = entry.timestamps < tail_ts[0]
+    timestamps = np.concatenate([entry.timestamps[keep], tail_ts])
+    values = np.concatenate([entry.values[keep], tail_values])
+    # 維持與完整下載相同的長度視窗
+    timestamps = np.ascontiguousarray(timestamps[-entry.max_rows:])
+    values = np.ascontiguousarray(values[-entry.max_rows:])
+    return _Entry(timestamps, values, entry.tz, entry.max_rows, time.time())
+
+
+def _store(key, entry: _Entry):
+    """寫入快取並依記憶體預算淘汰最久未使用的項目 (呼叫端需持有 _lock)"""
+    _entries[key] = entry
+    _entries.move_to_end(key)
+    total = sum(e.nbytes for e in _entries.values())
+    while total > MAX_BYTES and len(_entries) > 1:
+        _, evicted = _entries.popitem(last=False)
+        total -= evicted.nbytes
+        _stats["evictions"] += 1
+
+
+def _fresh_entry(key, ttl):
+    """未過期的快取項目 (呼叫端需持有 _lock)"""
+    entry = _entries.get(key)
+    if entry is not None and time.time() - entry.fetched_at < ttl:
+        return entry
+    return None
+
+
+def _download_full(key, ttl, fetch_full):
+    """下載完整歷史並寫入快取；回傳 _Entry，無資料時回傳原始結果 (不寫入快取)"""
+    with _lock:
+        # 上一個合併的下載可能剛完成
+        entry = _fresh_entry(key, ttl)
+        if entry is not None:
+            return entry
+    df = fetch_full()
+    with _lock:
+        _stats["misses"] += 1
+        if df is None or df.empty:
+            return df
+        _stats["rows_downloaded"] += len(df)
+        timestamps, values, tz = _to_arrays(df)
+        entry = _Entry(timestamps, values, tz, len(timestamps), time.time())
+        _store(key, entry)
+        return entry
+
+
+def _refresh_tail(key, ttl, entry: _Entry, fetch_since):
+    """過期: 只抓取最後一根 K 棒之後的資料並接在快取尾端"""
+    with _lock:
+        fresh = _fresh_entry(key, ttl)
+        if fresh is not None:
+            return fresh
+    if entry.tz:
+        last_ts = pd.Timestamp(int(entry.timestamps[-1]), tz="UTC").tz_convert(entry.tz)
+    else:
+        last_ts = pd.Timestamp(int(entry.timestamps[-1]))
+
+    symbol, interval = key
+    try:
+        tail = fetch_since(last_ts)
+    except Exception as e:
+        print(f"Bar cache tail refresh failed for {symbol} [{interval}], serving stale data: {e}")
+        tail = None
+
+    with _lock:
+        _stats["refreshes"] += 1
+        if tail is not None and not tail.empty:
+            _stats["rows_downloaded"] += len(tail)
+            entry = _merge_tail(entry, tail)
+        else:
+            entry = _Entry(entry.timestamps, entry.values, entry.tz, entry.max_rows, time.time())
+        _store(key, entry)
+        return entry
+
+
+def get_bars(symbol: str, interval: str, fetch_full, fetch_since) -> pd.DataFrame:
+    """
+    取得 K 棒資料 (含快取)。
+    同一 (symbol, interval) 的並行請求只會發出一次下載 (Single-Flight)，
+    下載失敗時所有等待者收到同一個例外，等待超過 FETCH_WAIT_TIMEOUT 秒拋出 SingleFlightTimeout。
+
+    Args:
+        symbol: yfinance 代號 (例如 "2330.TW")
+        interval: K 棒週期 ("1d" / "60m")
+        fetch_full: 無快取時呼叫，回傳完整歷史 DataFrame
+        fetch_since: 快取過期時呼叫 fetch_since(last_timestamp)，回傳該時間點之後的 K 棒
+
+    Returns:
+        OHLCV DataFrame (空資料不寫入快取)
+    """
+    key = (symbol, interval)
+    ttl = INTERVAL_TTL.get(interval, DEFAULT_TTL)
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            if time.time() - entry.fetched_at < ttl:
+                _stats["hits"] += 1
+                return _to_frame(entry)
+
+    if entry is None:
+        result = _flights.do(key, lambda: _download_full(key, ttl, fetch_full))
+    else:
+        result = _flights.do(key, lambda: _refresh_tail(key, ttl, entry, fetch_since))
+    # 每個呼叫端各自取得一份 DataFrame (呼叫端會新增指標欄位)
+    if isinstance(result, _Entry):
+        return _to_frame(result)
+    return result.copy() if result is not None else result
+
+
+def get_fresh(symbol: str, interval: str):
+    """只讀取未過期的快取 (不觸發任何下載)，未命中回傳 None"""
+    key = (symbol, interval)
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None or time.time() - entry.fetched_at >= INTERVAL_TTL.get(interval, DEFAULT_TTL):
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return _to_frame(entry)
+
+
+def put(symbol: str, interval: str, df: pd.DataFrame):
+    """寫入由外部 (例如批次下載) 取得的完整歷史"""
+    if df is None or df.empty:
+        return
+    timestamps, values, tz = _to_arrays(df)
+    with _lock:
+        _stats["misses"] += 1
+        _stats["rows_downloaded"] += len(df)
+        _store((symbol, interval), _Entry(timestamps, values, tz, len(timestamps), time.time()))
+
+
+def get_stats() -> dict:
+    """回傳快取命中/未命中/記憶體用量等統計"""
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_entries)
+        stats["bytes"] = sum(e.nbytes for e in _entries.values())
+        stats["max_bytes"] = MAX_BYTES
+    stats["single_flight"] = _flights.get_stats()
+    return stats
+
+
+def clear():
+    """清空快取與統計 (測試用)"""
+    with _lock:
+        _entries.clear()
+        for k in _stats:
+            _stats[k] = 0
+    _flights.reset_stats()
@@ -0,0 +1,245 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+try:
+    from .atomic_file import atomic_write
+except ImportError:
+    from atomic_file import atomic_write
+
+# 本地 K 棒倉庫 (全市場上市櫃普通股的日線與 60分K):
+# 每檔每週期一個 .npy 檔，內容為 float64 陣列 shape = (6, rows)，逐欄 (columnar) 連續存放:
+#   第 0 列: K 棒時間 (UTC epoch 秒，2^53 以內的整數可由 float64 精確表示)
+#   第 1~5 列: Open / High / Low / Close / Volume
+# 讀取以 np.load(mmap_mode="r") 記憶體映射，DataFrame 的價量欄位直接指向映射區 (不複製)。
+# 寫入 (收盤後由 scripts/update_bar_store.py 增量匯入) 先寫暫存檔再 os.replace:
+# 已映射舊檔的讀取端不受影響 (仍指向舊 inode)，也不會讀到寫到一半的 K 棒。
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+ROWS = 1 + len(BAR_COLUMNS)
+
+STORE_DIR = os.environ.get(
+    "BAR_STORE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bar_store")
+)
+ENABLED = os.environ.get("BAR_STORE_ENABLED", "1") != "0"
+# 同時保持映射的檔案數上限 (依 LRU 釋放)
+MAX_MAPS = int(os.environ.get("BAR_STORE_MAX_MAPS", "1024"))
+
+# 台股交易時段 (台北時間)。收盤後 K 棒定稿的時間，之前匯入時不寫入當日 K 棒
+TZ = "Asia/Taipei"
+SESSION_OPEN = pd.Timedelta(os.environ.get("BAR_STORE_SESSION_OPEN", "09:00") + ":00")
+SETTLED_AFTER = pd.Timedelta(os.environ.get("BAR_STORE_SETTLED_AFTER", "14:30") + ":00")
+
+_lock = threading.Lock()
+_maps = OrderedDict()  # (symbol, interval) -> ((inode, mtime_ns, size), memmap, 台北時間 DatetimeIndex)
+_stats = {
+    "reads": 0,
+    "misses": 0,
+    "maps_opened": 0,
+    "maps_released": 0,
+    "rows_written": 0,
+}
+
+
+def path_for(symbol: str, interval: str) -> str:
+    return os.path.join(STORE_DIR, interval, f"{symbol}.npy")
+
+
+def _open(symbol: str, interval: str):
+    """
+    取得 (映射陣列, 時間索引)，檔案未變更時重用既有映射與索引 (時間索引只在開啟檔案時轉換一次)。
+    檔案不存在或格式不符回傳 None
+    """
+    path = path_for(symbol, interval)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (symbol, interval)
+    version = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _lock:
+        cached = _maps.get(key)
+        if cached is not None and cached[0] == version:
+            _maps.move_to_end(key)
+            return cached[1:]
+
+    try:
+        matrix = np.load(path, mmap_mode="r")
+    except (OSError, ValueError) as e:
+        print(f"Bar store read failed for {symbol} [{interval}]: {e}")
+        return None
+    if matrix.ndim != 2 or matrix.shape[0] != ROWS or matrix.dtype != np.float64:
+        print(f"Bar store file has unexpected layout {matrix.shape} {matrix.dtype}: {path}")
+        return None
+
+    index = _to_index(matrix[0])
+    with _lock:
+        _maps[key] = (version, matrix, index)
+        _maps.move_to_end(key)
+        _stats["maps_opened"] += 1
+        while len(_maps) > MAX_MAPS:
+            _maps.popitem(last=False)
+            _stats["maps_released"] += 1
+    return matrix, index
+
+
+def to_local_index(index) -> pd.DatetimeIndex:
+    """時間索引轉為台北時間 (無時區的索引視為台北時間，例如 yf.download 的日線)"""
+    index = pd.DatetimeIndex(index)
+    return index.tz_localize(TZ) if index.tz is None else index.tz_convert(TZ)
+
+
+def _to_index(seconds: np.ndarray) -> pd.DatetimeIndex:
+    return pd.to_datetime(seconds.astype(np.int64), unit="s", utc=True).tz_convert(TZ)
+
+
+def has(symbol: str, interval: str) -> bool:
+    return os.path.exists(path_for(symbol, interval))
+
+
+def read(symbol: str, interval: str, start=None):
+    """
+    讀取本地 K 棒 (不連網)。
+    價量欄位為唯讀的記憶體映射 (不複製)；呼叫端可新增欄位，但不可修改既有的 OHLCV 值。
+
+    Args:
+        start: 只取此時間之後 (含) 的 K 棒，None 為全部
+
+    Returns:
+        OHLCV DataFrame (index 為台北時間)，倉庫中沒有此檔或區間內無資料時回傳 None
+    """
+    opened = _open(symbol, interval)
+    with _lock:
+        _stats["reads"] += 1
+        if opened is None:
+            _stats["misses"] += 1
+            return None
+    matrix, index = opened
+    lo = 0
+    if start is not None:
+        lo = int(np.searchsorted(matrix[0], pd.Timestamp(start).timestamp(), side="left"))
+    if lo >= matrix.shape[1]:
+        return None
+    return pd.DataFrame(matrix[1:, lo:].T, index=index[lo:], columns=BAR_COLUMNS, copy=False)
+
+
+def last_timestamp(symbol: str, interval: str):
+    """最後一根已匯入 K 棒的時間 (台北時間)，沒有資料回傳 None"""
+    opened = _open(symbol, interval)
+    return None if opened is None else opened[1][-1]
+
+
+def symbols(interval: str) -> list:
+    """倉庫中已有此週期資料的代號"""
+    try:
+        names = os.listdir(os.path.join(STORE_DIR, interval))
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len(".npy")] for name in names if name.endswith(".npy"))
+
+
+def _to_matrix(df: pd.DataFrame) -> np.ndarray:
+    """DataFrame -> (6, rows) float64 (依時間排序，重複時間保留最後一筆)"""
+    seconds = to_local_index(df.index).tz_convert("UTC").as_unit("s").asi8
+    order = np.argsort(seconds, kind="stable")
+    seconds = seconds[order]
+    values = df[BAR_COLUMNS].to_numpy(dtype=np.float64)[order]
+    last = np.append(seconds[1:] != seconds[:-1], True)
+    matrix = np.empty((ROWS, int(last.sum())), dtype=np.float64)
+    matrix[0] = seconds[last]
+    matrix[1:] = values[last].T
+    return matrix
+
+
+def _save(symbol: str, interval: str, matrix: np.ndarray):
+    with atomic_write(path_for(symbol, interval)) as f:
+        np.save(f, np.ascontiguousarray(matrix))
+    with _lock:
+        _stats["rows_written"] += matrix.shape[1]
+
+
+def write(symbol: str, interval: str, df: pd.DataFrame) -> int:
+    """以 df 取代此檔的全部歷史 (首次匯入或除權息調整後重抓)，回傳寫入的 K 棒數"""
+    if df is None or df.empty:
+        return 0
+    matrix = _to_matrix(df)
+    _save(symbol, interval, matrix)
+    return matrix.shape[1]
+
+
+def append(symbol: str, interval: str, df: pd.DataFrame) -> int:
+    """
+    將新 K 棒接在既有歷史之後 (時間 >= 新資料起點的舊 K 棒以新資料取代)。
+    Returns:
+        新增的 K 棒數 (只覆寫重疊的 K 棒時為 0)
+    """
+    if df is None or df.empty:
+        return 0
+    new = _to_matrix(df)
+    opened = _open(symbol, interval)
+    if opened is None:
+        _save(symbol, interval, new)
+        return new.shape[1]
+    existing = opened[0]
+    keep = existing[0] < new[0, 0]
+    merged = np.concatenate([existing[:, keep], new], axis=1)
+    _save(symbol, interval, merged)
+    return merged.shape[1] - existing.shape[1]
+
+
+def extend(stored: pd.DataFrame, tail: pd.DataFrame) -> pd.DataFrame:
+    """本地歷史接上當日由上游取得的 K 棒 (回傳新的 DataFrame；tail 為空時直接回傳 stored)"""
+    if tail is None or tail.empty:
+        return stored
+    tail_index = to_local_index(tail.index)
+    keep = stored.index < tail_index[0]
+    values = np.concatenate([
+        stored[BAR_COLUMNS].to_numpy(dtype=np.float64)[keep],
+        tail[BAR_COLUMNS].to_numpy(dtype=np.float64),
+    ])
+    return pd.DataFrame(values, index=stored.index[keep].append(tail_index), columns=BAR_COLUMNS)
+
+
+def next_session_open(ts) -> pd.Timestamp:
+    """ts 所在交易日之後的下一個交易日開盤時間 (只略過週末，國定假日視為交易日)"""
+    day = pd.Timestamp(ts).tz_convert(TZ).normalize() + pd.Timedelta(days=1)
+    while day.weekday() >= 5:
+        day += pd.Timedelta(days=1)
+    return day + SESSION_OPEN
+
+
+def is_current(last_ts, now=None) -> bool:
+    """最後一根 K 棒之後尚未開過盤 (本地資料已是最新，不需向上游補抓)"""
+    now = pd.Timestamp.now(TZ) if now is None else pd.Timestamp(now)
+    return now < next_session_open(last_ts)
+
+
+def completed(df: pd.DataFrame, now=None) -> pd.DataFrame:
+    """去除尚未定稿的當日 K 棒 (收盤後 SETTLED_AFTER 之前匯入時)"""
+    if df is None or df.empty:
+        return df
+    now = pd.Timestamp.now(TZ) if now is None else pd.Timestamp(now).tz_convert(TZ)
+    today = now.normalize()
+    if now >= today + SETTLED_AFTER:
+        return df
+    return df[to_local_index(df.index) < today]
+
+
+def get_stats() -> dict:
+    """讀取 / 映射 / 寫入統計"""
+    with _lock:
+        stats = dict(_stats)
+        stats["mapped_files"] = len(_maps)
+        stats["mapped_bytes"] = sum(m.nbytes for _, m, _ in _maps.values())
+    stats["enabled"] = ENABLED
+    stats["dir"] = STORE_DIR
+    return stats
+
+
+def clear():
+    """釋放所有映射並清除統計 (測試用)"""
+    with _lock:
+        _maps.clear()
+        for k in _stats:
+            _stats[k] = 0
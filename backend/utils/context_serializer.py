@@ -0,0 +1,242 @@
+import os
+import re
+import copy
+import json
+import math
+import threading
+
+# Gemini 輸入中的數據 context 序列化:
+# Prompt 的 token 數直接影響 Vertex 的延遲與費用，因此以較精簡的格式取代 json.dumps(indent=2)，
+# 並在超過 token 預算時依優先順序捨棄次要欄位。
+#
+# 編碼 (由寬鬆到精簡):
+#   pretty      : 縮排 JSON (原本的格式，作為比較基準)
+#   compact     : 無空白的 JSON
+#   tabular     : compact + 物件陣列 (cb_list) 改為 {"columns": [...], "rows": [[...]]}，欄位名稱只出現一次
+#   abbreviated : tabular + 欄位名稱縮寫。縮寫對照固定附在 System Prompt 之後 (見 system_legend)，
+#                 與 Prompt 一起註冊為 Vertex cached content，每個請求只送縮寫後的數據
+ENCODINGS = ("pretty", "compact", "tabular", "abbreviated")
+DEFAULT_ENCODING = "tabular"
+ENCODING = os.environ.get("CONTEXT_ENCODING", DEFAULT_ENCODING)
+if ENCODING not in ENCODINGS:
+    print(f"Unknown CONTEXT_ENCODING '{ENCODING}', using '{DEFAULT_ENCODING}'")
+    ENCODING = DEFAULT_ENCODING
+# context 的 token 上限 (估算值)，0 表示不限制
+TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "0"))
+
+# 超過預算時依序捨棄的欄位 (越前面越次要)。
+# "a.b" 為巢狀欄位；"cb_list[3:]" 表示只保留前 3 筆。
+# 未列出的欄位 (代號、日期、收盤價、MA20/60、支撐壓力價、KD、金包銀狀態等) 一律保留。
+DROP_ORDER = (
+    "strategy_gold_silver.description",
+    "timed_out_sources",
+    "interval",
+    "vol_ma5",
+    "support_type",
+    "resist_type",
+    "short_term_support",
+    "trend_support",
+    "smart_money_support",
+    "ma5",
+    "ma10",
+    "ma120",
+    "ma240",
+    "cb_list[3:]",
+    "strategy_gold_silver.ma60_trend",
+    "strategy_gold_silver.convergence_rate",
+    "cb_list[1:]",
+)
+
+ABBREVIATIONS = {
+    "stock_id": "id",
+    "date": "dt",
+    "interval": "iv",
+    "close": "c",
+    "support_price": "sp",
+    "resist_price": "rp",
+    "support_type": "spt",
+    "resist_type": "rpt",
+    "smart_money_support": "sms",
+    "breakdown_signal": "bd",
+    "short_term_support": "sts",
+    "trend_support": "ts",
+    "volume": "v",
+    "vol_ma5": "vm5",
+    "kd_signal": "kds",
+    "strategy_gold_silver": "gs",
+    "pattern_found": "pf",
+    "pattern_type": "pt",
+    "status": "st",
+    "description": "desc",
+    "ma60_trend": "m60t",
+    "convergence_rate": "cr",
+    "has_cb": "hcb",
+    "cb_list": "cb",
+    "cb_id": "cid",
+    "cb_name": "cn",
+    "conversion_price": "cp",
+    "deviation_rate": "dev",
+    "timed_out_sources": "tos",
+    "columns": "cols",
+}
+
+_CJK = re.compile(r"[⺀-鿿豈-﫿＀-￯]")
+_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\w\s]|\s+")
+_TRIM = re.compile(r"^(\w+)\[(\d+):\]$")
+
+_lock = threading.Lock()
+_metrics = {
+    "requests": 0,
+    "tokens": 0,
+    "baseline_tokens": 0,
+    "trimmed": 0,
+    "over_budget": 0,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算 token 數 (不呼叫 API)。
+    中日文約 1 字 1 token；英文字母每 4 字約 1 token；數字每 3 位約 1 token；標點與連續空白各 1 token。
+    """
+    cjk = len(_CJK.findall(text))
+    tokens = cjk
+    for piece in _PIECES.findall(_CJK.sub("", text)):
+        if piece[0].isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+def _tabulate(value):
+    """物件陣列 (欄位相同的 dict list) 改為 {"columns", "rows"}，其他值遞迴處理"""
+    if isinstance(value, dict):
+        return {k: _tabulate(v) for k, v in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        columns = list(dict.fromkeys(k for item in value for k in item))
+        return {"columns": columns, "rows": [[_tabulate(item.get(c)) for c in columns] for item in value]}
+    if isinstance(value, list):
+        return [_tabulate(v) for v in value]
+    return value
+
+
+def _abbreviate(value):
+    """縮寫 dict 的鍵與表格的欄位名稱 (不在 ABBREVIATIONS 中的名稱維持原樣)"""
+    if isinstance(value, dict):
+        if set(value) == {"columns", "rows"}:
+            columns = [ABBREVIATIONS.get(c, c) for c in value["columns"]]
+            return {ABBREVIATIONS["columns"]: columns, "rows": _abbreviate(value["rows"])}
+        return {ABBREVIATIONS.get(k, k): _abbreviate(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_abbreviate(v) for v in value]
+    return value
+
+
+def system_legend(encoding: str = None):
+    """abbreviated 編碼附加在 System Prompt 之後的縮寫對照 (內容固定，不影響 Prompt 快取)；其他編碼回傳 None"""
+    if (encoding or ENCODING) != "abbreviated":
+        return None
+    pairs = ", ".join(f"{abbr}={name}" for name, abbr in ABBREVIATIONS.items())
+    return f"系統數據 JSON 的欄位名稱為縮寫，對照如下 (縮寫=原名): {pairs}。表格以 cols 列出欄位、rows 為各筆資料。"
+
+
+def encode(context: dict, encoding: str = None) -> str:
+    """依指定編碼序列化 context"""
+    encoding = encoding or ENCODING
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of {ENCODINGS}")
+    if encoding == "pretty":
+        return json.dumps(context, ensure_ascii=False, indent=2)
+    if encoding == "compact":
+        return json.dumps(context, ensure_ascii=False, separators=(",", ":"))
+
+    value = _tabulate(context)
+    if encoding == "abbreviated":
+        value = _abbreviate(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _drop(context: dict, step: str) -> bool:
+    """捨棄一個欄位 (或截短清單)，有變動時回傳 True"""
+    match = _TRIM.match(step)
+    if match:
+        key, keep = match.group(1), int(match.group(2))
+        items = context.get(key)
+        if isinstance(items, list) and len(items) > keep:
+            context[key] = items[:keep]
+            return True
+        return False
+    *parents, key = step.split(".")
+    target = context
+    for parent in parents:
+        target = target.get(parent) if isinstance(target, dict) else None
+    if isinstance(target, dict) and key in target:
+        del target[key]
+        return True
+    return False
+
+
+def serialize(context: dict, encoding: str = None, budget: int = None) -> dict:
+    """
+    序列化 context 並套用 token 預算 (未指定時使用 CONTEXT_TOKEN_BUDGET，0 表示不限制)。
+    超過預算時依 DROP_ORDER 逐一捨棄次要欄位直到符合為止 (捨棄的欄位只記錄在回傳值與日誌，不送給 Gemini)。
+
+    Returns:
+        { "text", "encoding", "tokens", "baseline_tokens" (pretty JSON 的估算值), "omitted": [捨棄的欄位] }
+    """
+    encoding = encoding or ENCODING
+    budget = TOKEN_BUDGET if budget is None else budget
+    text = encode(context, encoding)
+    tokens = estimate_tokens(text)
+
+    omitted = []
+    if budget and tokens > budget:
+        trimmed = copy.deepcopy(context)
+        for step in DROP_ORDER:
+            if not _drop(trimmed, step):
+                continue
+            omitted.append(step)
+            text = encode(trimmed, encoding)
+            tokens = estimate_tokens(text)
+            if tokens <= budget:
+                break
+
+    baseline_tokens = estimate_tokens(json.dumps(context, ensure_ascii=False, indent=2))
+    with _lock:
+        _metrics["requests"] += 1
+        _metrics["tokens"] += tokens
+        _metrics["baseline_tokens"] += baseline_tokens
+        if omitted:
+            _metrics["trimmed"] += 1
+        if budget and tokens > budget:
+            _metrics["over_budget"] += 1
+    return {
+        "text": text,
+        "encoding": encoding,
+        "tokens": tokens,
+        "baseline_tokens": baseline_tokens,
+        "omitted": omitted,
+    }
+
+
+def get_metrics() -> dict:
+    """累計的 context token 數 (估算) 與相較於縮排 JSON 省下的比例"""
+    with _lock:
+        metrics = dict(_metrics)
+    metrics["encoding"] = ENCODING
+    metrics["token_budget"] = TOKEN_BUDGET
+    metrics["saved_tokens"] = metrics["baseline_tokens"] - metrics["tokens"]
+    metrics["saved_ratio"] = (
+        round(metrics["saved_tokens"] / metrics["baseline_tokens"], 4) if metrics["baseline_tokens"] else None
+    )
+    return metrics
+
+
+def reset_metrics():
+    """清除統計 (測試用)"""
+    with _lock:
+        for key in _metrics:
+            _metrics[key] = 0
@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+
+import httpx
+import google.auth.exceptions
+from google import genai
+from google.genai import errors, types
+from google.genai.types import Tool, GoogleSearch
+
+# 連線池設定 (所有 gunicorn threads 共用同一個 Client 與連線池)
+POOL_MAX_CONNECTIONS = int(os.environ.get("GEMINI_POOL_MAX_CONNECTIONS", "16"))
+POOL_MAX_KEEPALIVE = int(os.environ.get("GEMINI_POOL_MAX_KEEPALIVE", "8"))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get("GEMINI_POOL_KEEPALIVE_EXPIRY", "120"))
+
+# Google Search 工具 (不可變設定，全程共用)
+SEARCH_TOOL = Tool(google_search=GoogleSearch())
+
+_lock = threading.Lock()
+_client = None
+_settings = {"project": None, "location": None}
+_metrics = {
+    "cold_starts": 0,
+    "reuses": 0,
+    "resets": 0,
+    "cold_init_seconds_total": 0.0,
+}
+
+
+def configure(project: str, location: str):
+    """設定 Vertex AI 專案與區域 (於 main 載入時呼叫一次)"""
+    with _lock:
+        _settings["project"] = project
+        _settings["location"] = location
+
+
+def _build_client():
+    limits = httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+    return genai.Client(
+        vertexai=True,
+        project=_settings["project"],
+        location=_settings["location"],
+        http_options=types.HttpOptions(
+            client_args={"limits": limits},
+            async_client_args={"limits": limits},
+        ),
+    )
+
+
+def get_client():
+    """
+    取得全域共用的 Gemini Client (第一次使用時才建立，thread-safe)。
+    """
+    global _client
+    with _lock:
+        if _client is not None:
+            _metrics["reuses"] += 1
+            return _client
+        started = time.perf_counter()
+        _client = _build_client()
+        _metrics["cold_starts"] += 1
+        _metrics["cold_init_seconds_total"] += time.perf_counter() - started
+        return _client
+
+
+def reset_client(reason: str = ""):
+    """丟棄目前的 Client，下次 get_client() 時重新建立 (憑證或連線失效時使用)"""
+    global _client
+    with _lock:
+        old, _client = _client, None
+        _metrics["resets"] += 1
+    print(f"Gemini client reset: {reason}")
+    close = getattr(old, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def is_recoverable_error(e: Exception) -> bool:
+    """憑證過期 / 連線中斷等重建 Client 後可能恢復的錯誤"""
+    if isinstance(e, (google.auth.exceptions.GoogleAuthError, httpx.TransportError)):
+        return True
+    return isinstance(e, errors.ClientError) and e.code in (401, 403)
+
+
+def call_with_client(fn):
+    """
+    以共用 Client 執行 fn(client)。
+    遇到憑證或連線錯誤時重建 Client 並重試一次，其他錯誤直接拋出。
+    """
+    try:
+        return fn(get_client())
+    except Exception as e:
+        if not is_recoverable_error(e):
+            raise
+        reset_client(f"{type(e).__name__}: {e}")
+        return fn(get_client())
+
+
+async def acall_with_client(fn):
+    """
+    call_with_client 的 async 版本: fn(client) 回傳 coroutine (例如 client.aio.models.generate_content(...))。
+    同步與非同步呼叫共用同一個 Client (aio 使用其 async 連線池)。
+    """
+    try:
+        return await fn(get_client())
+    except Exception as e:
+        if not is_recoverable_error(e):
+            raise
+        reset_client(f"{type(e).__name__}: {e}")
+        return await fn(get_client())
+
+
+def get_metrics() -> dict:
+    """
+    Client 重用統計。
+    saved_ms_per_request: 每次重用相較於冷建立 (憑證探索 + 物件建立) 平均省下的時間。
+    """
+    with _lock:
+        metrics = dict(_metrics)
+    cold_avg = metrics["cold_init_seconds_total"] / metrics["cold_starts"] if metrics["cold_starts"] else 0.0
+    metrics["saved_ms_per_request"] = round(cold_avg * 1000, 2)
+    metrics["saved_seconds_total"] = round(cold_avg * metrics["reuses"], 3)
+    return metrics
@@ -0,0 +1,280 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 指標參數
+MA_WINDOWS = (5, 10, 20, 60, 120, 240)
+VOL_MA_WINDOW = 5
+KD_PERIOD = 9
+EXTREME_WINDOW = 60   # 區間高低點
+BANKER_WINDOW = 20    # 關鍵大量 K 線搜尋範圍
+KD_BLOCK = 128        # KD 遞迴分塊長度 (避免 (3/2)^n 溢位)
+
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    沿最後一軸計算移動平均 (累積和差分)。
+    與 pandas rolling(window).mean() 相同: 前 window-1 根與含 NaN 的視窗皆為 NaN。
+    """
+    out = np.full(x.shape, np.nan)
+    n = x.shape[-1]
+    if n < window:
+        return out
+    nan_mask = np.isnan(x)
+    pad = [(0, 0)] * (x.ndim - 1) + [(1, 0)]
+    csum = np.pad(np.cumsum(np.where(nan_mask, 0.0, x), axis=-1), pad)
+    cnan = np.pad(np.cumsum(nan_mask, axis=-1), pad)
+    sums = csum[..., window:] - csum[..., :-window]
+    nans = cnan[..., window:] - cnan[..., :-window]
+    out[..., window - 1:] = np.where(nans > 0, np.nan, sums / window)
+    return out
+
+
+def _rolling_extreme(x: np.ndarray, window: int, func) -> np.ndarray:
+    """沿最後一軸計算移動最大/最小值 (含 NaN 的視窗為 NaN，同 pandas)"""
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] < window:
+        return out
+    out[..., window - 1:] = func(sliding_window_view(x, window, axis=-1), axis=-1)
+    return out
+
+
+def smooth_kd(x: np.ndarray, init: float = 50.0) -> np.ndarray:
+    """
+    KD 平滑遞迴 y[t] = 2/3 * y[t-1] + 1/3 * x[t]，y[-1] = init。
+    以封閉解分塊計算: y[j] = a^(j+1) * (carry + 1/3 * Σ a^-(i+1) * x[i])，每塊僅需一次 cumsum。
+    """
+    a = 2 / 3
+    out = np.empty(x.shape)
+    carry = np.full(x.shape[:-1], init)
+    n = x.shape[-1]
+    for start in range(0, n, KD_BLOCK):
+        seg = x[..., start:start + KD_BLOCK]
+        j = np.arange(1, seg.shape[-1] + 1)
+        acc = np.cumsum(seg * a ** -j, axis=-1) / 3
+        out[..., start:start + seg.shape[-1]] = a ** j * (carry[..., None] + acc)
+        carry = out[..., start + seg.shape[-1] - 1]
+    return out
+
+
+def compute_indicators(open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                       close: np.ndarray, volume: np.ndarray) -> dict:
+    """
+    單次向量化計算 analyze_stock 所需的全部指標。
+    輸入為 float64 陣列 (1-D 單檔，或 2-D 股票 x K 棒)，時間沿最後一軸。
+
+    Returns:
+        ma5 ~ ma240, vol_ma5, rsv, k, d: 與輸入同形狀的陣列
+        high_60, low_60: 最近 60 根的最高/最低 (忽略 NaN)
+        banker_low: 近 20 根中收紅且量最大的 K 棒低點，無紅 K 時為 NaN
+    """
+    open_, high, low, close, volume = (
+        np.ascontiguousarray(v, dtype=np.float64) for v in (open_, high, low, close, volume)
+    )
+    result = {f"ma{w}": rolling_mean(close, w) for w in MA_WINDOWS}
+    result["vol_ma5"] = rolling_mean(volume, VOL_MA_WINDOW)
+
+    # RSV = (Close - Lowest_Low_9) / (Highest_High_9 - Lowest_Low_9) * 100，缺值補 50
+    low_min = _rolling_extreme(low, KD_PERIOD, np.min)
+    high_max = _rolling_extreme(high, KD_PERIOD, np.max)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsv = (close - low_min) / (high_max - low_min) * 100
+    rsv = np.where(np.isnan(rsv), 50.0, rsv)
+    result["rsv"] = rsv
+    result["k"] = smooth_kd(rsv)
+    result["d"] = smooth_kd(result["k"])
+
+    # 區間高低點 (最近 60 根)
+    high_60 = np.nanmax(high[..., -EXTREME_WINDOW:], axis=-1, initial=-np.inf)
+    low_60 = np.nanmin(low[..., -EXTREME_WINDOW:], axis=-1, initial=np.inf)
+    result["high_60"] = np.where(np.isinf(high_60), np.nan, high_60)
+    result["low_60"] = np.where(np.isinf(low_60), np.nan, low_60)
+
+    # 關鍵大量 K 線 (Banker's Candle)
+    recent_vol = volume[..., -BANKER_WINDOW:]
+    is_red = (close[..., -BANKER_WINDOW:] > open_[..., -BANKER_WINDOW:]) & ~np.isnan(recent_vol)
+    masked_vol = np.where(is_red, recent_vol, -np.inf)
+    pos = np.argmax(masked_vol, axis=-1)
+    banker_low = np.take_along_axis(low[..., -BANKER_WINDOW:], np.expand_dims(pos, -1), axis=-1)[..., 0]
+    result["banker_low"] = np.where(is_red.any(axis=-1), banker_low, np.nan)
+    return result
+
+
+def _trailing_extreme(x: np.ndarray, window: int, func, fill: float) -> np.ndarray:
+    """
+    每根 K 棒 (含當根) 往前 window 根的最大/最小值，忽略 NaN；開頭不足 window 根時取現有部分。
+    最後一根的結果與 compute_indicators 的 high_60 / low_60 相同。
+    """
+    filled = np.where(np.isnan(x), fill, x)
+    pad = [(0, 0)] * (x.ndim - 1) + [(window - 1, 0)]
+    windows = sliding_window_view(np.pad(filled, pad, constant_values=fill), window, axis=-1)
+    out = func(windows, axis=-1)
+    return np.where(np.isinf(out), np.nan, out)
+
+
+def _trailing_banker_low(open_, low, close, volume, window: int) -> np.ndarray:
+    """每根 K 棒往前 window 根中收紅且量最大的 K 棒低點 (無紅 K 時為 NaN)，最後一根同 banker_low"""
+    is_red = (close > open_) & ~np.isnan(volume)
+    masked = np.where(is_red, volume, -np.inf)
+    pad = [(0, 0)] * (volume.ndim - 1) + [(window - 1, 0)]
+    windows = sliding_window_view(np.pad(masked, pad, constant_values=-np.inf), window, axis=-1)
+    pos = np.argmax(windows, axis=-1)
+    has_red = np.max(windows, axis=-1) > -np.inf
+    index = np.clip(np.arange(volume.shape[-1]) - (window - 1) + pos, 0, None)
+    return np.where(has_red, np.take_along_axis(low, index, axis=-1), np.nan)
+
+
+def _shift(x: np.ndarray, periods: int = 1) -> np.ndarray:
+    """沿最後一軸向後平移 (前 periods 根補 NaN)"""
+    out = np.full(x.shape, np.nan)
+    out[..., periods:] = x[..., :-periods]
+    return out
+
+
+def compute_signal_series(open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                          close: np.ndarray, volume: np.ndarray, ind: dict = None) -> dict:
+    """
+    逐根 K 棒計算 analyze_stock 的支撐/壓力與訊號 (與輸入對齊的陣列，無逐根迴圈)。
+    每根 K 棒只使用當根以前的資料，最後一根即為 analyze_stock 對最新 K 棒的判讀結果。
+
+    Returns:
+        support_price, resist_price, smart_money_support: float 陣列
+        support_type (60d_low / ma20 / smart_money_low), resist_type (60d_high / blue_sky),
+        breakdown_signal (NONE / BREAKDOWN / TRUE_BREAKDOWN / WASH_SALE),
+        kd_signal (NEUTRAL / HIGH_PASSIVATION / LOW_PASSIVATION / GOLDEN_CROSS / DEAD_CROSS): 字串陣列
+    """
+    open_, high, low, close, volume = (
+        np.ascontiguousarray(v, dtype=np.float64) for v in (open_, high, low, close, volume)
+    )
+    if ind is None:
+        ind = compute_indicators(open_, high, low, close, volume)
+    ma20, vol_ma5, k, d = ind["ma20"], ind["vol_ma5"], ind["k"], ind["d"]
+    ma20_prev = _shift(ma20)
+    high_60 = _trailing_extreme(high, EXTREME_WINDOW, np.max, -np.inf)
+    low_60 = _trailing_extreme(low, EXTREME_WINDOW, np.min, np.inf)
+
+    # 關鍵大量 K 線低點 (0 視為無，與逐根版本的真值判斷相同)
+    banker_low = _trailing_banker_low(open_, low, close, volume, BANKER_WINDOW)
+    smart_money = np.where(banker_low == 0, np.nan, banker_low)
+    has_smart_money = ~np.isnan(smart_money)
+
+    # 支撐: 預設區間低點；股價 > 月線且月線翻揚時取 月線 與 關鍵大量低點 的較強者
+    strong = (close > ma20) & (ma20 > ma20_prev)
+    use_smart_money = strong & has_smart_money & (smart_money > ma20)
+    support_price = np.where(use_smart_money, smart_money, np.where(strong, ma20, low_60))
+    support_type = np.select([use_smart_money, strong], ["smart_money_low", "ma20"], "60d_low")
+
+    # 壓力: 預設區間高點；接近或突破 60 根高點時以漲停價為目標
+    blue_sky = close >= high_60 * 0.99
+    resist_price = np.where(blue_sky, close * 1.1, high_60)
+    resist_type = np.where(blue_sky, "blue_sky", "60d_high")
+
+    # 防呆: 支撐壓力過近或倒掛時強制拉開空間
+    too_close = resist_price <= support_price * 1.01
+    widened = support_price * 1.05
+    resist_price = np.where(too_close & (widened > resist_price), widened, resist_price)
+    support_price = np.where(too_close & (support_price > close * 0.95), support_price * 0.95, support_price)
+
+    # 量能濾網: 跌破支撐時依量比判斷真假跌破
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vol_ratio = volume / vol_ma5
+    breakdown = (close < support_price) & (vol_ma5 > 0)
+    breakdown_signal = np.select(
+        [breakdown & (vol_ratio > 1.5), breakdown & (vol_ratio < 1.0), breakdown],
+        ["TRUE_BREAKDOWN", "WASH_SALE", "BREAKDOWN"],
+        "NONE",
+    )
+
+    # KD 訊號: 高檔鈍化 > 低檔鈍化 > 黃金交叉 > 死亡交叉
+    k_prev, d_prev = _shift(k), _shift(d)
+    kd_signal = np.select(
+        [
+            (k >= 80) & (d >= 80),
+            (k <= 20) & (d <= 20),
+            (k_prev < d_prev) & (k > d),
+            (k_prev > d_prev) & (k < d),
+        ],
+        ["HIGH_PASSIVATION", "LOW_PASSIVATION", "GOLDEN_CROSS", "DEAD_CROSS"],
+        "NEUTRAL",
+    )
+
+    return {
+        "support_price": support_price,
+        "support_type": support_type,
+        "resist_price": resist_price,
+        "resist_type": resist_type,
+        "smart_money_support": smart_money,
+        "breakdown_signal": breakdown_signal,
+        "kd_signal": kd_signal,
+    }
+
+# 金包銀 (60 分 K) 判讀參數
+GS_SLOPE_LOOKBACK = 4      # 60MA 斜率: 最新一根對比往前第 4 根
+GS_SLOPE_FLAT = 0.0005     # 斜率絕對值小於此值視為走平
+GS_BAND = 0.02             # 位置判定允許誤差
+GS_VOLUME_RATIO = 1.2      # 帶量: 成交量 > 5 日均量 x 1.2
+GS_FORMING = 0.015         # 糾結率門檻 (醞釀)
+GS_SQUEEZE = 0.006         # 糾結率門檻 (紮實)
+
+
+def gold_silver_state(ma5, ma10, ma20, ma60, ma60_prev, ma120, ma240, close, volume, vol_ma5) -> dict:
+    """
+    金包銀 多/空 形態判讀 (向量化，每個元素為一檔股票的最新一根 K 棒)。
+    條件與 NaN 行為與逐檔版本 (stock_analysis.check_gold_wrapped_silver) 相同: 含 NaN 的比較一律不成立。
+
+    Returns:
+        status, pattern_type, ma60_trend: 字串陣列
+        convergence_rate: 短均 (5/10/20MA) 變異係數 x 100 (未四捨五入)
+    """
+    ma5, ma10, ma20, ma60, ma60_prev, ma120, ma240, close, volume, vol_ma5 = (
+        np.asarray(v, dtype=np.float64) for v in (ma5, ma10, ma20, ma60, ma60_prev, ma120, ma240, close, volume, vol_ma5)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (ma60 - ma60_prev) / ma60_prev
+        avg_short = (ma5 + ma10 + ma20) / 3
+        std_dev = np.sqrt(((ma5 - avg_short) ** 2 + (ma10 - avg_short) ** 2 + (ma20 - avg_short) ** 2) / 3)
+        cv_rate = std_dev / avg_short
+
+    ma60_trend = np.select([slope > GS_SLOPE_FLAT, slope < -GS_SLOPE_FLAT], ["UP", "DOWN"], "FLAT")
+    volume_surge = volume > vol_ma5 * GS_VOLUME_RATIO
+
+    # 多頭: 60MA (支撐) < 短均糾結 < 120/240MA (壓力)，60MA 上揚或走平
+    upper_limit = np.where(ma240 > ma120, ma240, ma120)
+    is_bull = (ma60 * (1 - GS_BAND) < avg_short) & (avg_short < upper_limit * (1 + GS_BAND)) & (ma60_trend != "DOWN")
+    bull_status = np.select(
+        [(close > upper_limit) & volume_surge, close < ma60 * (1 - GS_BAND), cv_rate < GS_SQUEEZE, cv_rate < GS_FORMING],
+        ["BREAKOUT", "FAIL", "SQUEEZE", "FORMING"],
+        "NONE",
+    )
+
+    # 空頭: 120/240MA (地板) < 短均糾結 < 60MA (蓋頭壓力)，60MA 下彎或走平；僅在非多頭形態時判斷
+    lower_limit = np.where(ma240 < ma120, ma240, ma120)
+    is_bear = ~is_bull & (lower_limit * (1 - GS_BAND) < avg_short) & (avg_short < ma60 * (1 + GS_BAND)) & (ma60_trend != "UP")
+    bear_status = np.select(
+        [(close < lower_limit) & volume_surge, close > ma60 * (1 + GS_BAND), cv_rate < GS_FORMING],
+        ["BEAR_BREAKDOWN", "BEAR_FAIL", "BEAR_SQUEEZE"],
+        "NONE",
+    )
+
+    return {
+        "status": np.where(is_bull, bull_status, np.where(is_bear, bear_status, "NONE")),
+        "pattern_type": np.select([is_bull, is_bear], ["BULL", "BEAR"], "NONE"),
+        "ma60_trend": ma60_trend,
+        "convergence_rate": cv_rate * 100,
+    }
+
+
+def screen_gold_silver_chunk(close: np.ndarray, volume: np.ndarray) -> dict:
+    """
+    對一批股票 (2-D: 股票 x K 棒，時間沿最後一軸、右對齊，前段以 NaN 補齊) 計算金包銀狀態。
+    只計算判讀需要的均線；供 process pool 分塊呼叫 (僅依賴 numpy，子行程載入成本低)。
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    volume = np.ascontiguousarray(volume, dtype=np.float64)
+    ma = {w: rolling_mean(close, w) for w in (5, 10, 20, 60, 120, 240)}
+    vol_ma5 = rolling_mean(volume, VOL_MA_WINDOW)
+    result = gold_silver_state(
+        ma[5][:, -1], ma[10][:, -1], ma[20][:, -1], ma[60][:, -1], ma[60][:, -1 - GS_SLOPE_LOOKBACK],
+        ma[120][:, -1], ma[240][:, -1], close[:, -1], volume[:, -1], vol_ma5[:, -1],
+    )
+    result["close"] = close[:, -1]
+    return result
@@ -0,0 +1,94 @@
+import os
+import time
+import uuid
+import queue
+import threading
+
+
+class QueueFullError(Exception):
+    """佇列已滿，拒絕新工作 (Admission Control)"""
+
+
+class JobQueue:
+    """
+    背景工作佇列: 固定數量的 worker threads + 有界佇列 + 具 TTL 的結果保存。
+    worker 於第一次 submit 時才啟動 (gunicorn --preload fork 後 master 的執行緒不會被繼承)。
+    """
+
+    def __init__(self, workers: int, max_queue: int, result_ttl: float):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._started_pid = None
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self._worker, name=f"task-job-{i}", daemon=True).start()
+
+    def _worker(self):
+        while True:
+            job_id, fn, args = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            try:
+                result = fn(*args)
+                update = {"status": "done", "result": result}
+            except Exception as e:
+                update = {"status": "failed", "error": str(e)}
+            with self._lock:
+                job.update(update, finished_at=time.time())
+
+    def _purge_expired(self):
+        """移除已完成且超過 TTL 的結果 (呼叫端需持有 _lock)"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.get("finished_at") and now - job["finished_at"] > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, fn, *args) -> str:
+        """
+        提交工作並立即回傳 job_id。
+        佇列已滿時拋出 QueueFullError，不會阻塞請求。
+        """
+        self._ensure_workers()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge_expired()
+            self._jobs[job_id] = {"job_id": job_id, "status": "queued", "created_at": time.time()}
+        try:
+            self._queue.put_nowait((job_id, fn, args))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+            raise QueueFullError("Task queue is full, please retry later")
+        return job_id
+
+    def get(self, job_id: str):
+        """查詢工作狀態，不存在或已過期回傳 None"""
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+        return {
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "retained": len(statuses),
+            "queue_capacity": self._queue.maxsize,
+        }
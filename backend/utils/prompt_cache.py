@@ -0,0 +1,200 @@
+import os
+import time
+import hashlib
+import threading
+
+from google.genai import errors, types
+try:
+    from . import gemini_client
+except ImportError:
+    import gemini_client
+
+# Vertex AI Context Caching: 大型 System Prompt (連同 tools) 註冊為 cached content，
+# 之後的請求只以名稱引用，不必每次重送並重新處理數千 tokens。
+# 建立 / 續期失敗或 Prompt 太短時一律退回 inline system_instruction。
+ENABLED = os.environ.get("PROMPT_CACHE_ENABLED", "1") != "0"
+# Vertex 的 cached content 有最小 token 數限制，短於此字數的 Prompt 直接 inline (中文約 1 字 1 token)
+MIN_CHARS = int(os.environ.get("PROMPT_CACHE_MIN_CHARS", "4000"))
+TTL_SECONDS = int(os.environ.get("PROMPT_CACHE_TTL", "3600"))
+# 剩餘壽命低於此秒數時續期；低於 EXPIRY_MARGIN 視為已失效
+RENEW_BEFORE = float(os.environ.get("PROMPT_CACHE_RENEW_BEFORE", "600"))
+EXPIRY_MARGIN = 30.0
+# 建立失敗後 (例如低於最小 token 數、權限不足) 多久內不再嘗試 (秒)
+RETRY_AFTER = float(os.environ.get("PROMPT_CACHE_RETRY_AFTER", "600"))
+# 同時追蹤的 Prompt 數 (前端可自訂 system_prompt)，超過時捨棄最早的 (雲端上的快取會自然過期)
+MAX_ENTRIES = 8
+DISPLAY_PREFIX = "prompt-"
+
+_lock = threading.Lock()
+_entries = {}   # key -> { "name", "expires_at" (epoch 秒) }
+_failures = {}  # key -> 失敗時間 (monotonic)
+_busy = set()   # 正在建立或續期的 key (Single-Flight，其他執行緒先走 inline)
+_metrics = {
+    "cached_requests": 0,
+    "inline_requests": 0,
+    "creates": 0,
+    "reused_existing": 0,
+    "renewals": 0,
+    "failures": 0,
+    "invalidations": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+}
+
+
+def _key(model: str, system_instruction: str, tools) -> str:
+    tools_repr = repr(tools) if tools else ""
+    return hashlib.sha256(f"{model}\0{tools_repr}\0{system_instruction}".encode("utf-8")).hexdigest()
+
+
+def _call(client, fn):
+    """指定 client (測試用) 時直接呼叫，否則透過共用 Client (憑證失效時自動重建)"""
+    return fn(client) if client is not None else gemini_client.call_with_client(fn)
+
+
+def _expires_at(cached) -> float:
+    expire_time = getattr(cached, "expire_time", None)
+    return expire_time.timestamp() if expire_time is not None else time.time() + TTL_SECONDS
+
+
+def _find_existing(client, model: str, display_name: str):
+    """其他 instance 已建立的同一份 cached content (以 display_name 辨識)"""
+    for cached in _call(client, lambda c: c.caches.list()):
+        if cached.display_name == display_name and str(cached.model or "").endswith(model):
+            if _expires_at(cached) - time.time() > EXPIRY_MARGIN:
+                return cached
+    return None
+
+
+def _create(client, model: str, system_instruction: str, tools, display_name: str):
+    return _call(client, lambda c: c.caches.create(
+        model=model,
+        config=types.CreateCachedContentConfig(
+            display_name=display_name,
+            system_instruction=system_instruction,
+            tools=tools,
+            ttl=f"{TTL_SECONDS}s",
+        ),
+    ))
+
+
+def _renew(client, name: str):
+    return _call(client, lambda c: c.caches.update(
+        name=name, config=types.UpdateCachedContentConfig(ttl=f"{TTL_SECONDS}s")
+    ))
+
+
+def get_cache_name(model: str, system_instruction: str, tools=None, client=None):
+    """
+    取得 System Prompt 對應的 cached content 名稱，不適用或失敗時回傳 None (呼叫端改用 inline)。
+    快到期時續期；同一 Prompt 同時只有一個執行緒在建立 / 續期，其他執行緒不等待。
+    """
+    if not ENABLED or not system_instruction or len(system_instruction) < MIN_CHARS:
+        return None
+
+    key = _key(model, system_instruction, tools)
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        failed_at = _failures.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < RETRY_AFTER:
+            return None
+        if entry and entry["expires_at"] - now > RENEW_BEFORE:
+            return entry["name"]
+        if key in _busy:
+            return entry["name"] if entry and entry["expires_at"] - now > EXPIRY_MARGIN else None
+        _busy.add(key)
+
+    display_name = f"{DISPLAY_PREFIX}{key[:16]}"
+    try:
+        if entry and entry["expires_at"] - now > EXPIRY_MARGIN:
+            cached = _renew(client, entry["name"])
+            counter = "renewals"
+        else:
+            cached = _find_existing(client, model, display_name)
+            counter = "reused_existing"
+            if cached is None:
+                cached = _create(client, model, system_instruction, tools, display_name)
+                counter = "creates"
+            elif _expires_at(cached) - now <= RENEW_BEFORE:
+                cached = _renew(client, cached.name)
+        entry = {"name": cached.name, "expires_at": _expires_at(cached)}
+        with _lock:
+            _metrics[counter] += 1
+            _entries.pop(key, None)
+            _entries[key] = entry
+            _failures.pop(key, None)
+            while len(_entries) > MAX_ENTRIES:
+                _entries.pop(next(iter(_entries)))
+        print(f"Prompt cache ready ({counter}): {entry['name']}")
+        return entry["name"]
+    except Exception as e:
+        print(f"Prompt cache unavailable, using inline system prompt: {e}")
+        with _lock:
+            _metrics["failures"] += 1
+            _entries.pop(key, None)
+            _failures[key] = time.monotonic()
+        return None
+    finally:
+        with _lock:
+            _busy.discard(key)
+
+
+def build_config(model: str, system_instruction: str, tools=None, use_cache: bool = True, client=None, **kwargs):
+    """
+    構建 GenerateContentConfig: 可用 cached content 時只引用其名稱 (system_instruction 與 tools 已在快取中)，
+    否則 inline 帶入。kwargs 為其他生成參數 (temperature 等)。
+    """
+    name = get_cache_name(model, system_instruction, tools, client) if use_cache else None
+    with _lock:
+        _metrics["cached_requests" if name else "inline_requests"] += 1
+    if name:
+        return types.GenerateContentConfig(cached_content=name, **kwargs)
+    return types.GenerateContentConfig(tools=tools, system_instruction=system_instruction, **kwargs)
+
+
+def is_cache_error(e: Exception) -> bool:
+    """引用的 cached content 已被刪除或過期等錯誤 (改用 inline 重試可恢復)"""
+    return isinstance(e, errors.ClientError) and e.code in (400, 404)
+
+
+def invalidate(name: str):
+    """捨棄指定的 cached content 名稱，下次請求時重新建立"""
+    with _lock:
+        for key in [k for k, entry in _entries.items() if entry["name"] == name]:
+            del _entries[key]
+        _metrics["invalidations"] += 1
+
+
+def record_usage(usage):
+    """累計 Gemini 回應的 prompt / cached token 數 (usage_metadata)"""
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    cached_tokens = getattr(usage, "cached_content_token_count", None)
+    with _lock:
+        if isinstance(prompt_tokens, int):
+            _metrics["prompt_tokens"] += prompt_tokens
+        if isinstance(cached_tokens, int):
+            _metrics["cached_tokens"] += cached_tokens
+
+
+def get_metrics() -> dict:
+    """
+    快取統計。cached_token_ratio: prompt tokens 中由快取提供的比例 (快取部分以折扣費率計費)。
+    """
+    with _lock:
+        metrics = dict(_metrics)
+        metrics["entries"] = len(_entries)
+    metrics["cached_token_ratio"] = (
+        round(metrics["cached_tokens"] / metrics["prompt_tokens"], 4) if metrics["prompt_tokens"] else None
+    )
+    return metrics
+
+
+def clear():
+    """清除本機狀態 (不刪除雲端上的快取，測試用)"""
+    with _lock:
+        _entries.clear()
+        _failures.clear()
+        _busy.clear()
+        for key in _metrics:
+            _metrics[key] = 0
@@ -0,0 +1,146 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+try:
+    from .indicators import screen_gold_silver_chunk
+    from .stock_analysis import fetch_bulk_history, GOLD_SILVER_DESCRIPTIONS, GOLD_SILVER_MIN_BARS
+    from .ticker_utils import get_universe, to_symbol
+except ImportError:
+    from indicators import screen_gold_silver_chunk
+    from stock_analysis import fetch_bulk_history, GOLD_SILVER_DESCRIPTIONS, GOLD_SILVER_MIN_BARS
+    from ticker_utils import get_universe, to_symbol
+
+# 全市場篩選設定
+SCREEN_INTERVAL = "60m"
+SCREEN_MIN_BARS = GOLD_SILVER_MIN_BARS  # 與單檔分析 (analyze_dataframe) 相同，MA240 不足的股票不列入
+SCREEN_DOWNLOAD_BATCH = int(os.environ.get("SCREEN_DOWNLOAD_BATCH", "300"))   # 每次多檔下載的檔數
+SCREEN_CHUNK_SIZE = int(os.environ.get("SCREEN_CHUNK_SIZE", "256"))           # 每個子行程處理的檔數
+SCREEN_PROCESSES = int(os.environ.get("SCREEN_PROCESSES", str(os.cpu_count() or 1)))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """
+    延遲建立共用的 process pool (spawn: 不複製 gunicorn 的執行緒狀態，子行程只載入 numpy 與 indicators)。
+    fork 後的 worker 會重新建立自己的 pool。
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(
+                max_workers=SCREEN_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stack_bars(frames: dict, symbols: list):
+    """
+    將各檔 K 棒堆疊為 2-D 陣列 (股票 x K 棒)。
+    各檔以自身最後一根 K 棒右對齊，長度不足的前段補 NaN (移動平均結果與逐檔計算相同)。
+    """
+    length = max(len(frames[s]) for s in symbols)
+    close = np.full((len(symbols), length), np.nan)
+    volume = np.full((len(symbols), length), np.nan)
+    for row, symbol in enumerate(symbols):
+        df = frames[symbol]
+        close[row, length - len(df):] = df["Close"].to_numpy(dtype=np.float64)
+        volume[row, length - len(df):] = df["Volume"].to_numpy(dtype=np.float64)
+    return close, volume
+
+
+def screen_arrays(close: np.ndarray, volume: np.ndarray) -> dict:
+    """分塊計算金包銀狀態，超過一塊且允許多行程時交由 process pool 並行"""
+    chunks = [
+        (close[i:i + SCREEN_CHUNK_SIZE], volume[i:i + SCREEN_CHUNK_SIZE])
+        for i in range(0, len(close), SCREEN_CHUNK_SIZE)
+    ]
+    parts = None
+    if len(chunks) > 1 and SCREEN_PROCESSES > 1:
+        try:
+            parts = list(_get_pool().map(screen_gold_silver_chunk, *zip(*chunks)))
+        except Exception as e:
+            # 子行程異常 (例如被 OOM 終止) 時丟棄 pool，本次改在目前行程計算
+            print(f"Screen process pool failed, computing inline: {e}")
+            _reset_pool()
+    if parts is None:
+        parts = [screen_gold_silver_chunk(c, v) for c, v in chunks]
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+def screen_gold_silver(symbols: list = None, statuses: list = None, limit: int = 50) -> dict:
+    """
+    全市場 (或指定清單) 金包銀篩選，依糾結率 (convergence_rate) 由小到大排序。
+
+    Args:
+        symbols: 股票代號或 yfinance 代號清單，未指定時為全市場上市櫃普通股
+        statuses: 只回傳指定狀態 (例如 ["SQUEEZE", "BREAKOUT"])，未指定時回傳所有符合形態者
+        limit: 回傳筆數上限
+
+    Returns:
+        { "results": [ { ticker, name, status, pattern_type, ma60_trend, convergence_rate, close, description } ],
+          "universe", "screened", "matched", "elapsed_seconds" }
+    """
+    started = time.perf_counter()
+    names = get_universe() if symbols is None else {to_symbol(s): None for s in symbols}
+    universe = list(names)
+
+    frames = {}
+    for i in range(0, len(universe), SCREEN_DOWNLOAD_BATCH):
+        frames.update(fetch_bulk_history(universe[i:i + SCREEN_DOWNLOAD_BATCH], SCREEN_INTERVAL))
+    screened = [s for s in universe if s in frames and len(frames[s]) >= SCREEN_MIN_BARS]
+    fetched_at = time.perf_counter()
+
+    results = []
+    if screened:
+        state = screen_arrays(*stack_bars(frames, screened))
+        if statuses:
+            keep = np.isin(state["status"], statuses)
+        else:
+            keep = state["status"] != "NONE"
+        # 糾結率愈小排愈前面，NaN 排最後
+        order = [i for i in np.argsort(state["convergence_rate"], kind="stable") if keep[i]]
+        for i in order[:limit]:
+            status = str(state["status"][i])
+            rate = float(state["convergence_rate"][i])
+            results.append({
+                "ticker": screened[i],
+                "name": names.get(screened[i]),
+                "status": status,
+                "pattern_type": str(state["pattern_type"][i]),
+                "ma60_trend": str(state["ma60_trend"][i]),
+                "convergence_rate": None if np.isnan(rate) else round(rate, 3),
+                "close": round(float(state["close"][i]), 2),
+                "description": GOLD_SILVER_DESCRIPTIONS[status],
+            })
+        matched = int(keep.sum())
+    else:
+        matched = 0
+
+    finished = time.perf_counter()
+    print(
+        f"Gold-silver screen: {len(screened)}/{len(universe)} tickers, {matched} matched, "
+        f"fetch {fetched_at - started:.2f}s, compute {finished - fetched_at:.2f}s"
+    )
+    return {
+        "results": results,
+        "universe": len(universe),
+        "screened": len(screened),
+        "matched": matched,
+        "elapsed_seconds": round(finished - started, 3),
+    }
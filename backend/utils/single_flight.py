@@ -0,0 +1,80 @@
+import threading
+
+
+class SingleFlightTimeout(TimeoutError):
+    """等待進行中的同 key 呼叫逾時"""
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    請求合併 (Single-Flight):
+    同一個 key 同時只會有一個呼叫真正執行 fn，其他同時到達的呼叫端等待並共用同一份結果。
+    - fn 拋出例外時，所有等待中的呼叫端都會收到同一個例外
+    - 等待超過 timeout 秒時拋出 SingleFlightTimeout (執行中的呼叫不受影響，完成後結果仍交給其他等待者)
+    - 呼叫完成即移除，之後的呼叫會重新執行 fn (結果快取由呼叫端負責)
+    """
+
+    def __init__(self, name: str, timeout: float = None):
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"executions": 0, "coalesced": 0, "errors": 0, "timeouts": 0}
+
+    def do(self, key, fn, timeout: float = None):
+        """
+        執行或加入 key 的進行中呼叫。
+        Args:
+            key: 可雜湊的鍵，例如 (symbol, interval)
+            fn: 無參數函式
+            timeout: 本次等待上限 (秒)，未指定時使用建構時的 timeout，None 表示不限
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["executions"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self.stats["errors"] += 1
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        wait = self.timeout if timeout is None else timeout
+        if not call.done.wait(wait):
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise SingleFlightTimeout(f"[{self.name}] timed out after {wait}s waiting for in-flight {key!r}")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._calls))
+
+    def reset_stats(self):
+        with self._lock:
+            for k in self.stats:
+                self.stats[k] = 0
@@ -1,111 +1,103 @@
 import yfinance as yf
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import json
+try:
+    from . import bar_cache, bar_store
+    from .timing import span
+    from .indicators import compute_indicators, compute_signal_series, gold_silver_state, GS_SLOPE_LOOKBACK
+    from .ticker_utils import get_market_suffix, record_market_suffix
+except ImportError:
+    import bar_cache, bar_store
+    from timing import span
+    from indicators import compute_indicators, compute_signal_series, gold_silver_state, GS_SLOPE_LOOKBACK
+    from ticker_utils import get_market_suffix, record_market_suffix
+
+# 金包銀判讀所需的最少 60分K 根數 (MA240 需完整，與全市場篩選共用)
+GOLD_SILVER_MIN_BARS = 240
+
+# 金包銀狀態說明
+GOLD_SILVER_DESCRIPTIONS = {
+    "NONE": "未符合特殊形態特徵。",
+    "BREAKOUT": "【金包銀】帶量破繭而出！突破長均線壓力，多頭主升段訊號。",
+    "FAIL": "【金包銀】多頭形態瓦解，有效跌破生命線 60MA。",
+    "SQUEEZE": "【金包銀】SQUEEZE (紮實)，短均糾結於 60MA 之上，蓄勢待發。",
+    "FORMING": "【金包銀】FORMING (醞釀)，短均糾結於 60MA 之上，蓄勢待發。",
+    "BEAR_BREAKDOWN": "【逆向金包銀】帶量跌破長均地板！60MA 下彎蓋頭，空頭主跌段開始。",
+    "BEAR_FAIL": "【逆向金包銀】空頭形態失效，股價強勢站回 60MA。",
+    "BEAR_SQUEEZE": "【逆向金包銀】空頭醞釀中，短均糾結於 60MA 之下，隨時可能破底。",
+}
 
 def check_gold_wrapped_silver(df: pd.DataFrame) -> dict:
     """
     金包銀策略判讀邏輯 (僅適用於 60分K).
     V3 Update: 支援「正向金包銀 (多頭)」與「逆向金包銀 (空頭)」雙向判斷。
+    判讀條件見 indicators.gold_silver_state (與全市場篩選共用同一份向量化邏輯)。
     """
     latest = df.iloc[-1]
-    prev = df.iloc[-5] 
-    
-    # 0. 趨勢定義 (Trend Definition)
-    # 計算 60MA 斜率
-    ma60_slope = (latest['MA60'] - prev['MA60']) / prev['MA60']
-    
-    if ma60_slope > 0.0005:
-        ma60_trend = "UP"
-    elif ma60_slope < -0.0005:
-        ma60_trend = "DOWN"
-    else:
-        ma60_trend = "FLAT"
+    prev = df.iloc[-1 - GS_SLOPE_LOOKBACK]
 
-    # 1. 均線數據準備
-    # 長均線 (120MA / 240MA)
-    ma120 = latest['MA120']
-    ma240 = latest['MA240']
-    ma60 = latest['MA60']
-    
-    # 短均線糾結度計算
-    short_mas = [latest['MA5'], latest['MA10'], latest['MA20']]
-    avg_short = sum(short_mas) / 3
-    std_dev = (sum([(x - avg_short)**2 for x in short_mas]) / 3)**0.5
-    cv_rate = std_dev / avg_short # 變異係數 (糾結率)
-    
-    # 2. 狀態判斷變數初始化
-    status = "NONE"
-    desc = "未符合特殊形態特徵。"
-    pattern_type = "NONE" # BULL (多) / BEAR (空)
-    
-    # ==========================================
-    # 🐂 多頭金包銀 (Bullish Gold Wrapped in Silver)
-    # 結構: 60MA (支撐) < 短均糾結 < 120/240MA (壓力)
-    # ==========================================
-    upper_limit = max(ma120, ma240)
-    
-    # 位置判定: 60MA 在下方，短均在中間 (允許 2% 誤差)
-    is_bull_pos = (ma60 * 0.98) < avg_short < (upper_limit * 1.02)
-    # 趨勢判定: 60MA 必須上揚或走平
-    is_bull_trend = ma60_trend in ["UP", "FLAT"]
-    
-    if is_bull_pos and is_bull_trend:
-        pattern_type = "BULL"
-        
-        # A. 帶量突破 (Breakout)
-        if latest['Close'] > upper_limit and latest['Volume'] > latest['VolMA5'] * 1.2:
-            status = "BREAKOUT"
-            desc = f"【金包銀】帶量破繭而出！突破長均線壓力，多頭主升段訊號。"
-            
-        # B. 形態瓦解 (Fail)
-        elif latest['Close'] < ma60 * 0.98:
-            status = "FAIL"
-            desc = "【金包銀】多頭形態瓦解，有效跌破生命線 60MA。"
-            
-        # C. 糾結整理 (Squeeze/Forming)
-        elif cv_rate < 0.015:
-            strength = "SQUEEZE (紮實)" if cv_rate < 0.006 else "FORMING (醞釀)"
-            status = strength.split()[0]
-            desc = f"【金包銀】{strength}，短均糾結於 60MA 之上，蓄勢待發。"
-
-    # ==========================================
-    # 🐻 逆向金包銀 (Bearish Reverse Gold Wrapped)
-    # 結構: 120/240MA (地板) < 短均糾結 < 60MA (蓋頭壓力)
-    # ==========================================
-    lower_limit = min(ma120, ma240)
-    
-    # 位置判定: 60MA 在上方，短均在中間 (允許 2% 誤差)
-    is_bear_pos = (lower_limit * 0.98) < avg_short < (ma60 * 1.02)
-    # 趨勢判定: 60MA 必須下彎或走平
-    is_bear_trend = ma60_trend in ["DOWN", "FLAT"]
-    
-    # 只有在非多頭形態時才檢查空頭 (避免衝突)
-    if pattern_type == "NONE" and is_bear_pos and is_bear_trend:
-        pattern_type = "BEAR"
-        
-        # A. 帶量下殺 (Breakdown) - 空頭起跌點
-        if latest['Close'] < lower_limit and latest['Volume'] > latest['VolMA5'] * 1.2:
-            status = "BEAR_BREAKDOWN"
-            desc = f"【逆向金包銀】帶量跌破長均地板！60MA 下彎蓋頭，空頭主跌段開始。"
-            
-        # B. 空頭形態失敗 (Rebound) - 站回 60MA
-        elif latest['Close'] > ma60 * 1.02:
-            status = "BEAR_FAIL"
-            desc = "【逆向金包銀】空頭形態失效，股價強勢站回 60MA。"
-            
-        # C. 弱勢整理 (Bearish Squeeze)
-        elif cv_rate < 0.015:
-            status = "BEAR_SQUEEZE"
-            desc = f"【逆向金包銀】空頭醞釀中，短均糾結於 60MA 之下，隨時可能破底。"
+    state = gold_silver_state(
+        latest['MA5'], latest['MA10'], latest['MA20'], latest['MA60'], prev['MA60'],
+        latest['MA120'], latest['MA240'], latest['Close'], latest['Volume'], latest['VolMA5'],
+    )
+    status = str(state["status"])
 
     return {
         "pattern_found": status != "NONE",
-        "pattern_type": pattern_type, # BULL / BEAR
+        "pattern_type": str(state["pattern_type"]), # BULL / BEAR
         "status": status,
-        "description": desc,
-        "ma60_trend": ma60_trend,
-        "convergence_rate": round(float(cv_rate * 100), 3)
+        "description": GOLD_SILVER_DESCRIPTIONS[status],
+        "ma60_trend": str(state["ma60_trend"]),
+        "convergence_rate": round(float(state["convergence_rate"]), 3)
+    }
+
+def _history_period(interval: str) -> str:
+    """各週期下載的歷史長度"""
+    return "1y" if "1d" in interval else "6mo"
+
+def _history_start(interval: str) -> pd.Timestamp:
+    """與 _history_period 相同長度的起始時間 (讀取本地 K 棒倉庫時使用，維持與下載相同的計算視窗)"""
+    offset = pd.DateOffset(years=1) if "1d" in interval else pd.DateOffset(months=6)
+    return pd.Timestamp.now(bar_store.TZ).normalize() - offset
+
+def _read_store(symbol: str, interval: str):
+    """本地 K 棒倉庫中的歷史 (未啟用、無此檔或不足 20 根時回傳 None)"""
+    if not bar_store.ENABLED:
+        return None
+    with span(f"store_{interval}", desc=symbol):
+        df = bar_store.read(symbol, interval, start=_history_start(interval))
+    return df if df is not None and len(df) >= 20 else None
+
+def _top_up(stored: pd.DataFrame, fetch_since) -> pd.DataFrame:
+    """本地歷史接上最後一根 K 棒之後 (即當日) 的上游 K 棒；上游失敗時只用本地資料"""
+    try:
+        tail = fetch_since(stored.index[-1])
+    except Exception as e:
+        print(f"補抓當日 K 棒失敗，使用本地 K 棒倉庫資料: {e}")
+        return stored
+    return bar_store.extend(stored, tail)
+
+def _candidate_symbols(ticker_symbol: str) -> list:
+    """
+    數字代號依序嘗試的 yfinance 代號。
+    優先使用後綴索引中已知的市場，未知時採取由上市到上櫃的嘗試策略。
+    """
+    if not ticker_symbol.isdigit():
+        return [ticker_symbol]
+    known_suffix = get_market_suffix(ticker_symbol)
+    suffixes = [".TW", ".TWO"]
+    if known_suffix in suffixes:
+        suffixes.remove(known_suffix)
+        suffixes.insert(0, known_suffix)
+    return [f"{ticker_symbol}{suffix}" for suffix in suffixes]
+
+def _insufficient_data(ticker_symbol: str, interval: str) -> dict:
+    return {
+        "error": "資料不足，無法計算技術指標 (需至少 20 根 K 棒)", 
+        "interval": interval,
+        "stock_id": ticker_symbol
     }
 
 def analyze_stock(ticker_symbol: str, interval: str = "1d") -> dict:
@@ -113,120 +105,168 @@ def analyze_stock(ticker_symbol: str, interval: str = "1d") -> dict:
     通用股票分析函式，支援不同時間週期 (Polymorphic Support).
     """
     def fetch_data(symbol, intv):
+        # 本地 K 棒倉庫已涵蓋到最近一個交易日: 直接以記憶體映射的資料分析 (不連網)
+        # 盤中 (最後一根之後已開盤): 本地歷史 + 只向上游抓當日 K 棒，結果經 K 棒快取
+        # 倉庫中沒有此檔: 透過 K 棒快取下載完整歷史，過期時只補抓最新的 K 棒
+        # 每次嘗試 (含 .TW / .TWO 探測) 各記錄一段 yf_<interval> 耗時 (讀取倉庫另記為 store_<interval>)
         s = yf.Ticker(symbol)
-        d = s.history(period="1y" if "1d" in intv else "6mo", interval=intv)
-        return s, d
+        fetch_since = lambda start: s.history(start=start, interval=intv)
+        stored = _read_store(symbol, intv)
+        if stored is not None and bar_store.is_current(stored.index[-1]):
+            return stored
+        if stored is not None:
+            fetch_full = lambda: _top_up(stored, fetch_since)
+        else:
+            fetch_full = lambda: s.history(period=_history_period(intv), interval=intv)
+        with span(f"yf_{intv}", desc=symbol):
+            return bar_cache.get_bars(symbol, intv, fetch_full=fetch_full, fetch_since=fetch_since)
 
     # 處理股票代號自動偵測 (.TW / .TWO)
     target_symbol = ticker_symbol
     df = pd.DataFrame()
     
     if ticker_symbol.isdigit():
-        # 採取由上市到上櫃的嘗試策略
-        for suffix in [".TW", ".TWO"]:
-            tmp_symbol = f"{ticker_symbol}{suffix}"
+        known_suffix = get_market_suffix(ticker_symbol)
+        candidates = _candidate_symbols(ticker_symbol)
+        # 本地倉庫中已有的市場優先 (避免先向上游探測另一個後綴)
+        candidates.sort(key=lambda c: not (bar_store.ENABLED and bar_store.has(c, interval)))
+        for tmp_symbol in candidates:
             print(f"嘗試獲取 {tmp_symbol} 數據 (Interval: {interval})...")
-            _, tmp_df = fetch_data(tmp_symbol, interval)
+            tmp_df = fetch_data(tmp_symbol, interval)
             if not tmp_df.empty and len(tmp_df) >= 20:
                 df = tmp_df
                 target_symbol = tmp_symbol
+                suffix = tmp_symbol[len(ticker_symbol):]
+                if suffix != known_suffix:
+                    record_market_suffix(ticker_symbol, suffix)
                 break
             print(f"  - {tmp_symbol} 資料不適用")
     else:
         print(f"嘗試獲取 {target_symbol} 數據 (Interval: {interval})...")
-        _, df = fetch_data(target_symbol, interval)
+        df = fetch_data(target_symbol, interval)
 
     if df.empty or len(df) < 20: 
-        return {
-            "error": "資料不足，無法計算技術指標 (需至少 20 根 K 棒)", 
-            "interval": interval,
-            "stock_id": ticker_symbol
-        }
+        return _insufficient_data(ticker_symbol, interval)
 
-    # 計算所有需要的均線
-    df['MA5'] = df['Close'].rolling(window=5).mean()
-    df['MA10'] = df['Close'].rolling(window=10).mean()
-    df['MA20'] = df['Close'].rolling(window=20).mean()
-    df['MA60'] = df['Close'].rolling(window=60).mean()
-    df['MA120'] = df['Close'].rolling(window=120).mean()
-    df['MA240'] = df['Close'].rolling(window=240).mean()
-    df['VolMA5'] = df['Volume'].rolling(window=5).mean()
+    with span(f"analyze_{interval}"):
+        return analyze_dataframe(df, target_symbol, interval)
 
-    latest = df.iloc[-1]
-    prev = df.iloc[-2]
-    
-    # --- 演算法優化: 支撐與壓力邏輯 (Refactored) ---
-    recent_60 = df.tail(60)
-    high_60 = recent_60['High'].max()
-    low_60 = recent_60['Low'].min()
-    
-    curr_price = float(latest['Close'])
-    ma20_val = float(latest['MA20'])
-    ma20_prev = float(prev['MA20'])
-    
-    # 1. 尋找「關鍵大量 K 線」 (Banker's Candle)
-    # 定義: 近 20 日內，成交量最大且收紅 (Close > Open) 的 K 線
-    recent_20 = df.tail(20).copy()
-    recent_20['IsRed'] = recent_20['Close'] > recent_20['Open']
-    red_candles = recent_20[recent_20['IsRed']]
-    
-    smart_money_support = None
-    if not red_candles.empty:
-        # 找成交量最大的一根
-        banker_candle = red_candles.loc[red_candles['Volume'].idxmax()]
-        smart_money_support = float(banker_candle['Low'])
-    
-    # 2. 支撐邏輯 (Support)
-    # 預設找區間低點
-    support_price = low_60
-    support_type = "60d_low"
-    
-    # 強勢股判斷: 股價 > 月線 且 月線翻揚
-    if curr_price > ma20_val and ma20_val > ma20_prev:
-        # 多頭強勢回檔策略 (Hybrid Decision)
-        if smart_money_support:
-            # 取 月線 與 關鍵大量低點 的最大值 (擇強而守)
-            if smart_money_support > ma20_val:
-                support_price = smart_money_support
-                support_type = "smart_money_low"
+def download_bars(symbols: list, interval: str, batch_size: int = None, skip_failed_batches: bool = False, **kwargs):
+    """
+    以 yf.download 多檔下載 K 棒並逐檔產出 (symbol, DataFrame)，下載不到的代號略過。
+
+    Args:
+        batch_size: 每次下載的檔數上限 (None 為一次全部)
+        skip_failed_batches: 批次下載失敗時記錄並繼續下一批 (預設直接拋出)
+        kwargs: 傳給 yf.download 的 period 或 start
+    """
+    batch_size = batch_size or max(len(symbols), 1)
+    for i in range(0, len(symbols), batch_size):
+        batch = symbols[i:i + batch_size]
+        try:
+            raw = yf.download(
+                batch, interval=interval, group_by="ticker", auto_adjust=True,
+                threads=True, progress=False, **kwargs
+            )
+        except Exception as e:
+            if not skip_failed_batches:
+                raise
+            print(f"下載 {batch[0]} 等 {len(batch)} 檔失敗 (interval={interval}): {e}")
+            continue
+        for symbol in batch:
+            if isinstance(raw.columns, pd.MultiIndex):
+                if symbol not in raw.columns.get_level_values(0):
+                    continue
+                df = raw[symbol]
+            elif len(batch) == 1:
+                df = raw
             else:
-                support_price = ma20_val
-                support_type = "ma20"
+                continue
+            df = df.dropna(how="all")
+            if not df.empty:
+                yield symbol, df
+
+def fetch_bulk_history(symbols: list, interval: str) -> dict:
+    """
+    以單次多檔下載取得多檔股票的 K 棒 (本地 K 棒倉庫已是最新、或已在 K 棒快取中且未過期者不重複下載)。
+    回傳: { symbol: DataFrame }，下載不到的代號不會出現在結果中
+    """
+    frames = {}
+    missing = []
+    for symbol in symbols:
+        stored = _read_store(symbol, interval)
+        if stored is not None and bar_store.is_current(stored.index[-1]):
+            frames[symbol] = stored
+            continue
+        cached = bar_cache.get_fresh(symbol, interval)
+        if cached is not None:
+            frames[symbol] = cached
         else:
-            support_price = ma20_val
-            support_type = "ma20"
-        
-    # 3. 壓力邏輯 (Resistance)
-    # 預設找區間高點
-    resist_price = high_60
-    resist_type = "60d_high"
-    
-    # 創新高判斷: 若收盤價已接近或突破 60日高點
-    if curr_price >= high_60 * 0.99:
-        resist_price = curr_price * 1.1 # 預設漲停板價作為目標
-        resist_type = "blue_sky"
+            missing.append(symbol)
 
-    # 4. 防呆檢查 (Sanity Check)
-    # 防止支撐壓力過近或倒掛
-    if resist_price <= support_price * 1.01:
-        # 強制拉開空間
-        resist_price = max(resist_price, support_price * 1.05)
-        if support_price > curr_price * 0.95:
-             support_price = support_price * 0.95
+    if missing:
+        print(f"批次下載 {len(missing)} 檔數據 (Interval: {interval})...")
+        for symbol, df in download_bars(missing, interval, period=_history_period(interval)):
+            bar_cache.put(symbol, interval, df)
+            frames[symbol] = df.copy()
+    return frames
+
+def analyze_stocks(ticker_symbols: list, interval: str = "1d") -> dict:
+    """
+    批次版 analyze_stock: 每一輪只發出一次多檔下載。
+    數字代號若在第一個候選市場查無資料，下一輪再以另一個後綴批次重試 (最多兩輪)。
+    回傳: { ticker_symbol: analyze_stock 相同格式的結果 }
+    """
+    results = {}
+    pending = {t: _candidate_symbols(t) for t in dict.fromkeys(ticker_symbols)}
 
-    # 5. 量能濾網 (Volume Filter for Breakdown)
-    breakdown_signal = "NONE"
-    if curr_price < support_price:
-        vol_ma5 = float(latest['VolMA5'])
-        curr_vol = float(latest['Volume'])
-        if vol_ma5 > 0:
-            vol_ratio = curr_vol / vol_ma5
-            if vol_ratio > 1.5:
-                breakdown_signal = "TRUE_BREAKDOWN" # 帶量真跌破
-            elif vol_ratio < 1.0:
-                breakdown_signal = "WASH_SALE" # 量縮假跌破
+    while pending:
+        attempt = {t: symbols[0] for t, symbols in pending.items()}
+        frames = fetch_bulk_history(sorted(set(attempt.values())), interval)
+        next_pending = {}
+        for ticker_symbol, symbol in attempt.items():
+            df = frames.get(symbol)
+            if df is not None and len(df) >= 20:
+                if ticker_symbol.isdigit():
+                    record_market_suffix(ticker_symbol, symbol[len(ticker_symbol):])
+                results[ticker_symbol] = analyze_dataframe(df, symbol, interval)
+            elif len(pending[ticker_symbol]) > 1:
+                next_pending[ticker_symbol] = pending[ticker_symbol][1:]
             else:
-                breakdown_signal = "BREAKDOWN" # 一般跌破
+                results[ticker_symbol] = _insufficient_data(ticker_symbol, interval)
+        pending = next_pending
+
+    return results
+
+def analyze_dataframe(df: pd.DataFrame, target_symbol: str, interval: str) -> dict:
+    """
+    由已取得的 K 棒計算技術指標、支撐壓力與策略訊號 (需至少 20 根 K 棒)。
+    """
+    # 單次向量化計算所有指標 (均線、量均、KD、區間高低點、關鍵大量 K 線)
+    ind = compute_indicators(*(df[c].to_numpy(dtype=np.float64) for c in ["Open", "High", "Low", "Close", "Volume"]))
+    df['MA5'] = ind['ma5']
+    df['MA10'] = ind['ma10']
+    df['MA20'] = ind['ma20']
+    df['MA60'] = ind['ma60']
+    df['MA120'] = ind['ma120']
+    df['MA240'] = ind['ma240']
+    df['VolMA5'] = ind['vol_ma5']
+
+    latest = df.iloc[-1]
+    curr_price = float(latest['Close'])
+    ma20_val = float(latest['MA20'])
+
+    # --- 支撐與壓力、跌破量能濾網、KD 訊號 ---
+    # 與回測共用同一份逐根向量化邏輯 (indicators.compute_signal_series)，此處取最新一根
+    # 1. 關鍵大量 K 線 (Banker's Candle): 近 20 根內成交量最大且收紅的 K 線低點
+    # 2. 支撐: 預設 60 根低點；股價 > 月線且月線翻揚時取 月線 與 關鍵大量低點 的較強者
+    # 3. 壓力: 預設 60 根高點；接近或突破時以漲停價 (blue_sky) 為目標
+    # 4. 防呆: 支撐壓力過近或倒掛時強制拉開空間
+    # 5. 量能濾網: 跌破支撐時，量比 > 1.5 為帶量真跌破，< 1.0 為量縮假跌破
+    signals = compute_signal_series(
+        *(df[c].to_numpy(dtype=np.float64) for c in ["Open", "High", "Low", "Close", "Volume"]), ind=ind
+    )
+    smart_money_support = float(signals['smart_money_support'][-1])
 
     output_data = {
         "stock_id": target_symbol,
@@ -239,74 +279,29 @@ def analyze_stock(ticker_symbol: str, interval: str = "1d") -> dict:
         "ma60": round(float(latest['MA60']), 2),
         "ma120": round(float(latest['MA120']), 2) if not pd.isna(latest['MA120']) else None,
         "ma240": round(float(latest['MA240']), 2) if not pd.isna(latest['MA240']) else None,
-        "support_price": round(float(support_price), 2),
-        "resist_price": round(float(resist_price), 2),
-        "support_type": support_type,
-        "resist_type": resist_type,
-        "smart_money_support": round(smart_money_support, 2) if smart_money_support else None,
-        "breakdown_signal": breakdown_signal,
+        "support_price": round(float(signals['support_price'][-1]), 2),
+        "resist_price": round(float(signals['resist_price'][-1]), 2),
+        "support_type": str(signals['support_type'][-1]),
+        "resist_type": str(signals['resist_type'][-1]),
+        "smart_money_support": None if np.isnan(smart_money_support) else round(smart_money_support, 2),
+        "breakdown_signal": str(signals['breakdown_signal'][-1]),
         "short_term_support": round(float(latest['MA5']), 2) if not pd.isna(latest['MA5']) else None,
         "trend_support": round(ma20_val, 2), # 趨勢支撐預設看月線
         "volume": int(latest['Volume']),
         "vol_ma5": int(latest['VolMA5'])
     }
     
-    # 計算 KD 值 (Period=9)
-    # RSV = (Close - Lowest_Low_9) / (Highest_High_9 - Lowest_Low_9) * 100
-    low_min = df['Low'].rolling(window=9).min()
-    high_max = df['High'].rolling(window=9).max()
-    
-    # 防止除以零
-    rsv = (df['Close'] - low_min) / (high_max - low_min) * 100
-    rsv = rsv.fillna(50) # 缺值補 50
-    
-    # 計算 K, D (平滑參數=3)
+    # KD 值 (Period=9，平滑參數=3) 已由指標核心計算
     # K = 2/3 * Prev_K + 1/3 * RSV
     # D = 2/3 * Prev_D + 1/3 * K
-    k_values = [50] # 初始值
-    d_values = [50]
-    
-    for r in rsv:
-        k = (2/3) * k_values[-1] + (1/3) * r
-        d = (2/3) * d_values[-1] + (1/3) * k
-        k_values.append(k)
-        d_values.append(d)
-        
-    # 移除初始的 50
-    k_values = k_values[1:]
-    d_values = d_values[1:]
-    
-    output_data["k"] = round(k_values[-1], 2)
-    output_data["d"] = round(d_values[-1], 2)
-    
-    # KD 訊號判讀
-    kd_signal = "NEUTRAL"
-    k_curr = k_values[-1]
-    d_curr = d_values[-1]
-    k_prev = k_values[-2]
-    d_prev = d_values[-2]
+    output_data["k"] = round(float(ind['k'][-1]), 2)
+    output_data["d"] = round(float(ind['d'][-1]), 2)
     
-    # 1. 高檔鈍化 (High Passivation): K, D 都維持在 80 以上
-    # 表示多頭強勢，但也需警戒乖離過大
-    if k_curr >= 80 and d_curr >= 80:
-        kd_signal = "HIGH_PASSIVATION"
-        
-    # 2. 低檔鈍化 (Low Passivation): K, D 都維持在 20 以下
-    elif k_curr <= 20 and d_curr <= 20:
-        kd_signal = "LOW_PASSIVATION"
-        
-    # 3. 黃金交叉 (Golden Cross): K 向上突破 D
-    elif k_prev < d_prev and k_curr > d_curr:
-        kd_signal = "GOLDEN_CROSS"
-        
-    # 4. 死亡交叉 (Dead Cross): K 向下突破 D
-    elif k_prev > d_prev and k_curr < d_curr:
-        kd_signal = "DEAD_CROSS"
-        
-    output_data["kd_signal"] = kd_signal
+    # KD 訊號判讀: 高檔鈍化 (K, D >= 80) > 低檔鈍化 (K, D <= 20) > 黃金交叉 > 死亡交叉
+    output_data["kd_signal"] = str(signals['kd_signal'][-1])
     output_data["strategy_gold_silver"] = None
     # 如果是 60分K，執行金包銀策略判斷
-    if interval == "60m" and len(df) >= 240:
+    if interval == "60m" and len(df) >= GOLD_SILVER_MIN_BARS:
         output_data["strategy_gold_silver"] = check_gold_wrapped_silver(df)
 
     print(f"已完成 {target_symbol} [{interval}] 分析")
@@ -343,7 +338,7 @@ if __name__ == "__main__":
             print(f"  - 上方壓力 ({strat['upper_ma_type']}): {strat['upper_ma_val']}")
             print(f"  - 下方支撐 (MA60): {strat['lower_ma_val']}")
         else:
-            print(f"【股票: {s}】 資料不足，無法判定策略位階 (需 240 根 K 棒)。")
+            print(f"【股票: {s}】 資料不足，無法判定策略位階 (需 {GOLD_SILVER_MIN_BARS} 根 K 棒)。")
         print("-" * 30)
     
     print("測試結束")
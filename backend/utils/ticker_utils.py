@@ -1,46 +1,271 @@
 from FinMind.data import DataLoader
 import pandas as pd
+import numpy as np
+import os
+import re
+import json
+import time
+import threading
+import unicodedata
+try:
+    from .single_flight import SingleFlight
+    from .atomic_file import atomic_write, atomic_write_bytes
+except ImportError:
+    from single_flight import SingleFlight
+    from atomic_file import atomic_write, atomic_write_bytes
 
 # 全域變數，用於快取股票清單
 CACHED_STOCK_INFO = None
 
+# 股票清單本地快照 (建置時產生並隨部署打包，開機時直接載入，避免冷啟動下載)
+SNAPSHOT_FILE = os.path.join(os.path.dirname(__file__), "stock_info_snapshot.csv")
+SNAPSHOT_MAX_AGE = int(os.environ.get("STOCK_INFO_SNAPSHOT_MAX_AGE", str(24 * 60 * 60)))
+
+# 並行請求同時需要下載清單時只下載一次 (其他請求最多等待 STOCK_INFO_WAIT_TIMEOUT 秒)
+_stock_info_flight = SingleFlight(
+    "stock_info", timeout=float(os.environ.get("STOCK_INFO_WAIT_TIMEOUT", "60"))
+)
+
+# 市場後綴索引 (stock_id -> ".TW" / ".TWO")，持久化於磁碟避免重複探測上市/上櫃
+SUFFIX_INDEX_FILE = os.path.join(os.path.dirname(__file__), "market_suffix_index.json")
+_SUFFIX_INDEX = None
+_suffix_lock = threading.Lock()
+
+def _load_suffix_index() -> dict:
+    """延遲載入磁碟上的後綴索引 (呼叫端需持有 _suffix_lock)"""
+    global _SUFFIX_INDEX
+    if _SUFFIX_INDEX is None:
+        _SUFFIX_INDEX = {}
+        if os.path.exists(SUFFIX_INDEX_FILE):
+            try:
+                with open(SUFFIX_INDEX_FILE, 'r', encoding='utf-8') as f:
+                    _SUFFIX_INDEX = json.load(f)
+            except Exception as e:
+                print(f"Error loading market suffix index: {e}")
+    return _SUFFIX_INDEX
+
+def _save_suffix_index():
+    """原子寫入，避免其他 worker 讀到寫一半的檔案 (呼叫端需持有 _suffix_lock)"""
+    try:
+        data = json.dumps(_SUFFIX_INDEX, separators=(',', ':'), sort_keys=True)
+        atomic_write_bytes(SUFFIX_INDEX_FILE, data.encode('utf-8'))
+    except Exception as e:
+        print(f"Error saving market suffix index: {e}")
+
+def build_suffix_index(stock_info: pd.DataFrame) -> dict:
+    """
+    由 FinMind taiwan_stock_info 的 type 欄位建立後綴索引並寫入磁碟。
+    上市 (twse) 為 .TW，其餘 (tpex 等) 為 .TWO。
+    """
+    suffixes = np.where(stock_info['type'] == "twse", ".TW", ".TWO")
+    with _suffix_lock:
+        index = _load_suffix_index()
+        index.update(zip(stock_info['stock_id'].astype(str), suffixes.tolist()))
+        _save_suffix_index()
+        return dict(index)
+
+def get_market_suffix(stock_id: str):
+    """查詢股票代號的市場後綴，未知則回傳 None"""
+    with _suffix_lock:
+        return _load_suffix_index().get(str(stock_id))
+
+def record_market_suffix(stock_id: str, suffix: str):
+    """記錄探測成功的市場後綴 (僅在變更時寫檔)"""
+    with _suffix_lock:
+        index = _load_suffix_index()
+        if index.get(str(stock_id)) != suffix:
+            index[str(stock_id)] = suffix
+            _save_suffix_index()
+
+def to_symbol(ticker: str) -> str:
+    """數字代號依後綴索引補上市場後綴 (未知時視為上市)，其他代號原樣回傳"""
+    ticker = str(ticker).strip()
+    return f"{ticker}{get_market_suffix(ticker) or '.TW'}" if ticker.isdigit() else ticker
+
+NOT_FOUND = "【資料不足，無法確認】"
+
+def normalize_name(name: str) -> str:
+    """
+    名稱正規化: 全形轉半形 (NFKC)、移除空白、英文轉大寫、去除 "-KY" 後綴。
+    例如 "貿聯－ＫＹ" / "貿聯-ky" / " 貿聯 " 皆為 "貿聯"。
+    """
+    normalized = unicodedata.normalize("NFKC", str(name))
+    normalized = re.sub(r"\s+", "", normalized).upper()
+    return re.sub(r"-?KY$", "", normalized)
+
+class StockNameIndex:
+    """
+    由 FinMind 股票清單一次建立的名稱索引:
+    精確名稱 hash map、正規化名稱 map，以及前綴搜尋用的 trie。
+    同名多筆時以第一筆為準 (與原本 iloc[0] 行為一致)。
+    """
+
+    def __init__(self, stock_info: pd.DataFrame):
+        self.exact = {}
+        self.normalized = {}
+        self.trie = {}
+        suffixes = np.where(stock_info['type'] == "twse", ".TW", ".TWO")
+        for stock_name, stock_id, suffix in zip(stock_info['stock_name'], stock_info['stock_id'], suffixes):
+            ticker = f"{stock_id}{suffix}"
+            if stock_name in self.exact:
+                continue
+            self.exact[stock_name] = ticker
+            key = normalize_name(stock_name)
+            if key not in self.normalized:
+                self.normalized[key] = ticker
+                self._insert(key, stock_name, ticker)
+
+    def _insert(self, key: str, stock_name: str, ticker: str):
+        node = self.trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node.setdefault(None, []).append((stock_name, ticker))
+
+    def lookup(self, name: str):
+        """精確比對優先，其次正規化比對；找不到回傳 None"""
+        ticker = self.exact.get(name)
+        if ticker is None:
+            ticker = self.normalized.get(normalize_name(name))
+        return ticker
+
+    def search_prefix(self, prefix: str, limit: int = 10) -> list:
+        """回傳名稱以 prefix 開頭的股票 (依名稱排序，最多 limit 筆)"""
+        node = self.trie
+        for ch in normalize_name(prefix):
+            node = node.get(ch)
+            if node is None:
+                return []
+        matches = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            matches.extend(current.get(None, []))
+            stack.extend(child for ch, child in current.items() if ch is not None)
+        matches.sort(key=lambda m: (len(m[0]), m[0]))
+        return [{"name": n, "ticker": t} for n, t in matches[:limit]]
+
+def download_stock_info() -> pd.DataFrame:
+    """從 FinMind 下載全台股清單並寫入本地快照 (原子寫入)"""
+    print("正在從 FinMind 下載全台股清單...")
+    dl = DataLoader()
+    stock_info = dl.taiwan_stock_info()
+    print(f"清單下載完成，共 {len(stock_info)} 筆資料。")
+    with atomic_write(SNAPSHOT_FILE) as f:
+        stock_info.to_csv(f, index=False, encoding='utf-8')
+    build_suffix_index(stock_info)
+    return stock_info
+
+def load_stock_info_snapshot() -> bool:
+    """
+    載入本地快照至 CACHED_STOCK_INFO (已有清單時不覆蓋)。
+    回傳: 是否成功載入
+    """
+    global CACHED_STOCK_INFO
+    if not os.path.exists(SNAPSHOT_FILE):
+        return False
+    try:
+        stock_info = pd.read_csv(SNAPSHOT_FILE, dtype=str, keep_default_na=False)
+    except Exception as e:
+        print(f"Error loading stock info snapshot: {e}")
+        return False
+    if CACHED_STOCK_INFO is None:
+        CACHED_STOCK_INFO = stock_info
+    print(f"已載入股票清單快照，共 {len(stock_info)} 筆資料。")
+    return True
+
+def is_snapshot_stale() -> bool:
+    """快照不存在或超過 SNAPSHOT_MAX_AGE 秒未更新"""
+    if not os.path.exists(SNAPSHOT_FILE):
+        return True
+    return time.time() - os.path.getmtime(SNAPSHOT_FILE) > SNAPSHOT_MAX_AGE
+
+def download_stock_info_coalesced() -> pd.DataFrame:
+    """download_stock_info 的 Single-Flight 版本: 進行中的下載由所有呼叫端共用 (失敗時皆收到例外)"""
+    return _stock_info_flight.do("download", lambda: download_stock_info())
+
+def get_download_stats() -> dict:
+    """股票清單下載的合併統計 (executions / coalesced / errors / timeouts / in_flight)"""
+    return _stock_info_flight.get_stats()
+
+def refresh_stock_info():
+    """重新下載股票清單並替換快取 (背景執行用，查詢中的請求仍使用舊清單)"""
+    global CACHED_STOCK_INFO
+    CACHED_STOCK_INFO = download_stock_info_coalesced()
+
+def get_universe() -> dict:
+    """
+    全市場上市/上櫃普通股 (4 位數代號)。
+    回傳: { yfinance 代號: 股票名稱 }，例如 { "2330.TW": "台積電" }
+    """
+    global CACHED_STOCK_INFO
+    if CACHED_STOCK_INFO is None and not load_stock_info_snapshot():
+        CACHED_STOCK_INFO = download_stock_info_coalesced()
+    stock_info = CACHED_STOCK_INFO
+    stock_ids = stock_info['stock_id'].astype(str)
+    listed = stock_info[stock_info['type'].isin(["twse", "tpex"]) & stock_ids.str.fullmatch(r"\d{4}")]
+    listed = listed.drop_duplicates('stock_id')
+    suffixes = np.where(listed['type'] == "twse", ".TW", ".TWO")
+    return dict(zip(listed['stock_id'].astype(str) + suffixes, listed['stock_name']))
+
+# 名稱索引 (CACHED_STOCK_INFO 更新時重建)
+_NAME_INDEX = None
+_NAME_INDEX_SOURCE = None
+
+def _get_name_index() -> StockNameIndex:
+    """取得名稱索引，必要時下載股票清單 (失敗時拋出例外)"""
+    global CACHED_STOCK_INFO, _NAME_INDEX, _NAME_INDEX_SOURCE
+    # 如果快取為空，先嘗試本地快照，沒有快照才進行下載
+    if CACHED_STOCK_INFO is None and not load_stock_info_snapshot():
+        CACHED_STOCK_INFO = download_stock_info_coalesced()
+
+    stock_info = CACHED_STOCK_INFO
+    if _NAME_INDEX is None or _NAME_INDEX_SOURCE is not stock_info:
+        _NAME_INDEX = StockNameIndex(stock_info)
+        _NAME_INDEX_SOURCE = stock_info
+    return _NAME_INDEX
+
 def get_ticker_by_name(name: str) -> str:
     """
     透過中文名稱取得台股股票代號。
     
     Args:
-        name: 股票中文名稱 (例如 "台積電")
+        name: 股票中文名稱 (例如 "台積電")，亦接受全形/空白/"-KY" 等寫法差異
     
     Returns:
         股票代碼 (格式: "2330.TW" 或 "8299.TWO")，若找不到則回傳錯誤訊息。
     """
     global CACHED_STOCK_INFO
     try:
-        # 如果快取為空，才進行下載
-        if CACHED_STOCK_INFO is None:
-            print("正在從 FinMind 下載全台股清單 (Cache Initializing)...")
-            dl = DataLoader()
-            CACHED_STOCK_INFO = dl.taiwan_stock_info()
-            print(f"清單下載完成，共 {len(CACHED_STOCK_INFO)} 筆資料。")
-        
-        df = CACHED_STOCK_INFO
-        
-        # 過濾名稱 (精確比對)
-        match = df[df['stock_name'] == name]
-        
-        if not match.empty:
-            ticker = match.iloc[0]['stock_id']
-            # yfinance 格式轉換：上市加 .TW，上櫃加 .TWO
-            market = match.iloc[0]['type']
-            suffix = ".TW" if market == "twse" else ".TWO"
-            return f"{ticker}{suffix}"
-            
-        return "【資料不足，無法確認】"
+        ticker = _get_name_index().lookup(name)
+        return ticker if ticker else NOT_FOUND
     except Exception as e:
         # 如果出錯，清除快取以便下次重試
         CACHED_STOCK_INFO = None
         return f"【查詢發生錯誤: {str(e)}】"
 
+def get_tickers_by_names(names: list) -> dict:
+    """
+    批次查詢: 回傳 { name: ticker }，每個精確命中皆為 O(1) 查表。
+    查無資料或發生錯誤時，值與 get_ticker_by_name 相同為錯誤訊息。
+    """
+    global CACHED_STOCK_INFO
+    try:
+        index = _get_name_index()
+        return {name: index.lookup(name) or NOT_FOUND for name in names}
+    except Exception as e:
+        CACHED_STOCK_INFO = None
+        return {name: f"【查詢發生錯誤: {str(e)}】" for name in names}
+
+def search_tickers_by_prefix(prefix: str, limit: int = 10) -> list:
+    """部分名稱查詢: 回傳 [ { "name", "ticker" } ]"""
+    global CACHED_STOCK_INFO
+    try:
+        return _get_name_index().search_prefix(prefix, limit)
+    except Exception as e:
+        CACHED_STOCK_INFO = None
+        print(f"Prefix search failed: {e}")
+        return []
+
 if __name__ == "__main__":
     # 單元測試
     test_names = ["台積電", "欣銓", "無此股票"]
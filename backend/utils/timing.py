@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# 輕量的分段計時 (Span):
+# - 每個請求一個 Trace，各階段的耗時寫入 Server-Timing 標頭與結構化 JSON 日誌 (Cloud Logging 的 jsonPayload)
+# - 所有 Span 的耗時同時累計到各名稱的延遲直方圖 (GET /metrics)
+# Trace 以 contextvars 傳遞；送到執行緒池的工作需以 bind() 包裝才會寫入同一個 Trace。
+
+# 直方圖的區間上界 (毫秒)，最後一格為 +Inf
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 30000, 60000)
+# 設為 0 時不輸出每個請求的計時日誌 (標頭與直方圖不受影響)
+LOG_TIMINGS = os.environ.get("LOG_TIMINGS", "1") != "0"
+
+_current = contextvars.ContextVar("timing_trace", default=None)
+_hist_lock = threading.Lock()
+_histograms = {}  # name -> { "count", "sum_ms", "max_ms", "buckets": [每格次數] }
+
+
+class Trace:
+    """單一請求的各階段耗時 (可由多個執行緒同時寫入)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []  # (name, ms, desc)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float, desc: str = None):
+        with self._lock:
+            self.spans.append((name, ms, desc))
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def totals(self) -> dict:
+        """同名 Span 的耗時加總 (毫秒)"""
+        totals = {}
+        with self._lock:
+            for name, ms, _ in self.spans:
+                totals[name] = round(totals.get(name, 0.0) + ms, 1)
+        return totals
+
+    def server_timing(self, total_ms: float = None) -> str:
+        """Server-Timing 標頭值，例如: yf_1d;dur=812.4;desc="2330.TW", gemini;dur=5120.0, total;dur=6001.2"""
+        with self._lock:
+            spans = list(self.spans)
+        entries = []
+        for name, ms, desc in spans:
+            entry = f"{name};dur={ms:.1f}"
+            if desc:
+                entry += ';desc="{}"'.format(str(desc).replace("\\", "").replace('"', ""))
+            entries.append(entry)
+        entries.append(f"total;dur={self.elapsed_ms() if total_ms is None else total_ms:.1f}")
+        return ", ".join(entries)
+
+
+def start_trace() -> Trace:
+    """為目前的 context (請求) 建立新的 Trace"""
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def use_trace(trace: Trace):
+    """在指定的 Trace 下執行 (串流產生器、背景工作等不在原請求 context 中的程式)"""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def bind(fn):
+    """
+    包裝要送到執行緒池的函式，使其 Span 寫入目前請求的 Trace。
+    每次 bind 複製一份 context，回傳的函式只能被呼叫一次 (不可同時在多個執行緒執行)。
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def observe(name: str, ms: float):
+    """將一筆耗時 (毫秒) 累計到直方圖"""
+    with _hist_lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = {
+                "count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(BUCKETS_MS) + 1)
+            }
+        hist["count"] += 1
+        hist["sum_ms"] += ms
+        hist["max_ms"] = max(hist["max_ms"], ms)
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        hist["buckets"][i] += 1
+
+
+@contextmanager
+def span(name: str, desc: str = None):
+    """
+    量測區塊耗時，寫入目前的 Trace (若有) 並累計到直方圖。
+    亦可作為裝飾器: span("cb_mapping")(load_cb_mapping)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        trace = _current.get()
+        if trace is not None:
+            trace.add(name, ms, desc)
+        observe(name, ms)
+
+
+def _quantile(buckets: list, count: int, q: float):
+    """由直方圖估計分位數 (回傳該分位數所在區間的上界)"""
+    target = q * count
+    seen = 0
+    for upper, n in zip(BUCKETS_MS + (None,), buckets):
+        seen += n
+        if seen >= target:
+            return upper
+    return None
+
+
+def get_histograms() -> dict:
+    """
+    各 Span 名稱的延遲直方圖。
+    Returns:
+        { name: { count, sum_ms, avg_ms, max_ms, p50_ms, p95_ms, p99_ms, buckets: { "<=上界": 累計次數, "+Inf": count } } }
+        分位數為所在區間的上界 (落在 +Inf 區間時為 None)
+    """
+    with _hist_lock:
+        snapshot = {name: dict(hist, buckets=list(hist["buckets"])) for name, hist in _histograms.items()}
+    result = {}
+    for name, hist in sorted(snapshot.items()):
+        count = hist["count"]
+        cumulative, buckets = 0, {}
+        for upper, n in zip(BUCKETS_MS, hist["buckets"]):
+            cumulative += n
+            buckets[f"<={upper}"] = cumulative
+        buckets["+Inf"] = count
+        result[name] = {
+            "count": count,
+            "sum_ms": round(hist["sum_ms"], 1),
+            "avg_ms": round(hist["sum_ms"] / count, 1) if count else None,
+            "max_ms": round(hist["max_ms"], 1),
+            "p50_ms": _quantile(hist["buckets"], count, 0.50),
+            "p95_ms": _quantile(hist["buckets"], count, 0.95),
+            "p99_ms": _quantile(hist["buckets"], count, 0.99),
+            "buckets": buckets,
+        }
+    return result
+
+
+def log_trace(trace: Trace, message: str, total_ms: float = None, **fields):
+    """
+    以單行 JSON 輸出計時日誌 (Cloud Run 會將 stdout 的 JSON 解析為 jsonPayload，可依欄位查詢)。
+    """
+    if not LOG_TIMINGS:
+        return
+    total_ms = trace.elapsed_ms() if total_ms is None else total_ms
+    entry = {
+        "severity": "INFO",
+        "message": f"{message} ({total_ms:.0f} ms)",
+        "total_ms": round(total_ms, 1),
+        "spans_ms": trace.totals(),
+    }
+    entry.update(fields)
+    print(json.dumps(entry, ensure_ascii=False), file=sys.stdout, flush=True)
+
+
+def traced(fn, name: str, **fields):
+    """包裝背景工作: 在新的 Trace 下執行，總耗時計入 name 的直方圖，結束時輸出計時日誌"""
+    def run(*args, **kwargs):
+        trace = Trace()
+        with use_trace(trace):
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                total_ms = trace.elapsed_ms()
+                observe(name, total_ms)
+                log_trace(trace, name, total_ms, **fields)
+    return run
+
+
+def reset():
+    """清除所有直方圖 (測試用)"""
+    with _hist_lock:
+        _histograms.clear()